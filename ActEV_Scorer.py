@@ -38,9 +38,10 @@ import errno
 import argparse
 import json
 import math
-import jsonschema
+import dill
 from operator import add
-from functools import reduce
+from functools import reduce, partial
+from concurrent.futures import ThreadPoolExecutor
 from tempfile import NamedTemporaryFile
 
 lib_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "lib")
@@ -49,14 +50,15 @@ protocols_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "lib/p
 sys.path.append(protocols_path)
 
 from activity_instance import *
-from plot import *
 from helpers import *
 from datacontainer import DataContainer
-from render import Render
 from logger import build_logger
-from ActivitiesFilePruner import prune
-from sparse_signal import SparseSignal
-from metrics import compute_map
+from json_stream import iter_json_array
+from input_cache import file_content_hash, cache_key, load_cached, store_cached
+from scored_regions import ScoredRegionIndex
+from schema_validation import compile_schema, validation_error, validate_activity_range, validate_activity_chunk
+from metrics import compute_map, compute_ap_by_activity, summarize_ap, set_signal_engine, get_signal_engine, selected_frame_durations, build_reference_signals, set_reference_precomputed
+from alignment import set_assignment_backend, set_alignment_components
 
 def err_quit(msg, exit_status=1):
     print("[Error] {}".format(msg))
@@ -68,6 +70,8 @@ def load_json(json_fn):
             return json.load(json_f)
     except IOError as ioerr:
         err_quit("{}. Aborting!".format(ioerr))
+    except ValueError as verr:
+        err_quit("Invalid JSON in '{}': {}. Aborting!".format(json_fn, verr))
 
 
 def transform_activity_index(data, obj_type):
@@ -278,30 +282,67 @@ def load_scoring_parameters(log, scoring_parameters_file):
     log(1, "[Info] Loading scoring parameters file")
     return load_json(scoring_parameters_file)
 
-def load_schema_for_protocol(log, protocol):
-    schema_path = "{}/{}".format(protocols_path, protocol.get_schema_fn())
-    log(1, "[Info] Loading JSON schema {}".format(schema_path))
-    return load_json(schema_path)
+# Threads reading and decoding the input files, which mostly wait on
+# I/O for the system output and reference
+INPUT_LOADER_THREADS = 4
 
-def parse_activities(deserialized_json, file_index, load_objects = False, ignore_extraneous = False, ignore_missing = False):
-    raw_instances = [ a for a in deserialized_json.get("activities", []) ]
-    if args.ignore_no_score_regions:
-        activity_instances = [ ActivityInstance(a, load_objects) for a in raw_instances ]
-    else:
-        filtered_instances = []
-        for inst in raw_instances:
-            fn = list(inst['localization'].keys())[0]
-            frames = SparseSignal(inst['localization'][fn])
-            try:
-                f_frames = SparseSignal(file_index[fn]['selected'])
-                if (f_frames | frames) == f_frames:
-                    filtered_instances.append(inst)
-            except KeyError as e:  # may append if there are extra files
-                if not args.ignore_extraneous_files:
-                    raise e
-                pass
-        activity_instances = [ ActivityInstance(a, load_objects) for a in filtered_instances ]
+# Loads and transforms the reference, and parses its activities;
+# returns both
+def load_reference_activities(log, args, file_index, load_objects = False):
+    reference = load_reference(log, args.reference_file)
+    if args.transformations == "single_bbox":
+        reference = transform_json_single_bbox(reference)
+    elif args.transformations == "single_bbox_per_frame":
+        reference = transform_json_single_bbox_per_frame(reference)
 
+    return reference, parse_activities(reference, file_index, load_objects, args.ignore_extraneous_files, args.ignore_missing_files)
+
+# Schemas are compiled once, when first loaded
+_compiled_schemas = {}
+
+def load_schema_for_protocol(log, protocol):
+    schema_path = "{}/{}".format(protocols_path, protocol.get_schema_fn())
+    if schema_path not in _compiled_schemas:
+        log(1, "[Info] Loading JSON schema {}".format(schema_path))
+        _compiled_schemas[schema_path] = compile_schema(load_json(schema_path))
+    return _compiled_schemas[schema_path]
+
+# Whether an activity instance lies within the scored (selected)
+# frames of its file, given the ScoredRegionIndex of the file index;
+# raises KeyError for files missing from the file index unless
+# extraneous files are ignored
+def in_scored_region(inst, index):
+    fn = list(inst['localization'].keys())[0]
+    try:
+        regions = index[fn]
+    except KeyError as e:  # may append if there are extra files
+        if not args.ignore_extraneous_files:
+            raise e
+        return False
+    return regions.contains(inst['localization'][fn])
+
+# in_scored_region for each of a list of activity instances, checking
+# the instances of each file all at once
+def in_scored_regions(insts, index):
+    by_file = group_by_func(lambda i: list(insts[i]['localization'].keys())[0], range(len(insts)))
+    out = [ False ] * len(insts)
+    for fn, file_insts in by_file.items():
+        try:
+            regions = index[fn]
+        except KeyError as e:  # may append if there are extra files
+            if not args.ignore_extraneous_files:
+                raise e
+            continue
+        for i, inside in zip(file_insts, regions.contains_all([ insts[i]['localization'][fn] for i in file_insts ])):
+            out[i] = inside
+    return out
+
+def build_activity_instance(inst, index, load_objects = False):
+    if args.ignore_no_score_regions or in_scored_region(inst, index):
+        return ActivityInstance(inst, load_objects)
+    return None
+
+def filter_activity_files(activity_instances, deserialized_json, file_index, ignore_extraneous = False, ignore_missing = False):
     if ignore_extraneous or ignore_missing:
         if deserialized_json.get('processingReport', None) is None:
             files = set(deserialized_json.get("filesProcessed", []))
@@ -326,13 +367,111 @@ def parse_activities(deserialized_json, file_index, load_objects = False, ignore
     else:
         return activity_instances
 
-def validate_input(log, system_output, system_output_schema):
-    log(1, "[Info] Validating system output against JSON schema")
+def parse_activities(deserialized_json, file_index, load_objects = False, ignore_extraneous = False, ignore_missing = False):
+    insts = deserialized_json.get("activities", [])
+    scored = [ True ] * len(insts) if args.ignore_no_score_regions else in_scored_regions(insts, ScoredRegionIndex(file_index))
+    activity_instances = [ ActivityInstance(inst, load_objects) for inst, inside in zip(insts, scored) if inside ]
+    return filter_activity_files(activity_instances, deserialized_json, file_index, ignore_extraneous, ignore_missing)
+
+# Reads the system output one activity instance at a time, validating
+# and converting each as it is read, so that the raw JSON for the
+# whole "activities" array is never held in memory.  Returns the
+# system output without its activities (the header) and the activity
+# instances; validation and file index checks match those of the
+# non-streamed path
+def stream_system_activities(log, system_output_file, system_output_schema, file_index, load_objects = False):
+    log(1, "[Info] Streaming activities from system output")
+    header, activity_instances = {}, []
+    # Instances on files missing from the file index are reported
+    # after the file index check, as for the non-streamed path
+    unknown_file_error = None
+    index = ScoredRegionIndex(file_index)
     try:
-        jsonschema.validate(system_output, system_output_schema)
-        log(1, "[Info] System output validated successfully against JSON schema")
-    except jsonschema.exceptions.ValidationError as verr:
-        err_quit("{}\n[Error] JSON schema validation of system output failed. Aborting!".format(verr))
+        with open(system_output_file, 'r') as json_f:
+            for i, inst in enumerate(iter_json_array(json_f, "activities", header)):
+                if not args.skip_validation:
+                    error = None
+                    if system_output_schema.precheck is not None:
+                        error = system_output_schema.precheck(inst)
+                    if error is None:
+                        error = validation_error(system_output_schema.item, inst)
+                    if error is not None:
+                        validation_failed(i, error)
+                if unknown_file_error is not None:
+                    continue
+                try:
+                    a = build_activity_instance(inst, index, load_objects)
+                except KeyError as e:
+                    unknown_file_error = e
+                    continue
+                if a is not None:
+                    activity_instances.append(a)
+    except IOError as ioerr:
+        err_quit("{}. Aborting!".format(ioerr))
+
+    if not args.skip_validation:
+        validate_input(log, header, system_output_schema)
+        check_file_index_congruence(log, header, file_index, args.ignore_extraneous_files, args.ignore_missing_files)
+        log(1, "[Info] Validation successful")
+
+    if unknown_file_error is not None:
+        raise unknown_file_error
+
+    return header, activity_instances
+
+# Key of the activities parsed from an input, made of the hashes of its
+# content and of the file index, and of the options changing what
+# parse_activities returns for them
+def input_cache_key(args, kind, input_hash, file_index_hash):
+    return cache_key(kind, input_hash, file_index_hash, args.ignore_no_score_regions, args.ignore_extraneous_files, args.ignore_missing_files, args.transformations)
+
+# Activity instances are validated in chunks of this many, in the
+# worker pool when the system output file has at least
+# VALIDATION_MIN_POOL_BYTES (some 16k activity instances)
+VALIDATION_CHUNK_SIZE = 2048
+VALIDATION_MIN_POOL_BYTES = 1 << 21
+
+def validation_failed(index, error):
+    if index is None:
+        err_quit("{}\n[Error] JSON schema validation of system output failed. Aborting!".format(error))
+    err_quit("{}\n[Error] JSON schema validation of system output failed on activity instance {}. Aborting!".format(error, index))
+
+# Validates the system output against a compiled schema.  The
+# activity instances are validated in chunks, each first run through
+# the schema's structural pre-check, in the worker pool of protocol if
+# given, which is then closed.  Errors are reported for the first
+# invalid instance, by index
+def validate_input(log, system_output, system_output_schema, protocol = None):
+    log(1, "[Info] Validating system output against JSON schema")
+    error = validation_error(system_output_schema.document, system_output)
+    if error is not None:
+        validation_failed(None, error)
+
+    # Valid documents have an "activities" array
+    activities = system_output["activities"]
+    ranges = [ (start, min(start + VALIDATION_CHUNK_SIZE, len(activities))) for start in range(0, len(activities), VALIDATION_CHUNK_SIZE) ]
+    if protocol is not None:
+        # The workers may have been forked before the activities were
+        # loaded, so each chunk is sent its own instances.  The pool is
+        # then released so that later phases fork workers inheriting
+        # their own payloads
+        validate_chunk = partial(validate_activity_chunk, system_output_schema.item, system_output_schema.precheck)
+        try:
+            failures = protocol.map_shared(validate_chunk, [ (start, activities[start:stop]) for start, stop in ranges ], phase = "validation")
+        finally:
+            protocol.close_pool()
+    else:
+        validate_range = partial(validate_activity_range, system_output_schema.item, activities, precheck = system_output_schema.precheck)
+        failures = []
+        for start, stop in ranges:
+            failures.append(validate_range(start, stop))
+            if failures[-1] is not None:
+                break
+
+    failures = [ f for f in failures if f is not None ]
+    if len(failures) > 0:
+        validation_failed(*min(failures))
+    log(1, "[Info] System output validated successfully against JSON schema")
 
     # Assuming that the input is valid if we make it this far
     return True
@@ -449,50 +588,163 @@ def score_basic(protocol_class, args):
     verbosity_threshold = 1 if args.verbose else 0
     log = build_logger(verbosity_threshold)
     log(1, "[Info] Command: {}".format(" ".join(sys.argv)))
+    if args.signal_engine is not None:
+        set_signal_engine(args.signal_engine)
+    if args.assignment_backend is not None:
+        set_assignment_backend(args.assignment_backend)
+    if args.alignment_components:
+        set_alignment_components(True)
+
+    if args.reference_bundle is not None:
+        if args.reference_file is not None or args.file_index is not None:
+            err_quit("--reference-bundle can't be combined with -r or -f.  Aborting!")
+        if args.rewrite:
+            err_quit("--reference-bundle can't be combined with --rewrite.  Aborting!")
+    elif args.file_index is None:
+        err_quit("Missing required FILE_INDEX argument (-f, --file-index).  Aborting!")
 
     if not args.validation_only:
         # Check for now-required arguments
-        if args.reference_file is None:
+        if args.reference_file is None and args.reference_bundle is None:
             err_quit("Missing required REFERENCE_FILE argument (-r, --reference-file).  Aborting!")
 
         if args.output_dir is None:
             err_quit("Missing required OUTPUT_DIR argument (-o, --output-dir).  Aborting!")
 
-    activity_index = load_activity_index(log, args.activity_index)
+    if args.stream_system_output and (args.prune_system_output or args.transformations or args.rewrite):
+        err_quit("--stream-system-output can't be combined with -P, --transformations or --rewrite.  Aborting!")
+
+    # Parsed activities are cached under the content of their input
+    # and of the file index; pruning and re-writing both need the
+    # JSON documents, so bypass the cache
+    use_cache = args.cache_dir is not None and not args.prune_system_output and not args.rewrite
+
+    # Large system outputs are validated in the worker pool, whose
+    # workers are forked before the loader threads start (see
+    # start_worker_pool)
+    validation_pool = None
+    if not args.skip_validation and not args.stream_system_output and \
+       os.path.isfile(args.system_output_file) and os.path.getsize(args.system_output_file) >= VALIDATION_MIN_POOL_BYTES:
+        validation_pool = start_worker_pool(args.processes_number)
+
+    # The inputs are read and decoded concurrently, and the reference
+    # activities parsed while the system output is validated.  Errors
+    # raised by a loader (including err_quit's exit) are re-raised by
+    # result()
+    loader = ThreadPoolExecutor(INPUT_LOADER_THREADS)
+    activity_index_future = loader.submit(load_activity_index, log, args.activity_index)
+    if args.reference_bundle is not None:
+        file_index_future = loader.submit(load_reference_bundle, log, args)
+    else:
+        file_index_future = loader.submit(load_file_index, log, args.file_index)
+
+    # Submitted after the file index, which they wait on
+    def _submit_reference():
+        return loader.submit(lambda: load_reference_activities(log, args, file_index_future.result(), protocol_class.requires_object_localization))
+
+    system_output_future, reference_future = None, None
+    if not use_cache:
+        if not args.stream_system_output and not args.prune_system_output:
+            system_output_future = loader.submit(load_system_output, log, args.system_output_file)
+        if not args.validation_only and args.reference_bundle is None:
+            reference_future = _submit_reference()
+
+    scoring_parameters_future = loader.submit(load_scoring_parameters, log, args.scoring_parameters_file) if args.scoring_parameters_file else None
+    plot_options_future = loader.submit(load_json, args.plotting_parameters_file) if args.plotting_parameters_file else None
+
+    activity_index = activity_index_future.result()
     if args.transformations == "single_bbox" or args.transformations == "single_bbox_per_frame":
         activity_index = transform_activity_index(activity_index, args.transformations)
 
-    file_index = load_file_index(log, args.file_index)
-    input_scoring_parameters = load_scoring_parameters(log, args.scoring_parameters_file) if args.scoring_parameters_file else {}
-    protocol = protocol_class(input_scoring_parameters, file_index, activity_index, " ".join(sys.argv))
-    protocol.pn = args.processes_number
-    protocol.minmax = None
-    plot_options = load_json(args.plotting_parameters_file) if args.plotting_parameters_file else {}
+    bundle = None
+    if args.reference_bundle is not None:
+        bundle = file_index_future.result()
+        file_index = bundle["file_index"]
+    else:
+        file_index = file_index_future.result()
+    input_scoring_parameters = scoring_parameters_future.result() if scoring_parameters_future is not None else {}
+
+    def _build_protocol():
+        protocol = protocol_class(input_scoring_parameters, file_index, activity_index, " ".join(sys.argv))
+        protocol.pn = args.processes_number
+        protocol.minmax = None
+        protocol.split_cohorts = args.split_cohorts
+        protocol.shard = args.shard
+        return protocol
+
+    protocol = _build_protocol()
+    if validation_pool is not None:
+        protocol.set_pool(validation_pool)
+    plot_options = plot_options_future.result() if plot_options_future is not None else {}
     system_output_schema = load_schema_for_protocol(log, protocol)
 
+    if use_cache:
+        try:
+            file_index_hash = file_content_hash(args.file_index if bundle is None else args.reference_bundle)
+            system_key = input_cache_key(args, "system", file_content_hash(args.system_output_file), file_index_hash)
+            reference_key = input_cache_key(args, "reference", file_content_hash(args.reference_file), file_index_hash) if args.reference_file is not None else None
+        except IOError as ioerr:
+            err_quit("{}. Aborting!".format(ioerr))
+        schema_hash = cache_key(system_output_schema.schema)
+
     log(1, "[Info] Loading activities and references")
-    if args.prune_system_output:
-        system_output, minmax = prune(args.system_output_file, args.prune_system_output, file_index, log)
-        protocol.minmax = minmax
-    else:
-        system_output = load_system_output(log, args.system_output_file)
+    reference_activities = None
+    if not args.validation_only:
+        if bundle is not None:
+            reference_activities = bundle["reference_activities"]
+            log(1, "[Info] Loaded {} reference activities from bundle".format(len(reference_activities)))
+        elif use_cache:
+            reference_activities = load_cached(args.cache_dir, reference_key)
+            if reference_activities is not None:
+                log(1, "[Info] Loaded {} reference activities from cache".format(len(reference_activities)))
+            else:
+                reference_future = _submit_reference()
+
+    system_activities, cached = None, None
+    if use_cache:
+        cached = load_cached(args.cache_dir, system_key)
+        # An entry can only stand in for validation against the schemas
+        # it was validated against
+        if cached is not None and (args.skip_validation or schema_hash in cached["validated"]):
+            log(1, "[Info] Loaded {} system activities from cache".format(len(cached["activities"])))
+            system_output, system_activities = cached["header"], cached["activities"]
+            if not args.skip_validation:
+                check_file_index_congruence(log, system_output, file_index, args.ignore_extraneous_files, args.ignore_missing_files)
+                log(1, "[Info] Validation successful")
+
+    if system_activities is None:
+        if args.stream_system_output:
+            system_output, streamed_activities = stream_system_activities(log, args.system_output_file, system_output_schema, file_index, protocol_class.requires_object_localization)
+        elif args.prune_system_output:
+            from ActivitiesFilePruner import prune
+            system_output, minmax = prune(args.system_output_file, args.prune_system_output, file_index, log)
+            protocol.minmax = minmax
+        elif system_output_future is not None:
+            system_output = system_output_future.result()
+        else:
+            system_output = load_system_output(log, args.system_output_file)
 
-    if not args.skip_validation:
-        validate_input(log, system_output, system_output_schema)
-        check_file_index_congruence(log, system_output, file_index, args.ignore_extraneous_files, args.ignore_missing_files)
-        log(1, "[Info] Validation successful")
+        if not args.skip_validation and not args.stream_system_output:
+            validate_input(log, system_output, system_output_schema, protocol if validation_pool is not None else None)
+            check_file_index_congruence(log, system_output, file_index, args.ignore_extraneous_files, args.ignore_missing_files)
+            log(1, "[Info] Validation successful")
+
+    # Left unused when the system activities come from the cache
+    protocol.close_pool()
 
     if args.validation_only:
         exit(0)
-    reference = load_reference(log, args.reference_file)
 
-    if args.transformations == "single_bbox":
-        system_output = transform_json_single_bbox(system_output)
-        reference = transform_json_single_bbox(reference)
-    elif args.transformations == "single_bbox_per_frame":
-        system_output = transform_json_single_bbox_per_frame(system_output)
-        reference = transform_json_single_bbox_per_frame(reference)
-        
+    if reference_future is not None:
+        reference, reference_activities = reference_future.result()
+    loader.shutdown()
+
+    if system_activities is None:
+        if args.transformations == "single_bbox":
+            system_output = transform_json_single_bbox(system_output)
+        elif args.transformations == "single_bbox_per_frame":
+            system_output = transform_json_single_bbox_per_frame(system_output)
+
     if args.rewrite:
         sys_out_file = '.'.join(args.system_output_file.split('.')[:-1]) + args.rewrite + '.json'
         ref_out_file = '.'.join(args.reference_file.split('.')[:-1]) + args.rewrite + '.json'
@@ -503,25 +755,60 @@ def score_basic(protocol_class, args):
         with open(ref_out_file, 'w') as ref_outfile:
             json.dump(reference, ref_outfile)
 
-    system_activities = parse_activities(system_output, file_index, protocol_class.requires_object_localization, args.ignore_extraneous_files, args.ignore_missing_files)
-    reference_activities = parse_activities(reference, file_index, protocol_class.requires_object_localization, args.ignore_extraneous_files, args.ignore_missing_files)
+    if system_activities is None:
+        if args.stream_system_output:
+            system_activities = filter_activity_files(streamed_activities, system_output, file_index, args.ignore_extraneous_files, args.ignore_missing_files)
+        else:
+            system_activities = parse_activities(system_output, file_index, protocol_class.requires_object_localization, args.ignore_extraneous_files, args.ignore_missing_files)
+
+        if use_cache:
+            header = { k: v for k, v in system_output.items() if k != "activities" }
+            validated = cached["validated"] if cached is not None else []
+            if not args.skip_validation:
+                validated = validated + [ schema_hash ]
+            store_cached(args.cache_dir, system_key, { "header": header, "activities": system_activities, "validated": validated })
+
+    if reference_future is not None and use_cache:
+        store_cached(args.cache_dir, reference_key, reference_activities)
 
     if not args.include_zero_ref_instances:
         # Removing activities from activity-index that doesn't appear in the reference instances.
-        for act in [act for act in activity_index if act not in [inst.activity for inst in reference_activities]]:
+        reference_activity_names = set(inst.activity for inst in reference_activities)
+        removed = [act for act in activity_index if act not in reference_activity_names]
+        for act in removed:
             del activity_index[act]
-        # Now we regenerate protocol ans stuff
-        protocol = protocol_class(input_scoring_parameters, file_index, activity_index, " ".join(sys.argv))
-        protocol.pn = args.processes_number
-        protocol.minmax = None
-        system_output_schema = load_schema_for_protocol(log, protocol)
+        # Now we regenerate protocol ans stuff, if its activity index
+        # changed; as a regenerated one would, it drops the pruning
+        # minmax either way
+        if len(removed) > 0:
+            protocol = _build_protocol()
+        else:
+            protocol.minmax = None
+
+    # Alignment and scoring share one worker pool, released once both
+    # are done
+    try:
+        log(1, "[Info] Computing alignments ..")
+        alignment = protocol.compute_alignment(system_activities, reference_activities)
+        log(1, "[Info] {} alignment records".format(len(alignment)))
+
+        if args.shard is not None:
+            # Extra metrics are computed per activity as well, and
+            # summarized by the merge
+            ap_by_activity = None
+            if args.extra_metrics:
+                shard_index = { a: activity_index[a] for a in protocol.shard_activities(reference_activities, system_activities) }
+                ap_by_activity = compute_ap_by_activity(system_activities, reference_activities, shard_index, file_index)
+
+            write_shard(log, args, protocol_class, input_scoring_parameters, file_index, activity_index, alignment, ap_by_activity)
+            return
 
-    log(1, "[Info] Computing alignments ..")
-    alignment = protocol.compute_alignment(system_activities, reference_activities)
-    log(1, "[Info] {} alignment records".format(len(alignment)))
+        log(1, '[Info] Scoring ..')
+        results = protocol.compute_results(alignment, args.det_point_resolution)
+    finally:
+        protocol.close_pool()
 
-    log(1, '[Info] Scoring ..')
-    results = protocol.compute_results(alignment, args.det_point_resolution)
+    log_parallel_stats(log, protocol)
 
     # --extra-metrics part
     # Currently only map is part of it
@@ -530,27 +817,182 @@ def score_basic(protocol_class, args):
         extra_metrics = compute_map(system_activities, reference_activities, activity_index, file_index)
     else: extra_metrics = {}
 
-    mkdir_p(args.output_dir)
-    log(1, "[Info] Saving results to directory '{}'".format(args.output_dir))
+    write_outputs(log, protocol, results, extra_metrics, args.output_dir, args.disable_plotting, plot_options, vars(args).get("dump_object_alignment_records", False))
+
+def log_parallel_stats(log, protocol):
+    for phase, tasks, batches, wall, busy, efficiency in protocol.parallel_stats:
+        log(1, "[Info] Parallel {}: {} tasks in {} batches, {:.2f}s wall, {:.2f}s busy, {:.0%} efficiency on {} workers".format(phase, tasks, batches, wall, busy, efficiency, protocol.pn or os.cpu_count()))
+
+def write_outputs(log, protocol, results, extra_metrics, output_dir, disable_plotting, plot_options, dump_object_alignment_records):
+    mkdir_p(output_dir)
+    log(1, "[Info] Saving results to directory '{}'".format(output_dir))
     audc_by_activity = []
     mean_audc = []
-    if not args.disable_plotting:
-        export_records(log, results.get("det_point_records", {}), results.get("tfa_det_point_records", {}), args.output_dir, plot_options)
+    if not disable_plotting:
+        export_records(log, results.get("det_point_records", {}), results.get("tfa_det_point_records", {}), output_dir, plot_options)
         plot_options['title'] = "Detection Precision/Recall - 0.5 tIoU"
         plot_options['filename'] = "PR@0.5tIoU"
-        export_pr_curves(log, extra_metrics.get('pr', []), args.output_dir, plot_options)
-        audc_by_activity, mean_audc = protocol.compute_auc(args.output_dir)
+        export_pr_curves(log, extra_metrics.get('pr', []), output_dir, plot_options)
+        audc_by_activity, mean_audc = protocol.compute_auc(output_dir)
 
-    write_out_scoring_params(args.output_dir, protocol.scoring_parameters)
-    write_records_as_csv("{}/alignment.csv".format(args.output_dir), ["activity", "alignment", "ref", "sys", "sys_presenceconf_score", "kernel_similarity", "kernel_components"], results.get("output_alignment_records", []))
-    write_records_as_csv("{}/pair_metrics.csv".format(args.output_dir), ["activity", "ref", "sys", "metric_name", "metric_value"], results.get("pair_metrics", []))
-    write_records_as_csv("{}/scores_by_activity.csv".format(args.output_dir), ["activity", "metric_name", "metric_value"], results.get("scores_by_activity", []) + audc_by_activity + extra_metrics.get('AP', []))
-    write_records_as_csv("{}/scores_aggregated.csv".format(args.output_dir), [ "metric_name", "metric_value" ], results.get("scores_aggregated", []) + mean_audc + extra_metrics.get('mAP', []))
-    write_records_as_csv("{}/scores_by_activity_and_threshold.csv".format(args.output_dir), [ "activity", "score_threshold", "metric_name", "metric_value" ], results.get("scores_by_activity_and_threshold", []))
+    write_out_scoring_params(output_dir, protocol.scoring_parameters)
+    write_records_as_csv("{}/alignment.csv".format(output_dir), ["activity", "alignment", "ref", "sys", "sys_presenceconf_score", "kernel_similarity", "kernel_components"], results.get("output_alignment_records", []))
+    write_records_as_csv("{}/pair_metrics.csv".format(output_dir), ["activity", "ref", "sys", "metric_name", "metric_value"], results.get("pair_metrics", []))
+    write_records_as_csv("{}/scores_by_activity.csv".format(output_dir), ["activity", "metric_name", "metric_value"], results.get("scores_by_activity", []) + audc_by_activity + extra_metrics.get('AP', []))
+    write_records_as_csv("{}/scores_aggregated.csv".format(output_dir), [ "metric_name", "metric_value" ], results.get("scores_aggregated", []) + mean_audc + extra_metrics.get('mAP', []))
+    write_records_as_csv("{}/scores_by_activity_and_threshold.csv".format(output_dir), [ "activity", "score_threshold", "metric_name", "metric_value" ], results.get("scores_by_activity_and_threshold", []))
 
-    if vars(args).get("dump_object_alignment_records", False):
-        write_records_as_csv("{}/object_alignment.csv".format(args.output_dir), ["activity", "ref_activity", "sys_activity", "frame", "ref_object_type", "sys_object_type", "mapped_ref_object_type", "mapped_sys_object_type", "alignment", "ref_object", "sys_object", "sys_presenceconf_score", "kernel_similarity", "kernel_components"], results.get("object_frame_alignment_records", []))
+    if dump_object_alignment_records:
+        write_records_as_csv("{}/object_alignment.csv".format(output_dir), ["activity", "ref_activity", "sys_activity", "frame", "ref_object_type", "sys_object_type", "mapped_ref_object_type", "mapped_sys_object_type", "alignment", "ref_object", "sys_object", "sys_presenceconf_score", "kernel_similarity", "kernel_components"], results.get("object_frame_alignment_records", []))
 
+def parse_shard(value):
+    try:
+        index, count = [ int(v) for v in value.split("/") ]
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected INDEX/COUNT, e.g. 0/4")
+
+    if count < 1 or index < 0 or index >= count:
+        raise argparse.ArgumentTypeError("expected 0 <= INDEX < COUNT")
+
+    return (index, count)
+
+# A shard holds the alignment records of its activities, grouped by
+# activity, along with everything needed to compute the results once
+# all shards are merged
+def write_shard(log, args, protocol_class, scoring_parameters, file_index, activity_index, alignment, ap_by_activity):
+    index, count = args.shard
+    def _activity(rec):
+        return (rec.ref if rec.ref is not None else rec.sys).activity
+
+    shard = { "protocol": protocol_class,
+              "shard": args.shard,
+              "scoring_parameters": scoring_parameters,
+              "file_index": file_index,
+              "activity_index": activity_index,
+              "det_point_resolution": args.det_point_resolution,
+              "dump_object_alignment_records": vars(args).get("dump_object_alignment_records", False),
+              "alignment": group_by_func(_activity, alignment),
+              "extra_metrics": args.extra_metrics,
+              "ap_by_activity": ap_by_activity }
+
+    mkdir_p(args.output_dir)
+    out_file = "{}/shard_{}_of_{}.dill".format(args.output_dir, index, count)
+    with open(out_file, "wb") as f:
+        dill.dump(shard, f)
+    log(1, "[Info] Saved shard {} of {} to '{}'".format(index, count, out_file))
+
+def merge_shards(args):
+    verbosity_threshold = 1 if args.verbose else 0
+    log = build_logger(verbosity_threshold)
+    log(1, "[Info] Command: {}".format(" ".join(sys.argv)))
+    if args.signal_engine is not None:
+        set_signal_engine(args.signal_engine)
+
+    shards = []
+    for shard_file in args.shard_files:
+        try:
+            with open(shard_file, "rb") as f:
+                shards.append(dill.load(f))
+        except IOError as ioerr:
+            err_quit("{}. Aborting!".format(ioerr))
+
+    first = shards[0]
+    count = first["shard"][1]
+    if sorted([ s["shard"] for s in shards ]) != [ (i, count) for i in range(count) ]:
+        err_quit("Expected one shard for each of the {} shards, got {}.  Aborting!".format(count, ", ".join("{}/{}".format(*s["shard"]) for s in shards)))
+
+    for key in [ "protocol", "scoring_parameters", "file_index", "activity_index", "det_point_resolution", "dump_object_alignment_records", "extra_metrics" ]:
+        if any(s[key] != first[key] for s in shards):
+            err_quit("Shards disagree on '{}', they must all come from the same scoring command.  Aborting!".format(key))
+
+    # Each activity is aligned in a single shard, so putting them back
+    # in activity index order gives the records of a single run
+    alignment = []
+    for activity in first["activity_index"]:
+        for s in shards:
+            alignment.extend(s["alignment"].get(activity, []))
+    log(1, "[Info] {} alignment records from {} shards".format(len(alignment), count))
+
+    protocol = first["protocol"](first["scoring_parameters"], first["file_index"], first["activity_index"], " ".join(sys.argv))
+    protocol.pn = args.processes_number
+    protocol.minmax = None
+    plot_options = load_json(args.plotting_parameters_file) if args.plotting_parameters_file else {}
+
+    try:
+        log(1, '[Info] Scoring ..')
+        results = protocol.compute_results(alignment, first["det_point_resolution"])
+    finally:
+        protocol.close_pool()
+
+    log_parallel_stats(log, protocol)
+
+    extra_metrics = {}
+    if first["extra_metrics"]:
+        ap, precision, recall = {}, {}, {}
+        for activity in first["activity_index"]:
+            for s in shards:
+                s_ap, s_precision, s_recall = s["ap_by_activity"]
+                if activity in s_ap:
+                    ap[activity] = s_ap[activity]
+                if activity in s_precision:
+                    precision[activity] = s_precision[activity]
+                if activity in s_recall:
+                    recall[activity] = s_recall[activity]
+        extra_metrics = summarize_ap(ap, precision, recall)
+
+    write_outputs(log, protocol, results, extra_metrics, args.output_dir, args.disable_plotting, plot_options, first["dump_object_alignment_records"])
+
+# Options changing which reference instances parse_activities keeps; a
+# bundle is only used by scoring runs given the same ones
+REFERENCE_BUNDLE_OPTIONS = [ "ignore_no_score_regions", "ignore_extraneous_files", "ignore_missing_files", "transformations" ]
+
+# A reference bundle holds the parsed reference instances and file
+# index, along with the reference side values computed from them when
+# scoring: the selected frame durations of each file, and the
+# reference and non-reference signals of each activity in each file
+def compile_reference(args):
+    verbosity_threshold = 1 if args.verbose else 0
+    log = build_logger(verbosity_threshold)
+    log(1, "[Info] Command: {}".format(" ".join(sys.argv)))
+    if args.signal_engine is not None:
+        set_signal_engine(args.signal_engine)
+
+    file_index = load_file_index(log, args.file_index)
+    reference, reference_activities = load_reference_activities(log, args, file_index, True)
+    log(1, "[Info] {} reference activities".format(len(reference_activities)))
+
+    log(1, "[Info] Building reference signals")
+    durations = selected_frame_durations(file_index)
+    bundle = { "options": { k: vars(args)[k] for k in REFERENCE_BUNDLE_OPTIONS },
+               "file_index": file_index,
+               "reference_activities": reference_activities,
+               "signal_engine": get_signal_engine(),
+               "durations": durations,
+               "reference_signals": build_reference_signals(reference_activities, durations) }
+
+    out_dir = os.path.dirname(args.output_file)
+    if out_dir != "":
+        mkdir_p(out_dir)
+    with open(args.output_file, "wb") as f:
+        dill.dump(bundle, f)
+    log(1, "[Info] Saved reference bundle to '{}'".format(args.output_file))
+
+def load_reference_bundle(log, args):
+    log(1, "[Info] Loading reference bundle")
+    try:
+        with open(args.reference_bundle, "rb") as f:
+            bundle = dill.load(f)
+    except IOError as ioerr:
+        err_quit("{}. Aborting!".format(ioerr))
+
+    for k in REFERENCE_BUNDLE_OPTIONS:
+        if bundle["options"][k] != vars(args)[k]:
+            err_quit("Reference bundle was compiled with {} set to '{}', not '{}'.  Aborting!".format(k, bundle["options"][k], vars(args)[k]))
+
+    # Reference signals are only used with the engine they were built
+    # with
+    set_reference_precomputed(bundle["signal_engine"], bundle["durations"], bundle["reference_signals"])
+    return bundle
 
 def export_records(log, dm_records_rfa, dm_records_tfa, output_dir, plot_options):
     figure_dir = "{}/figures".format(output_dir)
@@ -593,6 +1035,14 @@ def export_records(log, dm_records_rfa, dm_records_tfa, output_dir, plot_options
     _export_records(dm_records_rfa, "RFA")
     _export_records(dm_records_tfa, "TFA")
 
+# Plotting pulls in matplotlib, so it is only imported by runs which
+# plot.  Figures are only ever saved to files
+def load_render():
+    import matplotlib
+    matplotlib.use('Agg')
+    from render import Render
+    return Render
+
 def export_pr_curves(log, pr_metrics, output_dir, plot_options):
     if pr_metrics == []:
         return
@@ -603,7 +1053,7 @@ def export_pr_curves(log, pr_metrics, output_dir, plot_options):
 
     precision, recall = pr_metrics
     activities = list(precision.keys())
-    rd = Render()
+    rd = load_render()()
 
     def _save_pr(precision, recall, activity, file_name, plot_options):
         plot_options['xlim'] = [0, min((1, 1.1*r[-1]))]
@@ -641,7 +1091,7 @@ def save_DET(dc, path, file_name, plot_options):
         dc = list(dc)
     if isinstance(dc, DataContainer):
         dc = [dc]
-    rd = Render(plot_type="det")
+    rd = load_render()(plot_type="det")
     fig = rd.plot(dc, display=False, plot_options=plot_options)
     fig.savefig("{}/{}".format(path, file_name))
     rd.close_fig(fig)
@@ -654,7 +1104,8 @@ if __name__ == '__main__':
     base_args = [[["-s", "--system-output-file"], dict(help="System output JSON file", type=str, required=True)],
                  [["-r", "--reference-file"], dict(help="Reference JSON file", type=str)],
                  [["-a", "--activity-index"], dict(help="Activity index JSON file", type=str, required=True)],
-                 [["-f", "--file-index"], dict(help="file index JSON file", type=str, required=True)],
+                 [["-f", "--file-index"], dict(help="file index JSON file", type=str)],
+                 [["-b", "--reference-bundle"], dict(help="Reference bundle from the compile-reference command, in place of the reference and file index", type=str)],
                  [["-t", "--det-point-resolution"], dict(help="Number of Unique confidence scores to use", type=int, default=0, required=False)],
                  [["-F", "--ignore-extraneous-files"], dict(help="Ignore system detection localizations for files not included in the file index", action="store_true")],
                  [["-m", "--ignore-missing-files"], dict(help="Ignore system detection localizations for files not included in the system output", action="store_true")],
@@ -671,7 +1122,14 @@ if __name__ == '__main__':
                  [["-S", "--skip-validation"], dict(help="Skip system output validation step", action="store_true", default=False)],
                  [["-e", "--extra-metrics"], dict(help="Allow Scorer to compute extra metrics", action="store_true", default=False)],
                  [["--transformations"], dict(help="Converts the json object to the maximum posible bounding box size", type=str)],
-                 [["--rewrite"], dict(help="Rewrites transformed jsons with the given extension", type=str)]]
+                 [["--rewrite"], dict(help="Rewrites transformed jsons with the given extension", type=str)],
+                 [["--signal-engine"], dict(help="Temporal signal implementation used to compute metrics", choices=["sparse", "interval"])],
+                 [["--assignment-backend"], dict(help="Assignment solver used to align system and reference instances", choices=["munkres", "scipy"])],
+                 [["--alignment-components"], dict(help="Solve the alignment of each connected component of overlapping instances separately", action="store_true", default=False)],
+                 [["--split-cohorts"], dict(help="Split the alignment cohort of each file at the gaps no instance spans", action="store_true", default=False)],
+                 [["--stream-system-output"], dict(help="Read the system output activities one at a time rather than loading the whole file", action="store_true", default=False)],
+                 [["--cache-dir"], dict(help="Directory where parsed system and reference activities are cached for later runs on the same inputs", type=str)],
+                 [["--shard"], dict(help="Only align the activities of shard INDEX (from 0) of COUNT and save them to OUTPUT_DIR for the merge command", metavar="INDEX/COUNT", type=parse_shard)]]
 
     def add_protocol_subparser(name, kwargs, func, arguments):
         subp = subparsers.add_parser(name, **kwargs)
@@ -766,6 +1224,30 @@ if __name__ == '__main__':
                            score_srl_ad_v3,
                            base_args)
 
+    add_protocol_subparser("compile-reference",
+                           dict(help="Compiles a reference and file index into a bundle for --reference-bundle"),
+                           compile_reference,
+                           [[["-r", "--reference-file"], dict(help="Reference JSON file", type=str, required=True)],
+                            [["-f", "--file-index"], dict(help="file index JSON file", type=str, required=True)],
+                            [["-o", "--output-file"], dict(help="Reference bundle file to write", type=str, required=True)],
+                            [["-F", "--ignore-extraneous-files"], dict(help="Ignore reference localizations for files not included in the file index", action="store_true")],
+                            [["-m", "--ignore-missing-files"], dict(help="Ignore reference localizations for files not included in the reference", action="store_true")],
+                            [["-i", "--ignore-no-score-regions"], dict(help="Don't discard instances which overlap no-score regions.", action="store_true", default=False)],
+                            [["-v", "--verbose"], dict(help="Toggle verbose log output", action="store_true")],
+                            [["--transformations"], dict(help="Converts the json object to the maximum posible bounding box size", type=str)],
+                            [["--signal-engine"], dict(help="Temporal signal implementation used to compute metrics", choices=["sparse", "interval"])]])
+
+    add_protocol_subparser("merge",
+                           dict(help="Computes the results of a scoring run split with --shard from the saved shards"),
+                           merge_shards,
+                           [[["shard_files"], dict(help="Shard files, one for each shard", nargs="+")],
+                            [["-o", "--output-dir"], dict(help="Output directory for results", type=str, required=True)],
+                            [["-d", "--disable-plotting"], dict(help="Disable DET Curve plotting of results", action="store_true")],
+                            [["-v", "--verbose"], dict(help="Toggle verbose log output", action="store_true")],
+                            [["-n", "--processes-number"], dict(help="Number of processes to use to compute results", type=int, default=8)],
+                            [["-c", "--plotting-parameters-file"], dict(help="Optional plotting options JSON file", type=str)],
+                            [["--signal-engine"], dict(help="Temporal signal implementation used to compute metrics", choices=["sparse", "interval"])]])
+
     args = parser.parse_args()
     if args == argparse.Namespace():
         parser.parse_args(['-h'])
@@ -31,6 +31,7 @@
 # licenses.
 
 from functools import reduce
+import numpy as np
 
 from metrics import *
 from activity_instance import *
@@ -46,6 +47,36 @@ def temporal_intersection_filter(r, s):
     ti = temporal_intersection(r, s)
     return (temporal_intersection(r, s) > 0, { "temporal_intersection": ti })
 
+# The '.matrix' variants below evaluate a filter or component for a
+# whole cohort at once (see build_linear_combination_kernel); the
+# overlap matrices are shared between them through the cache
+def _cached_temporal_overlap_matrices(refs, syss, cache):
+    if "temporal_overlap_matrices" not in cache:
+        cache["temporal_overlap_matrices"] = temporal_overlap_matrices(refs, syss)
+
+    return cache["temporal_overlap_matrices"]
+
+def _single_signal_areas(instances):
+    return np.array([ temporal_single_signal_area(i) for i in instances ], dtype = float)
+
+def _temporal_intersection_over_area_matrix(ti, r_area):
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        return (ti * 1.0) / r_area[None, :]
+
+def _temporal_intersection_filter_matrix(refs, syss, cache):
+    ti, _, _ = _cached_temporal_overlap_matrices(refs, syss, cache)
+    return ti > 0
+
+temporal_intersection_filter.matrix = _temporal_intersection_filter_matrix
+temporal_intersection_filter.candidates = temporal_candidate_pairs
+
+# Filters which only pass pairs with some temporal intersection also
+# provide a '.candidates(refs, syss)' function, returning the (sys,
+# ref) index pairs that can pass; perform_alignment only evaluates the
+# kernel on those pairs
+def _requires_temporal_intersection(threshold, tioa_threshold):
+    return threshold > 0 and (tioa_threshold == "None" or tioa_threshold > 0)
+
 def build_temporal_second_overlap_filter_v2(threshold, tioa_threshold="None"):
         def _filter(r, s):
             if tioa_threshold != "None":
@@ -61,7 +92,21 @@ def build_temporal_second_overlap_filter_v2(threshold, tioa_threshold="None"):
                 ti = temporal_intersection(r, s)
                 #tiou = temporal_intersection_over_union(r, s)
                 return (ti >= threshold, { "temporal_intersection": ti }) #, "temporal_intersection-over-union": tiou })
-            
+
+        def _filter_matrix(refs, syss, cache):
+            ti, _, _ = _cached_temporal_overlap_matrices(refs, syss, cache)
+            ok = ti >= threshold
+            if tioa_threshold != "None":
+                r_area = _single_signal_areas(refs)
+                short = np.broadcast_to((r_area < threshold)[None, :], ok.shape)
+                tioa = _temporal_intersection_over_area_matrix(ti, r_area)
+                ok = np.where(short, tioa >= tioa_threshold, ok)
+
+            return ok
+
+        _filter.matrix = _filter_matrix
+        if _requires_temporal_intersection(threshold, tioa_threshold):
+            _filter.candidates = temporal_candidate_pairs
         return _filter
 
 def build_temporal_second_overlap_filter(threshold, tioa_threshold="None"):
@@ -79,7 +124,23 @@ def build_temporal_second_overlap_filter(threshold, tioa_threshold="None"):
             ti = temporal_intersection(r, s)
             #tiou = temporal_intersection_over_union(r, s)
             return (ti >= threshold, { "temporal_intersection": ti }) #, "temporal_intersection-over-union": tiou })
-    
+
+    def _filter_matrix(refs, syss, cache):
+        ti, _, _ = _cached_temporal_overlap_matrices(refs, syss, cache)
+        ok = ti >= threshold
+        if tioa_threshold != "None":
+            s_area = _single_signal_areas(syss)
+            short = np.broadcast_to((s_area < threshold)[:, None], ok.shape)
+            # Only evaluated where the system instance is short, as
+            # with the pairwise filter
+            tioa = _temporal_intersection_over_area_matrix(ti, _single_signal_areas(refs)) if short.any() else ti
+            ok = np.where(short, tioa >= tioa_threshold, ok)
+
+        return ok
+
+    _filter.matrix = _filter_matrix
+    if _requires_temporal_intersection(threshold, tioa_threshold):
+        _filter.candidates = temporal_candidate_pairs
     return _filter
 
 def build_temporal_overlap_filter(threshold):
@@ -87,11 +148,25 @@ def build_temporal_overlap_filter(threshold):
         tiou = temporal_intersection_over_union(r, s)
         return (tiou > threshold, { "temporal_intersection-over-union": tiou })
 
+    def _filter_matrix(refs, syss, cache):
+        _, _, tiou = _cached_temporal_overlap_matrices(refs, syss, cache)
+        return tiou > threshold
+
+    _filter.matrix = _filter_matrix
+    # Pairs without temporal intersection have an IoU of 0
+    if threshold >= 0:
+        _filter.candidates = temporal_candidate_pairs
     return _filter
 
 def temporal_intersection_over_union_component(r, s, cache):
     return { "temporal_intersection-over-union": temporal_intersection_over_union(r, s) } #cache.get("temporal_intersection-over-union", temporal_intersection_over_union(r, s)) }
 
+def _temporal_intersection_over_union_component_matrix(refs, syss, cache):
+    _, _, tiou = _cached_temporal_overlap_matrices(refs, syss, cache)
+    return { "temporal_intersection-over-union": tiou }
+
+temporal_intersection_over_union_component.matrix = _temporal_intersection_over_union_component_matrix
+
 def build_spatial_overlap_filter(threshold):
     def _filter(r, s):
         siou = spatial_intersection_over_union(r, s)
@@ -99,23 +174,51 @@ def build_spatial_overlap_filter(threshold):
 
     return _filter
 
+# Object localizations carry their bounding box as an (x, y, w, h)
+# tuple; anything else (e.g. a bare spatial signal) falls back to the
+# nested signal joins
+def _simple_spatial_intersection_over_union(r, s):
+    if hasattr(r, "bounding_box") and hasattr(s, "bounding_box"):
+        return bounding_box_intersection_over_union(r.bounding_box, s.bounding_box)
+    else:
+        return simple_spatial_intersection_over_union(r.spatial_signal, s.spatial_signal)
+
+def _cached_simple_spatial_intersection_over_union_matrix(refs, syss, cache):
+    if "spatial_intersection-over-union" not in cache:
+        cache["spatial_intersection-over-union"] = bounding_box_intersection_over_union_matrix([ r.bounding_box for r in refs ], [ s.bounding_box for s in syss ])
+
+    return cache["spatial_intersection-over-union"]
+
 def build_simple_spatial_overlap_filter(threshold):
     def _filter(r, s):
-        ssiou = simple_spatial_intersection_over_union(r.spatial_signal, s.spatial_signal)
+        ssiou = _simple_spatial_intersection_over_union(r, s)
         return (ssiou > threshold, { "spatial_intersection-over-union": ssiou })
 
+    def _filter_matrix(refs, syss, cache):
+        return _cached_simple_spatial_intersection_over_union_matrix(refs, syss, cache) > threshold
+
+    _filter.matrix = _filter_matrix
     return _filter
 
 def simple_spatial_intersection_over_union_component(r, s, cache):
-    #print "simple_spatial"
-    #print simple_spatial_intersection_over_union(r.spatial_signal, s.spatial_signal)
-    #print r.spatial_signal
-    #print s.spatial_signal
-    return { "spatial_intersection-over-union": cache.get("spatial_intersection-over-union", simple_spatial_intersection_over_union(r.spatial_signal, s.spatial_signal)) }
+    if "spatial_intersection-over-union" in cache:
+        return { "spatial_intersection-over-union": cache["spatial_intersection-over-union"] }
+    else:
+        return { "spatial_intersection-over-union": _simple_spatial_intersection_over_union(r, s) }
+
+def _simple_spatial_intersection_over_union_component_matrix(refs, syss, cache):
+    return { "spatial_intersection-over-union": _cached_simple_spatial_intersection_over_union_matrix(refs, syss, cache) }
+
+simple_spatial_intersection_over_union_component.matrix = _simple_spatial_intersection_over_union_component_matrix
 
 def object_type_match_filter(r, s):
     return (r.objectType == s.objectType, {})
 
+def _object_type_match_filter_matrix(refs, syss, cache):
+    return np.array([ [ r.objectType == s.objectType for r in refs ] for s in syss ], dtype = bool).reshape(len(syss), len(refs))
+
+object_type_match_filter.matrix = _object_type_match_filter_matrix
+
 def build_equiv_class_type_match_filter(classes):
     def _filter(r, s):
         r_class = classes.get(r.objectType, None)
@@ -126,6 +229,10 @@ def build_equiv_class_type_match_filter(classes):
         else:
             return (r_class == s_class, {})
 
+    def _filter_matrix(refs, syss, cache):
+        return np.array([ [ _filter(r, s)[0] for r in refs ] for s in syss ], dtype = bool).reshape(len(syss), len(refs))
+
+    _filter.matrix = _filter_matrix
     return _filter
 
 def _object_signals_to_lookup(temporal_signal, local_objects):
@@ -134,7 +241,7 @@ def _object_signals_to_lookup(temporal_signal, local_objects):
     empty_olf = ObjectLocalizationFrame.empty()
 
     def _r(init, o):
-        selected_o = [ x for x in temporal_signal.join(o, lambda a, b: b if a else empty_olf).on_steps(lambda x: len(x.spatial_signal) > 0) ]
+        selected_o = [ x for x in temporal_signal.join(o, lambda a, b: b if a else empty_olf).on_steps(lambda x: x.bounding_box is not None) ]
 
         init.extend(selected_o)
         return init
@@ -40,10 +40,16 @@ def _localization_key_converter(localization, value_mapper = lambda x: x):
     return { k: { int(_k): value_mapper(_v) for _k, _v in v.items() }
              for k, v in localization.items() }
 
-def _bounding_box_to_signal(bounding_box):
-    x, y, w, h = map(lambda e: bounding_box[e], ("x", "y", "w", "h"))
+def _bounding_box_to_tuple(bounding_box):
+    return tuple(map(lambda e: bounding_box[e], ("x", "y", "w", "h")))
+
+def _bounding_box_tuple_to_signal(bounding_box):
+    x, y, w, h = bounding_box
     return S({x: S({y: 1, y + h: 0}), x + w: S()})
 
+def _bounding_box_to_signal(bounding_box):
+    return _bounding_box_tuple_to_signal(_bounding_box_to_tuple(bounding_box))
+
 def _build_object_frame_wconf_mapper(obj_type, obj_id):
     def _object_frame_wconf_mapper(obj):
         if len(obj) == 0:
@@ -75,10 +81,20 @@ class ObjectInstance():
 
 class ObjectLocalizationFrame():
     def __init__(self, bounding_box, conf, obj_type, obj_id):
-        self.spatial_signal = _bounding_box_to_signal(bounding_box) if bounding_box else S()
+        # Boxes are kept as plain (x, y, w, h) tuples, spatial metrics
+        # are computed in closed form from these
+        self.bounding_box = _bounding_box_to_tuple(bounding_box) if bounding_box else None
         self.presenceConf = conf
         self.objectType = obj_type
         self.objectID = obj_id
+        self._spatial_signal = None
+
+    # The nested SparseSignal form is only built on first request
+    @property
+    def spatial_signal(self):
+        if self._spatial_signal is None:
+            self._spatial_signal = _bounding_box_tuple_to_signal(self.bounding_box) if self.bounding_box is not None else S()
+        return self._spatial_signal
 
     def __str__(self):
         return str(self.objectID)
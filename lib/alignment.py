@@ -36,7 +36,13 @@ from operator import and_
 from alignment_record import AlignmentRecord
 from helpers import *
 from functools import reduce
+import numpy as np
 import time
+import os
+
+# Below this many (ref, sys) pairs the per-call overhead of a
+# vectorized kernel outweighs evaluating the pairs one by one
+MATRIX_KERNEL_MIN_PAIRS = 32
 
 def build_actev19_linear_combination_kernel(filters, components, weights, initial_similarity = 1):
     def _kernel(r_i, s_i):
@@ -123,37 +129,277 @@ def build_linear_combination_kernel(filters, components, weights, initial_simila
             #print cache
             return (DISALLOWED, {})
 
+    # If every filter and component also provides a vectorized
+    # '.matrix(refs, syss, cache)' form, the kernel can be evaluated
+    # for a whole cohort at once; filters return a boolean matrix,
+    # components a dict of (broadcastable) matrices, indexed
+    # [sys_index][ref_index]
+    if len(filters) + len(components) > 0 and all(hasattr(f, "matrix") for f in filters + components):
+        _kernel.matrix = build_linear_combination_matrix_kernel(filters, components, weights, initial_similarity)
+
+    # A filter's '.candidates(refs, syss)' returns the set of
+    # (sys_index, ref_index) pairs it may pass; all other pairs are
+    # DISALLOWED by the kernel without evaluating it
+    candidate_filters = [ f for f in filters if hasattr(f, "candidates") ]
+    if len(candidate_filters) > 0:
+        _kernel.candidates = candidate_filters[0].candidates
+
     return _kernel
 
-def perform_alignment(ref_instances, sys_instances, kernel, maximize = True):
-    disallowed = {}
+def build_linear_combination_matrix_kernel(filters, components, weights, initial_similarity = 1):
+    def _matrix_kernel(ref_instances, sys_instances):
+        shape = (len(sys_instances), len(ref_instances))
+        cache = {}
+        allowed = np.ones(shape, dtype = bool)
+        for f in filters:
+            allowed &= f.matrix(ref_instances, sys_instances, cache)
+
+        component_values = reduce(merge_dicts, [ cf.matrix(ref_instances, sys_instances, cache) for cf in components ], {})
+
+        sim = np.full(shape, initial_similarity)
+        for key, weight in weights.items():
+            sim = sim + weight * component_values.get(key, 0)
+
+        return (sim, allowed, { k: np.broadcast_to(v, shape) for k, v in component_values.items() })
+
+    return _matrix_kernel
+
+def _all_pairs(ref_instances, sys_instances):
+    return [ (s_i, r_i) for s_i in range(len(sys_instances)) for r_i in range(len(ref_instances)) ]
+
+# Both evaluators return the similarities of the allowed (sys_index,
+# ref_index) pairs, the maximum allowed similarity and a lookup of the
+# kernel components by pair
+def _evaluate_kernel(ref_instances, sys_instances, kernel, pairs):
+    sims = {}
     max_sim = 0
-    sim_matrix, component_matrix = [], []
-    start = time.time_ns()
-    report_matrix_stats = False  ### Boolean to report the stats
-    report_matrix_start = False  ### Writes a line before the matrix processing begins
-    report_matrix_print_threshold = 10000  ### Controls the size of the matrix to trigger output
+    component_matrix = {}
 
-    if report_matrix_stats and report_matrix_start and len(ref_instances) * len(sys_instances) > report_matrix_print_threshold:
-        print("[Info] StartBigAlignment: {} x {} = {}".format(len(ref_instances), len(sys_instances), len(ref_instances) * len(sys_instances)))
+    for s_i, r_i in pairs:
+        sim, comp = kernel(ref_instances[r_i], sys_instances[s_i])
 
-    for s_i, s in enumerate(sys_instances):
-        sim_row = []
-        comp_row = []
-        for r_i, r in enumerate(ref_instances):
-            sim, comp = kernel(r, s)
+        component_matrix[(s_i, r_i)] = comp
 
-            sim_row.append(sim)
-            comp_row.append(comp)
+        if sim != DISALLOWED:
+            sims[(s_i, r_i)] = sim
+            if sim > max_sim: max_sim = sim
 
-            if sim == DISALLOWED:
-                disallowed[(s_i, r_i)] = True
-            else:
-                if sim > max_sim: max_sim = sim
+    def _components(s_i, r_i):
+        return component_matrix.get((s_i, r_i), {})
+
+    return (sims, max_sim, _components)
+
+# The matrix kernel is evaluated on the sub-cohort of instances
+# appearing in pairs
+def _evaluate_matrix_kernel(ref_instances, sys_instances, matrix_kernel, pairs):
+    pairs = np.array(pairs, dtype = np.int64).reshape(-1, 2)
+    sys_index, sub_s = np.unique(pairs[:, 0], return_inverse = True)
+    ref_index, sub_r = np.unique(pairs[:, 1], return_inverse = True)
+    sim, sub_allowed, components = matrix_kernel([ ref_instances[r_i] for r_i in ref_index.tolist() ],
+                                                 [ sys_instances[s_i] for s_i in sys_index.tolist() ])
+
+    ok = sub_allowed[sub_s, sub_r]
+    sim_values = sim[sub_s[ok], sub_r[ok]].tolist()
+    sims = dict(zip(zip(pairs[ok, 0].tolist(), pairs[ok, 1].tolist()), sim_values))
+    max_sim = max([ 0 ] + sim_values)
+
+    sys_pos = { s_i: i for i, s_i in enumerate(sys_index.tolist()) }
+    ref_pos = { r_i: j for j, r_i in enumerate(ref_index.tolist()) }
+    def _components(s_i, r_i):
+        i, j = sys_pos[s_i], ref_pos[r_i]
+        return { k: v[i, j].item() for k, v in components.items() }
+
+    return (sims, max_sim, _components)
+
+# Splits the bipartite graph of allowed (sys_index, ref_index) pairs
+# into its connected components, returned as (sys_indices,
+# ref_indices) lists in increasing order.  Instances without any
+# allowed pair are not part of any component
+def _connected_components(allowed):
+    parent = {}
+    def _find(node):
+        root = node
+        while parent[root] != root:
+            root = parent[root]
+        while parent[node] != root:
+            parent[node], node = root, parent[node]
+        return root
+
+    for s_i, r_i in allowed:
+        s_node, r_node = ("sys", s_i), ("ref", r_i)
+        parent.setdefault(s_node, s_node)
+        parent.setdefault(r_node, r_node)
+        s_root, r_root = _find(s_node), _find(r_node)
+        if s_root != r_root:
+            parent[r_root] = s_root
+
+    members = {}
+    for node in parent:
+        members.setdefault(_find(node), ([], []))[0 if node[0] == "sys" else 1].append(node[1])
+
+    return [ (sorted(sys_indices), sorted(ref_indices)) for sys_indices, ref_indices in members.values() ]
+
+# Alignments whose total similarities differ by less than this,
+# relative to the largest similarity, are considered equally good
+ALIGNMENT_TIE_TOLERANCE = 1e-9
+
+# Assignments to DISALLOWED pairs cost max_sim + 1 whichever they
+# are, so an optimal assignment is a matching of the allowed pairs of
+# largest total weight, where an allowed pair weighs max_sim + 1 less
+# its cost.  The other optimal assignments are found along the cycles
+# of no cost of the residual graph of assignment, in which the sys and
+# ref sides of the flow meet in a single node, 0.  Shortest distances
+# to each node, by Bellman-Ford from all nodes at once, give
+# potentials under which every edge costs at least zero, so these
+# cycles only go through the edges of (about) zero reduced cost, which
+# are returned along with the nodes of the sys and ref instances.
+# None is returned if assignment is not optimal
+def _tight_residual_graph(sims, assignment, max_sim, maximize):
+    weights = { pair: sim if maximize else (max_sim + 1) - sim for pair, sim in sims.items() }
+    sys_node = { s_i: 1 + i for i, s_i in enumerate(sorted({ s_i for s_i, _ in weights })) }
+    ref_node = { r_i: 1 + len(sys_node) + j for j, r_i in enumerate(sorted({ r_i for _, r_i in weights })) }
+    matched_sys = { s_i for s_i, _ in assignment }
+    matched_ref = { r_i for _, r_i in assignment }
+
+    edges = []
+    for s_i, node in sys_node.items():
+        edges.append((node, 0, 0.0) if s_i in matched_sys else (0, node, 0.0))
+    for r_i, node in ref_node.items():
+        edges.append((0, node, 0.0) if r_i in matched_ref else (node, 0, 0.0))
+    for (s_i, r_i), weight in weights.items():
+        if (s_i, r_i) in assignment:
+            edges.append((ref_node[r_i], sys_node[s_i], weight))
+        else:
+            edges.append((sys_node[s_i], ref_node[r_i], -weight))
+
+    u, v, c = (np.array(x) for x in zip(*edges))
+    n = 1 + len(sys_node) + len(ref_node)
+    tolerance = ALIGNMENT_TIE_TOLERANCE * max(1, max(abs(w) for w in weights.values()))
+
+    # Updates below tolerance / (n + 1) are ignored, so that the
+    # reduced costs along a cycle of no cost stay below tolerance
+    dist = np.zeros(n)
+    for _ in range(n + 1):
+        relaxed = dist.copy()
+        np.minimum.at(relaxed, v, dist[u] + c)
+        improved = relaxed < dist - tolerance / (n + 1)
+        if not improved.any():
+            break
+        dist = np.where(improved, relaxed, dist)
+    else:
+        return None
+
+    tight = c + dist[u] - dist[v] <= tolerance
+    return (sys_node, ref_node, u[tight], v[tight], n)
+
+def _strong_components(u, v, n):
+    from scipy.sparse import csr_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    graph = csr_matrix((np.ones(len(u)), (u, v)), shape = (n, n))
+    return connected_components(graph, directed = True, connection = "strong")
+
+# Whether assignment, a set of allowed (sys_index, ref_index) pairs
+# of sims, is the only optimal one, i.e. no cycle goes through the
+# tight edges of its residual graph.  Ties within the tolerance,
+# non-positive weights and non-optimal assignments all count as not
+# unique
+def _unique_optimum(sims, assignment, max_sim, maximize = True):
+    if len(sims) == 0:
+        return True
+
+    if min(sim if maximize else (max_sim + 1) - sim for sim in sims.values()) <= 0:
+        return False
+
+    graph = _tight_residual_graph(sims, assignment, max_sim, maximize)
+    if graph is None:
+        return False
+
+    _, _, u, v, n = graph
+    return _strong_components(u, v, n)[0] == n
+
+# Of the optimal assignments, returns the one which has the smallest,
+# in (sys_index, ref_index) order, of the pairs in which it differs
+# from any other.  The choice only depends on the order of the
+# instances, so that a connected component or temporal window of a
+# cohort chooses as within the whole cohort.  The pairs which may
+# differ between optimal assignments are decided in increasing order:
+# a pair is kept if some optimal assignment, with the pairs decided
+# so far, has it; it is then found along a cycle of tight edges of the
+# residual graph through the pair, which is applied to the assignment
+def _canonical_optimum(sims, assignment, max_sim, maximize = True):
+    assignment = set(assignment)
+    if len(sims) == 0:
+        return assignment
+
+    graph = _tight_residual_graph(sims, assignment, max_sim, maximize)
+    if graph is None:
+        return assignment
+
+    sys_node, ref_node, u, v, n = graph
+    labels = _strong_components(u, v, n)[1]
+
+    # Only edges within a strongly connected component are on a cycle
+    adjacency = {}
+    for a, b in zip(u.tolist(), v.tolist()):
+        if labels[a] == labels[b]:
+            adjacency.setdefault(a, set()).add(b)
+
+    node_sys = { node: s_i for s_i, node in sys_node.items() }
+    node_ref = { node: r_i for r_i, node in ref_node.items() }
+
+    def _path(start, end):
+        parent, frontier = { start: None }, [ start ]
+        while len(frontier) > 0 and end not in parent:
+            following = []
+            for a in frontier:
+                for b in adjacency.get(a, ()):
+                    if b not in parent:
+                        parent[b] = a
+                        following.append(b)
+            frontier = following
 
-        sim_matrix.append(sim_row)
-        component_matrix.append(comp_row)
+        if end not in parent:
+            return None
 
+        path = [ end ]
+        while path[-1] != start:
+            path.append(parent[path[-1]])
+        return path[::-1]
+
+    undecided = sorted((s_i, r_i) for s_i, r_i in sims
+                       if sys_node[s_i] in adjacency.get(ref_node[r_i], ()) or ref_node[r_i] in adjacency.get(sys_node[s_i], ()))
+    for s_i, r_i in undecided:
+        s_n, r_n = sys_node[s_i], ref_node[r_i]
+        if (s_i, r_i) not in assignment:
+            path = _path(r_n, s_n) if r_n in adjacency.get(s_n, ()) else None
+            if path is None:
+                adjacency.get(s_n, set()).discard(r_n)
+                continue
+
+            for a, b in zip([ s_n ] + path, path):
+                adjacency[a].discard(b)
+                adjacency.setdefault(b, set()).add(a)
+                if a in node_sys and b in node_ref:
+                    assignment.add((node_sys[a], node_ref[b]))
+                elif a in node_ref and b in node_sys:
+                    assignment.discard((node_sys[b], node_ref[a]))
+
+        adjacency.get(r_n, set()).discard(s_n)
+
+    return assignment
+
+# Assignment backends solve the assignment problem for a similarity
+# matrix as returned by the kernel evaluators, and return the assigned
+# (sys_index, ref_index) pairs.  DISALLOWED pairs are given the worst
+# cost, max_sim + 1, and any assignment to them is later dropped.
+# 'munkres' is the reference implementation; 'scipy' solves the
+# rectangular problem on a NumPy cost matrix without padding it, and
+# then chooses between several optimal assignments as
+# _canonical_optimum does, which munkres may not.  Backends which are
+# 'canonical' choose as within the whole cohort when solving a part
+# of it
+def munkres_assignment(sim_matrix, allowed, max_sim, maximize = True):
     if maximize:
         def _mapper(sim):
             return max_sim + 1 if sim == DISALLOWED else (max_sim + 1) - sim
@@ -161,23 +407,174 @@ def perform_alignment(ref_instances, sys_instances, kernel, maximize = True):
         def _mapper(sim):
             return max_sim + 1 if sim == DISALLOWED else sim
 
+    return Munkres().compute(make_cost_matrix(sim_matrix, _mapper))
+
+def linear_sum_assignment_assignment(sim_matrix, allowed, max_sim, maximize = True):
+    from scipy.optimize import linear_sum_assignment
+
+    shape = (len(sim_matrix), len(sim_matrix[0]) if len(sim_matrix) > 0 else 0)
+    cost = np.full(shape, max_sim + 1, dtype = float)
+    if len(allowed) > 0:
+        s_idx, r_idx = np.array(list(allowed), dtype = np.int64).T
+        sims = np.array([ sim_matrix[s_i][r_i] for s_i, r_i in zip(s_idx.tolist(), r_idx.tolist()) ], dtype = float)
+        cost[s_idx, r_idx] = (max_sim + 1) - sims if maximize else sims
+
+    rows, cols = linear_sum_assignment(cost)
+    sims = { (s_i, r_i): sim_matrix[s_i][r_i] for s_i, r_i in allowed }
+    return sorted(_canonical_optimum(sims, { pair for pair in zip(rows.tolist(), cols.tolist()) if pair in allowed }, max_sim, maximize))
+
+linear_sum_assignment_assignment.canonical = True
+
+ASSIGNMENT_BACKENDS = { "munkres": munkres_assignment, "scipy": linear_sum_assignment_assignment }
+_assignment_backend = os.environ.get("ACTEV_ASSIGNMENT_BACKEND", "munkres")
+
+# As with the signal engine, the choice is exported to the environment
+# so that it carries over to worker processes
+def set_assignment_backend(name):
+    global _assignment_backend
+    if name not in ASSIGNMENT_BACKENDS:
+        raise ValueError("Unknown assignment backend '{}'".format(name))
+    _assignment_backend = name
+    os.environ["ACTEV_ASSIGNMENT_BACKEND"] = name
+
+def get_assignment_backend():
+    return _assignment_backend
+
+# Solving connected components separately gives the same alignment as
+# solving the whole cohort (see perform_alignment), but is only worth
+# it on large cohorts made of many small components, so it is opt-in
+_alignment_components = os.environ.get("ACTEV_ALIGNMENT_COMPONENTS", "0") == "1"
+
+def set_alignment_components(enabled):
+    global _alignment_components
+    _alignment_components = enabled
+    os.environ["ACTEV_ALIGNMENT_COMPONENTS"] = "1" if enabled else "0"
+
+# The (sys_index, ref_index) pairs the kernel is evaluated on, in
+# increasing order; only candidate pairs if the kernel narrows them
+def alignment_pairs(ref_instances, sys_instances, kernel):
+    if hasattr(kernel, "candidates"):
+        return sorted(kernel.candidates(ref_instances, sys_instances))
+    else:
+        return _all_pairs(ref_instances, sys_instances)
+
+# Evaluates the kernel on a subset of the pairs of a cohort, e.g. a
+# block of rows of a large cohort computed in another process.  The
+# result holds plain dicts so that it can be sent back, and blocks of
+# the same cohort are put back together with merge_kernel_evaluations
+def evaluate_alignment_kernel(ref_instances, sys_instances, kernel, pairs):
+    if hasattr(kernel, "matrix") and len(pairs) >= MATRIX_KERNEL_MIN_PAIRS:
+        sims, max_sim, _components = _evaluate_matrix_kernel(ref_instances, sys_instances, kernel.matrix, pairs)
+    else:
+        sims, max_sim, _components = _evaluate_kernel(ref_instances, sys_instances, kernel, pairs)
+
+    return (sims, max_sim, { pair: _components(*pair) for pair in sims })
+
+# Splits sorted pairs into about count blocks of consecutive rows
+# (system instances), never splitting a row
+def row_blocks(pairs, count):
+    size = max(1, -(-len(pairs) // max(1, count)))
+    blocks, start = [], 0
+    while start < len(pairs):
+        end = min(start + size, len(pairs))
+        while end < len(pairs) and pairs[end][0] == pairs[end - 1][0]:
+            end += 1
+        blocks.append(pairs[start:end])
+        start = end
+
+    return blocks
+
+def merge_kernel_evaluations(evaluations):
+    sims, max_sim, components = {}, 0, {}
+    for block_sims, block_max_sim, block_components in evaluations:
+        sims.update(block_sims)
+        max_sim = max(max_sim, block_max_sim)
+        components.update(block_components)
 
-    matrix = make_cost_matrix(sim_matrix, _mapper)
+    return (sims, max_sim, lambda s_i, r_i: components.get((s_i, r_i), {}))
+
+# Solves each (sys_indices, ref_indices) component on its own, with
+# the backend, and returns the assigned allowed pairs
+def _solve_components(sims, max_sim, maximize, components):
+    assignments = []
+    for sys_index, ref_index in components:
+        if len(sys_index) == 0 or len(ref_index) == 0:
+            continue
+
+        if len(sys_index) == 1 and len(ref_index) == 1:
+            if (sys_index[0], ref_index[0]) in sims:
+                assignments.append((sys_index[0], ref_index[0]))
+            continue
+
+        sim_matrix = [ [ sims.get((s_i, r_i), DISALLOWED) for r_i in ref_index ] for s_i in sys_index ]
+        allowed = { (i, j) for i, s_i in enumerate(sys_index) for j, r_i in enumerate(ref_index) if (s_i, r_i) in sims }
+        for i, j in ASSIGNMENT_BACKENDS[_assignment_backend](sim_matrix, allowed, max_sim, maximize):
+            if (i, j) in allowed:
+                assignments.append((sys_index[i], ref_index[j]))
+
+    return assignments
+
+# If given, evaluation is the (sims, max_sim, components lookup) of the
+# cohort as returned by merge_kernel_evaluations, and the kernel is not
+# evaluated again.  If the instances are only part of a cohort, such
+# as a temporal window, None is returned instead of an alignment when
+# the part might not align as within the whole cohort, i.e. on
+# non-positive similarities or if several assignments are optimal
+def perform_alignment(ref_instances, sys_instances, kernel, maximize = True, evaluation = None, part = False):
+    start = time.time_ns()
+    report_matrix_stats = False  ### Boolean to report the stats
+    report_matrix_start = False  ### Writes a line before the matrix processing begins
+    report_matrix_print_threshold = 10000  ### Controls the size of the matrix to trigger output
+
+    if report_matrix_stats and report_matrix_start and len(ref_instances) * len(sys_instances) > report_matrix_print_threshold:
+        print("[Info] StartBigAlignment: {} x {} = {}".format(len(ref_instances), len(sys_instances), len(ref_instances) * len(sys_instances)))
+
+    if evaluation is not None:
+        sims, max_sim, _components = evaluation
+    else:
+        pairs = alignment_pairs(ref_instances, sys_instances, kernel)
+        if hasattr(kernel, "matrix") and len(pairs) >= MATRIX_KERNEL_MIN_PAIRS:
+            sims, max_sim, _components = _evaluate_matrix_kernel(ref_instances, sys_instances, kernel.matrix, pairs)
+        else:
+            sims, max_sim, _components = _evaluate_kernel(ref_instances, sys_instances, kernel, pairs)
+
+    if part and maximize and any(sim <= 0 for sim in sims.values()):
+        return None
+
+    # Unless some similarity is not positive (when maximizing), every
+    # allowed pair costs less than a DISALLOWED one, so an optimal
+    # assignment is made of optimal assignments of each connected
+    # component of the allowed pairs.  If enabled, these are solved on
+    # their own, with the same costs as in the whole cohort; instances
+    # outside of any component are left unmapped.  Unless the backend
+    # is canonical, the components might choose unlike the whole
+    # cohort between several optimal assignments, so their assignment
+    # is then only kept if it is the only optimal one, and the cohort
+    # is otherwise solved again at once.  Parts of a cohort are
+    # likewise left to the whole cohort
+    canonical = getattr(ASSIGNMENT_BACKENDS[_assignment_backend], "canonical", False)
+    whole = [ (list(range(len(sys_instances))), list(range(len(ref_instances)))) ]
+    if _alignment_components and not (maximize and any(sim <= 0 for sim in sims.values())):
+        assignments = _solve_components(sims, max_sim, maximize, _connected_components(sims))
+        if not canonical and not _unique_optimum(sims, set(assignments), max_sim, maximize):
+            if part:
+                return None
+            assignments = _solve_components(sims, max_sim, maximize, whole)
+    else:
+        assignments = _solve_components(sims, max_sim, maximize, whole)
+        if part and not canonical and not _unique_optimum(sims, set(assignments), max_sim, maximize):
+            return None
 
     correct_detects, false_alarms, missed_detects = [], [], []
     unmapped_sys = set(range(0, len(sys_instances)))
     unmapped_ref = set(range(0, len(ref_instances)))
-    if len(matrix) > 0:
-        for s_i, r_i in Munkres().compute(matrix):
-            if disallowed.get((s_i, r_i), False):
-                continue
-
-            unmapped_sys.remove(s_i)
-            unmapped_ref.remove(r_i)
-            try:
-                correct_detects.append(AlignmentRecord(ref_instances[r_i], sys_instances[s_i], sim_matrix[s_i][r_i], component_matrix[s_i][r_i], ref_instances[r_i].localization, sys_instances[s_i].localization, list(sys_instances[s_i].localization)[0]))
-            except:
-                correct_detects.append(AlignmentRecord(ref_instances[r_i], sys_instances[s_i], sim_matrix[s_i][r_i], component_matrix[s_i][r_i],None,None,None))
+    for s_i, r_i in sorted(assignments):
+        unmapped_sys.remove(s_i)
+        unmapped_ref.remove(r_i)
+        try:
+            correct_detects.append(AlignmentRecord(ref_instances[r_i], sys_instances[s_i], sims[(s_i, r_i)], _components(s_i, r_i), ref_instances[r_i].localization, sys_instances[s_i].localization, list(sys_instances[s_i].localization)[0]))
+        except:
+            correct_detects.append(AlignmentRecord(ref_instances[r_i], sys_instances[s_i], sims[(s_i, r_i)], _components(s_i, r_i),None,None,None))
     for r_i in unmapped_ref:
         try:
             missed_detects.append(AlignmentRecord(ref_instances[r_i], None, None, None, ref_instances[r_i].localization, None, list(ref_instances[r_i].localization)[0]))
@@ -33,7 +33,12 @@
 # Optional default_groups ensures the inclusion of the
 # specified groups in the output dictionary
 
-from dill import loads
+import os
+import time
+import heapq
+import subprocess
+import tempfile
+from dill import loads, dumps, dump, load
 from functools import reduce
 
 
@@ -79,32 +84,115 @@ def merge_dicts(a, b, conflict_func=None):
 def identity(x):
     return x
 
+identity.batch = lambda args, cache=None: [ x for x, in args ]
 
-def unserialize_fct_alg(args):
-    (sfct, srefs, ssyss, skernel) = args
-    fct = loads(sfct)
-    return fct(loads(srefs), loads(ssyss), loads(skernel))
 
+# Task payloads shared with worker processes, by key.  Workers forked
+# after a payload is published inherit this dict as is; any other
+# worker loads the payload once from the file written at publish time
+_shared_payloads = {}
 
-def unserialize_fct_res(args):
-    (sfct, (activity, iterable), init) = args
-    fct = loads(sfct)
-    return fct(init, (activity, iterable))
 
+def publish_shared(key, payload, inherited=False):
+    _shared_payloads[key] = payload
+    if inherited:
+        return None
 
-# Used in default.py to parallelize atomic measures
-def unserialize_fct_atomic(args):
-    (sfct, activity, init) = args
-    fct = loads(sfct)
-    return fct(init, activity)
+    fd, path = tempfile.mkstemp(prefix="actev_shared_", suffix=".dill")
+    with os.fdopen(fd, "wb") as f:
+        dump(payload, f)
 
+    return path
 
-# Used in SRL_AOD_V1 to parallelize object frame alignments
-def unserialize_fct_obj(args):
-    (sfct, svar, init) = args
-    activity = loads(svar)
-    fct = loads(sfct)
-    return fct(init, activity)
+
+def release_shared(key, path=None):
+    _shared_payloads.pop(key, None)
+    if path is not None and os.path.exists(path):
+        os.remove(path)
+
+
+def get_shared(key, path=None):
+    if key not in _shared_payloads:
+        if path is None:
+            raise KeyError("Shared payload '{}' is not available in this process".format(key))
+
+        # Phases run one after another, so earlier payloads loaded
+        # by this worker are no longer needed
+        _shared_payloads.clear()
+        with open(path, "rb") as f:
+            _shared_payloads[key] = load(f)
+
+    return _shared_payloads[key]
+
+
+# Worker entry point for index-based dispatch, the payload is a
+# (func, args_list) pair.  If args_list is shared, the task only names
+# which args to use; otherwise (args_list is None) the task carries the
+# args of its batch, serialized with pack_batch.  Returns the results
+# for the batch along with the time spent on it
+def call_shared(task):
+    key, path, indices, packed_args = task
+    func, args_list = get_shared(key, path)
+    batch_args = loads(packed_args) if args_list is None else [ args_list[i] for i in indices ]
+    start = time.perf_counter()
+    results = [ func(*args) for args in batch_args ]
+    return (results, time.perf_counter() - start)
+
+
+def pack_batch(args_list, indices):
+    return dumps([ args_list[i] for i in indices ])
+
+
+# Returns a pool of processes workers, all forked right away rather
+# than on first use.  Started before any other thread, it spares the
+# workers from being forked while a thread holds a lock, which they
+# would then deadlock on
+def start_worker_pool(processes):
+    from concurrent.futures import ProcessPoolExecutor
+
+    pool = ProcessPoolExecutor(processes)
+    # The first task has the pool fork all of its workers
+    pool.submit(int).result()
+    return pool
+
+
+# Groups task indices into batches, largest estimated cost first.
+# Tasks costing at least a 1/batches_per_worker share of a worker's
+# load run alone, smaller ones are packed together up to that size
+def schedule_batches(costs, workers, batches_per_worker=4):
+    order = sorted(range(len(costs)), key=lambda i: costs[i], reverse=True)
+    target = sum(costs) / float(max(workers, 1) * batches_per_worker)
+
+    batches, current, current_cost = [], [], 0
+    for i in order:
+        if costs[i] >= target:
+            batches.append([i])
+            continue
+
+        current.append(i)
+        current_cost += costs[i]
+        if current_cost >= target:
+            batches.append(current)
+            current, current_cost = [], 0
+
+    if len(current) > 0:
+        batches.append(current)
+
+    return batches
+
+
+# Deals items out to count parts, largest estimated cost first, each
+# to the least loaded part so far.  Returns the part of each item; the
+# outcome only depends on the costs and their order
+def partition_by_cost(costs, count):
+    bin_costs = [ (0, p) for p in range(count) ]
+    parts = [ None ] * len(costs)
+    for i in sorted(range(len(costs)), key=lambda i: costs[i], reverse=True):
+        bin_cost, p = heapq.heappop(bin_costs)
+        parts[i] = p
+        heapq.heappush(bin_costs, (bin_cost + costs[i], p))
+
+    return parts
 
 
 def argsort(a, key=None):
@@ -116,4 +204,29 @@ def argsort(a, key=None):
         while idx in sort_idx:
             idx = a[idx+1:].index(elt) + idx+1
         sort_idx.append(idx)
-    return sort_idx
\ No newline at end of file
+    return sort_idx
+
+
+# The scorer's git repository, and the file 'make provenance' writes
+# its commit to, for installs without the repository
+GIT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".git")
+PROVENANCE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "provenance.txt")
+_git_commit = None
+
+
+# The "<hash>--<author date>" of the scorer's commit recorded in the
+# scoring parameters, from git if the repository is there, else from
+# PROVENANCE_FILE, else "unknown".  Looked up once per process
+def git_commit():
+    global _git_commit
+    if _git_commit is None:
+        try:
+            _git_commit = subprocess.check_output(["git", "--git-dir=" + GIT_DIR, "show", "--oneline", "-s", "--no-abbrev-commit", "--pretty=format:%H--%aI"], stderr=subprocess.DEVNULL).strip()
+        except (OSError, subprocess.CalledProcessError):
+            if os.path.exists(PROVENANCE_FILE):
+                with open(PROVENANCE_FILE, "rb") as f:
+                    _git_commit = f.read().strip()
+            else:
+                _git_commit = b"unknown"
+
+    return _git_commit
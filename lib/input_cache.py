@@ -0,0 +1,78 @@
+# input_cache.py
+
+# This software was developed by employees of the National Institute of
+# Standards and Technology (NIST), an agency of the Federal
+# Government. Pursuant to title 17 United States Code Section 105, works
+# of NIST employees are not subject to copyright protection in the
+# United States and are considered to be in the public
+# domain. Permission to freely use, copy, modify, and distribute this
+# software and its documentation without fee is hereby granted, provided
+# that this notice and disclaimer of warranty appears in all copies.
+
+# THE SOFTWARE IS PROVIDED 'AS IS' WITHOUT ANY WARRANTY OF ANY KIND,
+# EITHER EXPRESSED, IMPLIED, OR STATUTORY, INCLUDING, BUT NOT LIMITED
+# TO, ANY WARRANTY THAT THE SOFTWARE WILL CONFORM TO SPECIFICATIONS, ANY
+# IMPLIED WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+# PURPOSE, AND FREEDOM FROM INFRINGEMENT, AND ANY WARRANTY THAT THE
+# DOCUMENTATION WILL CONFORM TO THE SOFTWARE, OR ANY WARRANTY THAT THE
+# SOFTWARE WILL BE ERROR FREE. IN NO EVENT SHALL NIST BE LIABLE FOR ANY
+# DAMAGES, INCLUDING, BUT NOT LIMITED TO, DIRECT, INDIRECT, SPECIAL OR
+# CONSEQUENTIAL DAMAGES, ARISING OUT OF, RESULTING FROM, OR IN ANY WAY
+# CONNECTED WITH THIS SOFTWARE, WHETHER OR NOT BASED UPON WARRANTY,
+# CONTRACT, TORT, OR OTHERWISE, WHETHER OR NOT INJURY WAS SUSTAINED BY
+# PERSONS OR PROPERTY OR OTHERWISE, AND WHETHER OR NOT LOSS WAS
+# SUSTAINED FROM, OR AROSE OUT OF THE RESULTS OF, OR USE OF, THE
+# SOFTWARE OR SERVICES PROVIDED HEREUNDER.
+
+# Distributions of NIST software should also include copyright and
+# licensing statements of any third-party software that are legally
+# bundled with the code in compliance with the conditions of those
+# licenses.
+
+import os
+import json
+import hashlib
+import tempfile
+from dill import dump, load, HIGHEST_PROTOCOL
+
+# Bumped whenever what is cached changes, so that entries written by
+# an older scorer are no longer found
+CACHE_VERSION = 1
+
+def file_content_hash(path, chunk_size = 1 << 20):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+
+    return h.hexdigest()
+
+# Parts are any JSON serializable values, e.g. content hashes and the
+# values of the options an entry depends on
+def cache_key(*parts):
+    return hashlib.sha256(json.dumps([ CACHE_VERSION ] + list(parts), sort_keys=True).encode("utf-8")).hexdigest()
+
+def cache_path(cache_dir, key):
+    return os.path.join(cache_dir, "{}.dill".format(key))
+
+# Returns None if there is no entry for key, or if it can't be read
+# back (e.g. truncated, or written by an incompatible version)
+def load_cached(cache_dir, key):
+    try:
+        with open(cache_path(cache_dir, key), 'rb') as f:
+            return load(f)
+    except Exception:
+        return None
+
+# Entries are written to a temporary file first and renamed, so that
+# concurrent runs sharing a cache directory never read a partial entry
+def store_cached(cache_dir, key, value):
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            dump(value, f, protocol=HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path(cache_dir, key))
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
@@ -0,0 +1,242 @@
+# interval_signal.py
+
+# This software was developed by employees of the National Institute of
+# Standards and Technology (NIST), an agency of the Federal
+# Government. Pursuant to title 17 United States Code Section 105, works
+# of NIST employees are not subject to copyright protection in the
+# United States and are considered to be in the public
+# domain. Permission to freely use, copy, modify, and distribute this
+# software and its documentation without fee is hereby granted, provided
+# that this notice and disclaimer of warranty appears in all copies.
+
+# THE SOFTWARE IS PROVIDED 'AS IS' WITHOUT ANY WARRANTY OF ANY KIND,
+# EITHER EXPRESSED, IMPLIED, OR STATUTORY, INCLUDING, BUT NOT LIMITED
+# TO, ANY WARRANTY THAT THE SOFTWARE WILL CONFORM TO SPECIFICATIONS, ANY
+# IMPLIED WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+# PURPOSE, AND FREEDOM FROM INFRINGEMENT, AND ANY WARRANTY THAT THE
+# DOCUMENTATION WILL CONFORM TO THE SOFTWARE, OR ANY WARRANTY THAT THE
+# SOFTWARE WILL BE ERROR FREE. IN NO EVENT SHALL NIST BE LIABLE FOR ANY
+# DAMAGES, INCLUDING, BUT NOT LIMITED TO, DIRECT, INDIRECT, SPECIAL OR
+# CONSEQUENTIAL DAMAGES, ARISING OUT OF, RESULTING FROM, OR IN ANY WAY
+# CONNECTED WITH THIS SOFTWARE, WHETHER OR NOT BASED UPON WARRANTY,
+# CONTRACT, TORT, OR OTHERWISE, WHETHER OR NOT INJURY WAS SUSTAINED BY
+# PERSONS OR PROPERTY OR OTHERWISE, AND WHETHER OR NOT LOSS WAS
+# SUSTAINED FROM, OR AROSE OUT OF THE RESULTS OF, OR USE OF, THE
+# SOFTWARE OR SERVICES PROVIDED HEREUNDER.
+
+# Distributions of NIST software should also include copyright and
+# licensing statements of any third-party software that are legally
+# bundled with the code in compliance with the conditions of those
+# licenses.
+
+import numpy as np
+
+from sparse_signal import SparseSignal
+
+# Array backed counterpart to SparseSignal for one dimensional
+# (temporal) signals.  The signal is stored as sorted, non-overlapping
+# half-open intervals [starts[i], ends[i]) carrying values[i]; zero
+# valued regions are not stored, and adjacent intervals with equal
+# values are always merged, so two equal signals have identical
+# arrays.  All joins are computed over the whole breakpoint set at
+# once with NumPy, rather than with a Python callback per breakpoint.
+#
+# As with SparseSignal.area(), a non-zero value after the last
+# breakpoint of an input dictionary is ignored.
+class IntervalSignal(object):
+    __slots__ = ("starts", "ends", "values")
+
+    def __init__(self, signal = None):
+        if signal is None or len(signal) == 0:
+            self._assign(*self._empty_arrays())
+        elif isinstance(signal, IntervalSignal):
+            self._assign(signal.starts, signal.ends, signal.values)
+        else:
+            # JSON localizations may still be keyed by strings
+            items = sorted((int(k) if isinstance(k, str) else k, v) for k, v in signal.items())
+            bounds = np.array([ k for k, v in items ])
+            values = np.array([ v for k, v in items ])
+            self._assign(*self._normalize_segments(bounds[:-1], bounds[1:], values[:-1]))
+
+    def _assign(self, starts, ends, values):
+        self.starts = starts
+        self.ends = ends
+        self.values = values
+
+    @staticmethod
+    def _empty_arrays():
+        return (np.empty(0, dtype = np.int64), np.empty(0, dtype = np.int64), np.empty(0, dtype = np.int64))
+
+    @classmethod
+    def _from_arrays(cls, starts, ends, values):
+        out = cls.__new__(cls)
+        out._assign(starts, ends, values)
+        return out
+
+    # Drops zero valued (and empty) segments, and merges touching
+    # segments with equal values.  Segments are assumed to be sorted
+    # and non-overlapping
+    @staticmethod
+    def _normalize_segments(lefts, rights, values):
+        keep = (values != 0) & (rights > lefts)
+        lefts, rights, values = lefts[keep], rights[keep], values[keep]
+        if len(lefts) == 0:
+            return IntervalSignal._empty_arrays()
+
+        new_run = np.ones(len(lefts), dtype = bool)
+        new_run[1:] = (lefts[1:] != rights[:-1]) | (values[1:] != values[:-1])
+        run_end = np.ones(len(lefts), dtype = bool)
+        run_end[:-1] = new_run[1:]
+
+        return (lefts[new_run], rights[run_end], values[new_run])
+
+    # Builds the sum of the given (possibly overlapping) intervals,
+    # each weighted by the corresponding entry of values (1 if not
+    # provided), with a single sweep over the sorted boundaries
+    @classmethod
+    def from_intervals(cls, starts, ends, values = None):
+        starts, ends = np.asarray(starts), np.asarray(ends)
+        if len(starts) == 0:
+            return cls()
+        if values is None:
+            values = np.ones(len(starts), dtype = np.int64)
+        else:
+            values = np.asarray(values)
+
+        points = np.concatenate((starts, ends))
+        deltas = np.concatenate((values, -values))
+        order = np.argsort(points, kind = "stable")
+        points, levels = points[order], np.cumsum(deltas[order])
+
+        # Only the level after the last event at a given point counts
+        last = np.ones(len(points), dtype = bool)
+        last[:-1] = points[1:] != points[:-1]
+        points, levels = points[last], levels[last]
+
+        return cls._from_arrays(*cls._normalize_segments(points[:-1], points[1:], levels[:-1]))
+
+    # Sums any number of signals in a single sweep, avoiding the
+    # quadratic cost of folding them together pairwise
+    @classmethod
+    def sum(cls, signals):
+        signals = [ s if isinstance(s, IntervalSignal) else cls(s) for s in signals ]
+        if len(signals) == 0:
+            return cls()
+
+        return cls.from_intervals(np.concatenate([ s.starts for s in signals ]),
+                                  np.concatenate([ s.ends for s in signals ]),
+                                  np.concatenate([ s.values for s in signals ]))
+
+    # Returns the signal value at each of the given points
+    def values_at(self, points):
+        if len(self.starts) == 0:
+            return np.zeros(len(points), dtype = self.values.dtype)
+        idx = np.searchsorted(self.starts, points, side = "right") - 1
+        safe_idx = np.maximum(idx, 0)
+        inside = (idx >= 0) & (points < self.ends[safe_idx])
+        return np.where(inside, self.values[safe_idx], 0)
+
+    def breakpoints(self):
+        return np.union1d(self.starts, self.ends)
+
+    def _join(self, other, op):
+        if not isinstance(other, IntervalSignal):
+            other = IntervalSignal(other)
+
+        bounds = np.union1d(self.breakpoints(), other.breakpoints())
+        if len(bounds) < 2:
+            return IntervalSignal()
+
+        lefts = bounds[:-1]
+        values = op(self.values_at(lefts), other.values_at(lefts))
+        return IntervalSignal._from_arrays(*self._normalize_segments(lefts, bounds[1:], values))
+
+    # Generic join with a Python join_func, provided for compatibility
+    # with callers expecting SparseSignal semantics (e.g. joining
+    # against object localizations).  Not vectorized; returns a
+    # SparseSignal
+    def join(self, other, join_func, default = 0):
+        return self.to_sparse_signal().join(other, join_func, default)
+
+    def __add__(self, other):
+        return self._join(other, np.add)
+
+    def __and__(self, other):
+        return self._join(other, np.minimum)
+
+    def __or__(self, other):
+        return self._join(other, np.maximum)
+
+    def __sub__(self, other):
+        return self._join(other, lambda a, b: a - np.minimum(a, b))
+
+    def __eq__(self, other):
+        if not isinstance(other, IntervalSignal):
+            if not isinstance(other, dict):
+                return NotImplemented
+            other = IntervalSignal(other)
+
+        return np.array_equal(self.starts, other.starts) and np.array_equal(self.ends, other.ends) and np.array_equal(self.values, other.values)
+
+    __hash__ = None
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __repr__(self):
+        return "IntervalSignal({})".format(dict(self.to_sparse_signal()))
+
+    def __getstate__(self):
+        return (self.starts, self.ends, self.values)
+
+    def __setstate__(self, state):
+        self._assign(*state)
+
+    # Signals are always stored normalized
+    def normalize(self):
+        return self
+
+    def area(self):
+        return ((self.ends - self.starts) * self.values).sum().item()
+
+    def not_sig(self, framecnt):
+        if len(self.starts) == 0:
+            return IntervalSignal({0: 1, framecnt: 0})
+
+        # Support of the signal, regardless of value
+        new_run = np.ones(len(self.starts), dtype = bool)
+        new_run[1:] = self.starts[1:] != self.ends[:-1]
+        run_end = np.ones(len(self.starts), dtype = bool)
+        run_end[:-1] = new_run[1:]
+
+        gap_starts = np.maximum(np.concatenate(([0], self.ends[run_end])), 0)
+        gap_ends = np.minimum(np.concatenate((self.starts[new_run], [framecnt])), framecnt)
+        gap_values = np.ones(len(gap_starts), dtype = np.int64)
+
+        return IntervalSignal._from_arrays(*self._normalize_segments(gap_starts, gap_ends, gap_values))
+
+    # The collar is the union of [b - size, b + size) over each
+    # breakpoint b of the signal.  As every collar interval has the
+    # same width, the sorted interval starts and ends are both
+    # monotonic, so overlapping intervals can be merged in one pass
+    def generate_collar(self, size):
+        points = self.breakpoints()
+        if len(points) == 0 or size <= 0:
+            return IntervalSignal()
+
+        lefts, rights = points - size, points + size
+        new_run = np.ones(len(points), dtype = bool)
+        new_run[1:] = lefts[1:] > rights[:-1]
+        run_end = np.ones(len(points), dtype = bool)
+        run_end[:-1] = new_run[1:]
+
+        starts = lefts[new_run]
+        return IntervalSignal._from_arrays(starts, rights[run_end], np.ones(len(starts), dtype = np.int64))
+
+    def to_sparse_signal(self):
+        out_signal = SparseSignal()
+        for start, end, value in zip(self.starts.tolist(), self.ends.tolist(), self.values.tolist()):
+            out_signal[start] = value
+            out_signal[end] = 0
+
+        return out_signal
@@ -0,0 +1,116 @@
+# json_stream.py
+
+# This software was developed by employees of the National Institute of
+# Standards and Technology (NIST), an agency of the Federal
+# Government. Pursuant to title 17 United States Code Section 105, works
+# of NIST employees are not subject to copyright protection in the
+# United States and are considered to be in the public
+# domain. Permission to freely use, copy, modify, and distribute this
+# software and its documentation without fee is hereby granted, provided
+# that this notice and disclaimer of warranty appears in all copies.
+
+# THE SOFTWARE IS PROVIDED 'AS IS' WITHOUT ANY WARRANTY OF ANY KIND,
+# EITHER EXPRESSED, IMPLIED, OR STATUTORY, INCLUDING, BUT NOT LIMITED
+# TO, ANY WARRANTY THAT THE SOFTWARE WILL CONFORM TO SPECIFICATIONS, ANY
+# IMPLIED WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+# PURPOSE, AND FREEDOM FROM INFRINGEMENT, AND ANY WARRANTY THAT THE
+# DOCUMENTATION WILL CONFORM TO THE SOFTWARE, OR ANY WARRANTY THAT THE
+# SOFTWARE WILL BE ERROR FREE. IN NO EVENT SHALL NIST BE LIABLE FOR ANY
+# DAMAGES, INCLUDING, BUT NOT LIMITED TO, DIRECT, INDIRECT, SPECIAL OR
+# CONSEQUENTIAL DAMAGES, ARISING OUT OF, RESULTING FROM, OR IN ANY WAY
+# CONNECTED WITH THIS SOFTWARE, WHETHER OR NOT BASED UPON WARRANTY,
+# CONTRACT, TORT, OR OTHERWISE, WHETHER OR NOT INJURY WAS SUSTAINED BY
+# PERSONS OR PROPERTY OR OTHERWISE, AND WHETHER OR NOT LOSS WAS
+# SUSTAINED FROM, OR AROSE OUT OF THE RESULTS OF, OR USE OF, THE
+# SOFTWARE OR SERVICES PROVIDED HEREUNDER.
+
+# Distributions of NIST software should also include copyright and
+# licensing statements of any third-party software that are legally
+# bundled with the code in compliance with the conditions of those
+# licenses.
+
+
+import re
+import json
+
+_whitespace = re.compile(r"[ \t\n\r]*")
+_number_chars = re.compile(r"[0-9.eE+-]*")
+
+# Incrementally reads a JSON document whose top level is an object,
+# yielding the elements of its top level array member key one at a
+# time, so that the whole array never has to be held in memory.  The
+# other top level members are decoded as usual and stored in header
+# as they are read, with an empty list standing in for the streamed
+# array; header is complete once the generator is exhausted.
+#
+# Values are decoded with the standard JSON decoder from a buffer
+# holding the not yet consumed part of the file.  When a value runs
+# past the end of the buffer, more of the file is read, doubling the
+# amount read each time, and decoding is retried
+def iter_json_array(fp, key, header, chunk_size = 1 << 20):
+    decoder = json.JSONDecoder()
+    buf, pos, eof = "", 0, False
+
+    def _fill(size):
+        nonlocal buf, pos, eof
+        chunk = fp.read(size)
+        if chunk == "":
+            eof = True
+            return False
+        buf, pos = buf[pos:] + chunk, 0
+        return True
+
+    def _peek():
+        nonlocal pos
+        while True:
+            pos = _whitespace.match(buf, pos).end()
+            if pos < len(buf):
+                return buf[pos]
+            if not _fill(chunk_size):
+                raise ValueError("Unexpected end of JSON document")
+
+    def _expect(chars):
+        nonlocal pos
+        c = _peek()
+        if c not in chars:
+            raise ValueError("Expected one of '{}' at '{}'".format(chars, buf[pos:pos + 32]))
+        pos += 1
+        return c
+
+    def _value():
+        nonlocal pos
+        _peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+                # A number may go on past the end of the buffer
+                if eof or not (isinstance(value, (int, float)) and _number_chars.fullmatch(buf, end)):
+                    pos = end
+                    return value
+            except ValueError:
+                if eof:
+                    raise
+            _fill(max(chunk_size, len(buf) - pos))
+
+    _expect("{")
+    if _peek() == "}":
+        return
+
+    while True:
+        member = _value()
+        _expect(":")
+        if member == key:
+            header[key] = []
+            _expect("[")
+            if _peek() == "]":
+                pos += 1
+            else:
+                while True:
+                    yield _value()
+                    if _expect(",]") == "]":
+                        break
+        else:
+            header[member] = _value()
+
+        if _expect(",}") == "}":
+            return
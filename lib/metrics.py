@@ -30,12 +30,47 @@
 # bundled with the code in compliance with the conditions of those
 # licenses.
 
+import os
+import heapq
 import numpy as np
+from collections import namedtuple
 from operator import add
 from sparse_signal import SparseSignal as S
+from interval_signal import IntervalSignal
 from alignment_record import *
 from helpers import *
 from functools import reduce
+from itertools import accumulate
+
+
+# Temporal signals can be built either as dictionary based
+# SparseSignals (the reference implementation) or as array based
+# IntervalSignals.  The engine is kept in the environment as well so
+# that worker processes started after the switch pick it up
+SIGNAL_ENGINES = {"sparse": S, "interval": IntervalSignal}
+_signal_engine = os.environ.get("ACTEV_SIGNAL_ENGINE", "sparse")
+
+
+def set_signal_engine(name):
+    global _signal_engine
+    if name not in SIGNAL_ENGINES:
+        raise ValueError("Unknown signal engine '{}'".format(name))
+    _signal_engine = name
+    os.environ["ACTEV_SIGNAL_ENGINE"] = name
+
+
+def get_signal_engine():
+    return _signal_engine
+
+
+def build_signal(*args):
+    return SIGNAL_ENGINES[_signal_engine](*args)
+
+
+def sum_signals(signals):
+    if _signal_engine == "interval":
+        return IntervalSignal.sum(signals)
+    return reduce(add, signals, S())
 
 
 def _signal_pairs(r, s, signal_accessor, key_join_op=set.union):
@@ -45,7 +80,7 @@ def _signal_pairs(r, s, signal_accessor, key_join_op=set.union):
 
 
 def _temporal_signal_accessor(localization, k):
-    return S(localization.get(k, {}))
+    return build_signal(localization.get(k, {}))
 
 
 def temporal_signal_pairs(r, s, key_join_op=set.union):
@@ -103,6 +138,237 @@ def temporal_intersection_over_union(r, s):
     return float(intersection) / union if union != 0 else 0.0
 
 
+# Non zero (start, end, value) segments of a temporal signal, read
+# directly off the signal to avoid building an IntervalSignal for each
+# of many small localizations
+def _signal_segments(signal):
+    if isinstance(signal, IntervalSignal):
+        return list(zip(signal.starts.tolist(), signal.ends.tolist(),
+                        signal.values.tolist()))
+
+    # JSON localizations may still be keyed by strings
+    items = sorted((int(k) if isinstance(k, str) else k, v)
+                   for k, v in signal.items())
+    return [(k0, k1, v) for (k0, v), (k1, _) in zip(items, items[1:])
+            if v != 0 and k1 > k0]
+
+
+def _instance_segments(instances, file_ids):
+    owners, files, starts, ends, values, areas = [], [], [], [], [], []
+    for i, inst in enumerate(instances):
+        area = 0
+        for k, v in inst.localization.items():
+            file_id = file_ids.setdefault(k, len(file_ids))
+            for start, end, value in _signal_segments(v):
+                owners.append(i)
+                files.append(file_id)
+                starts.append(start)
+                ends.append(end)
+                values.append(value)
+                area += (end - start) * value
+        areas.append(area)
+
+    def _array(items):
+        if len(items) == 0:
+            return np.empty(0, dtype=np.int64)
+        return np.array(items)
+
+    return (_array(owners), _array(files), _array(starts), _array(ends),
+            _array(values), np.array(areas))
+
+
+def _sum_by_owner(matrix, owners, size, axis):
+    shape = list(matrix.shape)
+    shape[axis] = size
+    out = np.zeros(shape, dtype=matrix.dtype)
+    if matrix.shape[axis] == 0:
+        return out
+    # Segments of an instance are contiguous, owners are sorted
+    uniq, first = np.unique(owners, return_index=True)
+    summed = np.add.reduceat(matrix, first, axis=axis)
+    if axis == 0:
+        out[uniq, :] = summed
+    else:
+        out[:, uniq] = summed
+    return out
+
+
+# Computes temporal_intersection, temporal_union and
+# temporal_intersection_over_union for every (sys, ref) pair of a
+# cohort in one vectorized pass.  The returned matrices are indexed
+# [sys_index][ref_index], matching the similarity matrix layout of
+# perform_alignment.  Segment overlaps are computed in blocks of
+# reference segments to bound memory use
+def temporal_overlap_matrices(refs, syss, block_size=1 << 22):
+    file_ids = {}
+    r_own, r_file, r_start, r_end, r_val, r_area = _instance_segments(
+        refs, file_ids)
+    s_own, s_file, s_start, s_end, s_val, s_area = _instance_segments(
+        syss, file_ids)
+
+    intersection = np.zeros((len(refs), len(syss)),
+                            dtype=np.result_type(r_val, s_val))
+    rows = max(1, block_size // max(1, len(s_start)))
+    for i in range(0, len(r_start), rows):
+        b = slice(i, i + rows)
+        overlap = np.minimum(r_end[b, None], s_end[None, :]) - \
+            np.maximum(r_start[b, None], s_start[None, :])
+        overlap = np.where(
+            (overlap > 0) & (r_file[b, None] == s_file[None, :]),
+            overlap * np.minimum(r_val[b, None], s_val[None, :]), 0)
+        by_sys = _sum_by_owner(overlap, s_own, len(syss), 1)
+        intersection += _sum_by_owner(by_sys, r_own[b], len(refs), 0)
+
+    intersection = intersection.T
+    # Pointwise, max(a, b) == a + b - min(a, b)
+    union = s_area[:, None] + r_area[None, :] - intersection \
+        if len(refs) > 0 and len(syss) > 0 else \
+        np.zeros((len(syss), len(refs)), dtype=intersection.dtype)
+    iou = np.divide(intersection, union,
+                    out=np.zeros(union.shape, dtype=float),
+                    where=union != 0)
+
+    return intersection, union, iou
+
+
+# Computes the temporal_intersection of each (ref, sys) pair of a list
+# in one vectorized pass, along with the temporal area of both sides.
+# Only the segments of the two instances of a pair are crossed
+def temporal_pair_overlaps(pairs):
+    index = {}
+    instances = []
+    def _index(inst):
+        if id(inst) not in index:
+            index[id(inst)] = len(instances)
+            instances.append(inst)
+        return index[id(inst)]
+
+    r_idx = np.array([_index(r) for r, _ in pairs], dtype=np.int64)
+    s_idx = np.array([_index(s) for _, s in pairs], dtype=np.int64)
+    owners, files, starts, ends, values, areas = _instance_segments(instances, {})
+
+    counts = np.bincount(owners, minlength=len(instances))
+    offsets = np.concatenate(([0], np.cumsum(counts)[:-1])).astype(np.int64)
+    r_cnt, s_cnt = counts[r_idx], counts[s_idx]
+    combos = r_cnt * s_cnt
+    pair_of = np.repeat(np.arange(len(pairs)), combos)
+    k = np.arange(len(pair_of)) - np.repeat(np.cumsum(combos) - combos, combos)
+    ri = offsets[r_idx][pair_of] + k // s_cnt[pair_of]
+    si = offsets[s_idx][pair_of] + k % s_cnt[pair_of]
+
+    overlap = np.minimum(ends[ri], ends[si]) - np.maximum(starts[ri], starts[si])
+    overlap = np.where((overlap > 0) & (files[ri] == files[si]),
+                       overlap * np.minimum(values[ri], values[si]), 0)
+    intersection = np.zeros(len(pairs), dtype=overlap.dtype)
+    np.add.at(intersection, pair_of, overlap)
+
+    return (intersection, areas[r_idx], areas[s_idx])
+
+
+def _cached_pair_overlaps(pairs, cache):
+    if cache is None:
+        return temporal_pair_overlaps(pairs)
+    if "temporal_pair_overlaps" not in cache:
+        cache["temporal_pair_overlaps"] = temporal_pair_overlaps(pairs)
+    return cache["temporal_pair_overlaps"]
+
+
+# Batched forms of the pair measures above, taking a list of (r, s)
+# pairs; areas are additive so each follows from the intersection.
+# As with kernel components, measures computed over the same pairs
+# can share a cache, so that the overlaps are only computed once
+temporal_intersection.batch = \
+    lambda pairs, cache=None: _cached_pair_overlaps(pairs, cache)[0].tolist()
+temporal_union.batch = \
+    lambda pairs, cache=None: (lambda i, r, s: r + s - i)(*_cached_pair_overlaps(pairs, cache)).tolist()
+temporal_fa.batch = \
+    lambda pairs, cache=None: (lambda i, r, s: s - i)(*_cached_pair_overlaps(pairs, cache)).tolist()
+temporal_miss.batch = \
+    lambda pairs, cache=None: (lambda i, r, s: r - i)(*_cached_pair_overlaps(pairs, cache)).tolist()
+
+
+def _temporal_extents(instances):
+    extents = {}
+    for i, inst in enumerate(instances):
+        for k, v in inst.localization.items():
+            segments = _signal_segments(v)
+            if len(segments) > 0:
+                extents.setdefault(k, []).append(
+                    (segments[0][0], segments[-1][1], i))
+    return extents
+
+
+# Returns the set of (sys_index, ref_index) pairs whose temporal
+# extents overlap on some file, i.e. every pair that can have a non
+# zero temporal_intersection.  Extents are swept in order of their
+# start, keeping the extents still open on each side in a heap keyed
+# by their end, so only overlapping pairs are ever visited
+def temporal_candidate_pairs(refs, syss):
+    ref_extents = _temporal_extents(refs)
+    sys_extents = _temporal_extents(syss)
+
+    pairs = set()
+    for k in ref_extents.keys() & sys_extents.keys():
+        events = sorted([(start, end, i, 0) for start, end, i in
+                         ref_extents[k]] +
+                        [(start, end, i, 1) for start, end, i in
+                         sys_extents[k]])
+        open_extents = ([], [])
+        for start, end, i, side in events:
+            for heap in open_extents:
+                while len(heap) > 0 and heap[0][0] <= start:
+                    heapq.heappop(heap)
+            if side == 0:
+                pairs.update((s_i, i) for _, s_i in open_extents[1])
+            else:
+                pairs.update((i, r_i) for _, r_i in open_extents[0])
+            heapq.heappush(open_extents[side], (end, i))
+
+    return pairs
+
+
+# Splits a cohort at the gaps no instance spans, returning (refs,
+# syss) sub-cohorts such that instances of different sub-cohorts never
+# temporally intersect.  Instances with an empty localization can't
+# intersect anything and are put together in a last sub-cohort
+def temporal_windows(refs, syss):
+    instances = [(0, i) for i in range(len(refs))] + \
+        [(1, i) for i in range(len(syss))]
+    extents = _temporal_extents([refs[i] if side == 0 else syss[i]
+                                 for side, i in instances])
+
+    # Extents of a file are merged into windows in order of their
+    # start; an instance found in several windows (of several files)
+    # joins them together
+    parent = list(range(len(instances)))
+    def _find(n):
+        while parent[n] != n:
+            parent[n] = parent[parent[n]]
+            n = parent[n]
+        return n
+
+    localized = set()
+    for k, file_extents in extents.items():
+        window_end, window_root = None, None
+        for start, end, n in sorted(file_extents):
+            localized.add(n)
+            if window_end is not None and start < window_end:
+                parent[_find(n)] = _find(window_root)
+                window_end = max(window_end, end)
+            else:
+                window_end, window_root = end, _find(n)
+
+    windows = {}
+    for n, (side, i) in enumerate(instances):
+        root = _find(n) if n in localized else None
+        windows.setdefault(root, ([], []))[side].append(
+            refs[i] if side == 0 else syss[i])
+
+    unlocalized = windows.pop(None, None)
+    return list(windows.values()) + \
+        ([unlocalized] if unlocalized is not None else [])
+
+
 def _spatial_signal_accessor(localization, k):
     if k in localization:
         return localization.get(k).spatial_signal
@@ -131,6 +397,50 @@ def simple_spatial_intersection_over_union(r, s):
     return float(intersection) / union if union != 0 else 0.0
 
 
+# Closed form equivalents of the simple_spatial_* functions above
+# for axis-aligned (x, y, w, h) bounding boxes; None is an empty box
+def bounding_box_intersection(r, s):
+    if r is None or s is None:
+        return 0
+
+    w = min(r[0] + r[2], s[0] + s[2]) - max(r[0], s[0])
+    h = min(r[1] + r[3], s[1] + s[3]) - max(r[1], s[1])
+    return w * h if w > 0 and h > 0 else 0
+
+
+def bounding_box_area(b):
+    return 0 if b is None else b[2] * b[3]
+
+
+def bounding_box_intersection_over_union(r, s):
+    intersection = bounding_box_intersection(r, s)
+    union = bounding_box_area(r) + bounding_box_area(s) - intersection
+
+    return float(intersection) / union if union != 0 else 0.0
+
+
+def _bounding_box_array(boxes):
+    return np.array([b if b is not None else (0, 0, 0, 0) for b in boxes]).reshape(len(boxes), 4)
+
+
+# Bounding box IoU for every (sys, ref) pair, indexed
+# [sys_index][ref_index]
+def bounding_box_intersection_over_union_matrix(ref_boxes, sys_boxes):
+    r = _bounding_box_array(ref_boxes)
+    s = _bounding_box_array(sys_boxes)
+
+    w = np.minimum(s[:, None, 0] + s[:, None, 2], r[None, :, 0] + r[None, :, 2]) - \
+        np.maximum(s[:, None, 0], r[None, :, 0])
+    h = np.minimum(s[:, None, 1] + s[:, None, 3], r[None, :, 1] + r[None, :, 3]) - \
+        np.maximum(s[:, None, 1], r[None, :, 1])
+    intersection = np.where((w > 0) & (h > 0), w * h, 0)
+    union = (s[:, 2] * s[:, 3])[:, None] + (r[:, 2] * r[:, 3])[None, :] - intersection
+
+    return np.divide(intersection, union,
+                     out=np.zeros(union.shape, dtype=float),
+                     where=union != 0)
+
+
 def spatial_intersection(r, s):
     return reduce(
         add, [simple_spatial_intersection(r, s) for
@@ -280,10 +590,56 @@ def get_auc(tfa_pmiss, typ, threshold=[1, 0.2, 0.15, 0.1, 0.03, 0.01]):
     return auc
 
 
+# No-score collar around a reference signal, along with the collared
+# reference signal and the areas n_mide needs from it.  These only
+# depend on the reference, so can be computed once per reference
+# instance and localization key
+def ns_collar_signals(rs, ns_collar_size):
+    ns_collar = rs.generate_collar(ns_collar_size)
+    c_r = rs - ns_collar
+    col_r = rs | ns_collar
+    return (ns_collar, c_r, c_r.area(), col_r.area())
+
+
+# Cost of a single aligned (reference, system) pair as used in n_mide;
+# None if the pair has a zero miss or false alarm denominator
+def n_mide_pair(r, s, file_framedur_lookup, ns_collar_size, cost_fn_miss,
+                cost_fn_fa, collar_cache=None):
+    def _collar_signals(rs, k):
+        if collar_cache is None:
+            return ns_collar_signals(rs, ns_collar_size)
+
+        if (r, k) not in collar_cache:
+            collar_cache[(r, k)] = ns_collar_signals(rs, ns_collar_size)
+        return collar_cache[(r, k)]
+
+    def _sub_reducer(init, pair):
+        init_miss, init_fa, init_miss_d, init_fa_d = init
+        rs, ss, k = pair
+        ns_collar, c_r, c_r_area, col_r_area = _collar_signals(rs, k)
+        c_s = ss - ns_collar
+        miss = (c_r - c_s).area()
+        fa = (c_s - c_r).area()
+        return (init_miss + miss, init_fa + fa, init_miss_d + c_r_area,
+                init_fa_d + (file_framedur_lookup.get(k) - col_r_area))
+
+    # Using the _sub_reducer here is important in the case of
+    # cross-file activity instances
+    miss, fa, miss_denom, fa_denom = reduce(
+        _sub_reducer, temporal_signal_pairs(r, s), (0, 0, 0, 0))
+    if miss_denom > 0 and fa_denom > 0:
+        return (cost_fn_miss(float(miss) / miss_denom) +
+                cost_fn_fa(float(fa) / fa_denom))
+    else:
+        return None
+
+
 # aligned_pairs should be a list of tuples being (reference, system);
-# where reference and system are each ActivityInstance objects
+# where reference and system are each ActivityInstance objects.  If
+# given, collar_cache is a dict used to keep the reference collar
+# signals across calls (e.g. across confidence thresholds)
 def n_mide(aligned_pairs, file_framedur_lookup, ns_collar_size, cost_fn_miss,
-           cost_fn_fa):
+           cost_fn_fa, collar_cache=None):
     # Should consider another paramemter for for all files to consider
     # for FA denominator calculation, in the case of cross-file
     # activity instances
@@ -293,27 +649,12 @@ def n_mide(aligned_pairs, file_framedur_lookup, ns_collar_size, cost_fn_miss,
         return {"n-mide": None,
                 "n-mide_num_rejected": 0}
 
-    def _sub_reducer(init, pair):
-        init_miss, init_fa, init_miss_d, init_fa_d = init
-        rs, ss, k = pair
-        ns_collar = rs.generate_collar(ns_collar_size)
-        c_r = rs - ns_collar
-        c_s = ss - ns_collar
-        col_r = rs | ns_collar
-        miss = (c_r - c_s).area()
-        fa = (c_s - c_r).area()
-        return (init_miss + miss, init_fa + fa, init_miss_d + c_r.area(),
-                init_fa_d + (file_framedur_lookup.get(k) - col_r.area()))
-
     def _reducer(init, pair):
         r, s = pair
-        # Using the _sub_reducer here is important in the case of
-        # cross-file activity instances
-        miss, fa, miss_denom, fa_denom = reduce(
-            _sub_reducer, temporal_signal_pairs(r, s), (0, 0, 0, 0))
-        if miss_denom > 0 and fa_denom > 0:
-            init.append(cost_fn_miss(float(miss) / miss_denom) +
-                        cost_fn_fa(float(fa) / fa_denom))
+        mide = n_mide_pair(r, s, file_framedur_lookup, ns_collar_size,
+                           cost_fn_miss, cost_fn_fa, collar_cache)
+        if mide is not None:
+            init.append(mide)
         return init
 
     mides = reduce(_reducer, aligned_pairs, [])
@@ -325,6 +666,30 @@ def n_mide(aligned_pairs, file_framedur_lookup, ns_collar_size, cost_fn_miss,
                 "n-mide_num_rejected": len(aligned_pairs) - len(mides)}
 
 
+# n_mide over each of the leading aligned_pairs[:n] for n in
+# num_aligned.  A pair's contribution doesn't depend on the other
+# pairs, so each is computed once and accumulated in order; the
+# results are the same as calling n_mide on each prefix
+def n_mide_by_count(aligned_pairs, num_aligned, file_framedur_lookup,
+                    ns_collar_size, cost_fn_miss, cost_fn_fa,
+                    collar_cache=None):
+    num_pairs = max(num_aligned, default=0)
+    sums, counts = [None], [0]
+    for r, s in aligned_pairs[:num_pairs]:
+        mide = n_mide_pair(r, s, file_framedur_lookup, ns_collar_size,
+                           cost_fn_miss, cost_fn_fa, collar_cache)
+        if mide is None:
+            sums.append(sums[-1])
+            counts.append(counts[-1])
+        else:
+            sums.append(mide if sums[-1] is None else sums[-1] + mide)
+            counts.append(counts[-1] + 1)
+
+    return {"n-mide": [None if counts[n] == 0 else
+                       float(sums[n]) / counts[n] for n in num_aligned],
+            "n-mide_num_rejected": [n - counts[n] for n in num_aligned]}
+
+
 def special_join(signals):
     if len(signals) == 1:
         return signals[0][0]
@@ -341,7 +706,7 @@ def special_join(signals):
                 s2 = pair[1][0]
             else:
                 s2 = pair[1]
-            init.append(s1.join(s2, add))
+            init.append(s1 + s2)
         return init
     while len(signals) != 1:
         gr_sig = [signals[i * 2:(i + 1) * 2] for
@@ -436,12 +801,168 @@ def fa_meas(ref_sig, sys_sig, sys_sig_add):
             "NR_Ref_Sig": NR_Ref_Sig}
 
 
+def fa_signal_snapshots(ref_sig, system_sig):
+    ref_temp_add_all, not_ref_all = ref_sig[0], ref_sig[1]
+    return {"System_Sig": {k: system_sig[k] for k in ref_temp_add_all},
+            "Ref_Sig": {k: v for k, v in ref_temp_add_all.items()},
+            "NR_Ref_Sig": {k: not_ref_all[k] for k in ref_temp_add_all}}
+
+
+# Correct detection and false alarm records in the order they enter
+# the sweep, along with the number admitted at each threshold
+def _admission_order(sweep):
+    order, counts = [], []
+    last_c, last_f = 0, 0
+    for num_c, num_f in zip(sweep.num_c.tolist(), sweep.num_f.tolist()):
+        order.extend(sweep.c[last_c:num_c])
+        order.extend(sweep.f[last_f:num_f])
+        last_c, last_f = num_c, num_f
+        counts.append(len(order))
+
+    return order, counts
+
+
+def _tfa_by_count(numer, denom_sum):
+    return {"tfa": [None if denom_sum == 0 else float(n) / denom_sum
+                    for n in numer],
+            "tfa_denom": [denom_sum] * len(numer),
+            "tfa_numer": numer}
+
+
+# Area of (sum(sys_signals[:n]) - ref_signal) for n in 0 ..
+# len(sys_signals).  The running system coverage of the file is kept
+# over the elementary segments of all signals, so each system signal
+# only updates the segments it spans
+def _excess_coverage_by_count(ref_signal, sys_signals):
+    ref = IntervalSignal(ref_signal)
+    syss = [IntervalSignal(sig) for sig in sys_signals]
+    bounds = np.unique(np.concatenate(
+        [ref.breakpoints()] + [sig.breakpoints() for sig in syss]))
+    if len(bounds) < 2:
+        return [0] * (len(syss) + 1)
+
+    seg_len = np.diff(bounds)
+    ref_cov = ref.values_at(bounds[:-1])
+    sys_cov = np.zeros(len(seg_len), dtype=np.result_type(
+        ref_cov, *[sig.values for sig in syss]))
+
+    total, out = 0, [0]
+    for sig in syss:
+        for start, end, value in zip(sig.starts.tolist(), sig.ends.tolist(),
+                                     sig.values.tolist()):
+            lo, hi = np.searchsorted(bounds, [start, end])
+            before = np.maximum(sys_cov[lo:hi] - ref_cov[lo:hi], 0)
+            sys_cov[lo:hi] += value
+            after = np.maximum(sys_cov[lo:hi] - ref_cov[lo:hi], 0)
+            total += (seg_len[lo:hi] * (after - before)).sum().item()
+        out.append(total)
+
+    return out
+
+
+# fa_meas for every threshold of a DETSweep.  Each admitted system
+# instance adds its own intersection with the non-reference region
+# of its file to the numerator
+def fa_meas_by_count(ref_sig, sweep):
+    not_ref_all, nr_area_all = ref_sig[1], ref_sig[2]
+    order, counts = _admission_order(sweep)
+
+    def _contribution(ar):
+        if ar.video_file not in not_ref_all:
+            return 0
+        return (not_ref_all[ar.video_file] &
+                temporal_single_signal(ar.sys)[0]).area()
+
+    numer = [0]
+    for ar in order:
+        numer.append(numer[-1] + _contribution(ar))
+
+    return _tfa_by_count([numer[n] for n in counts],
+                         sum(nr_area_all.values()))
+
+
+# fa_meas_v2 for every threshold of a DETSweep, keeping a running
+# system coverage per file.  Each admitted system instance adds the
+# growth of its file's excess coverage to the numerator
+def fa_meas_v2_by_count(ref_sig, sweep):
+    ref_temp_add_all, nr_area_all = ref_sig[0], ref_sig[2]
+    order, counts = _admission_order(sweep)
+
+    positions_by_file = group_by_func(lambda i: order[i].video_file,
+                                      range(len(order)))
+    added = [0] * len(order)
+    for key, ref_temp_add in ref_temp_add_all.items():
+        positions = positions_by_file.get(key, [])
+        excess = _excess_coverage_by_count(
+            ref_temp_add,
+            [temporal_single_signal(order[i].sys)[0] for i in positions])
+        for i, before, after in zip(positions, excess, excess[1:]):
+            added[i] = after - before
+
+    numer = [0] + list(accumulate(added))
+    return _tfa_by_count([numer[n] for n in counts],
+                         sum(nr_area_all.values()))
+
+
+# TFA measures for build_sweeper, called with the reference signals
+# and the per file system signals at each threshold.  Their
+# incremental forms take the reference signals and a DETSweep, and
+# the signal maps reported alongside the TFA values are built
+# separately by their 'snapshots' function
+def build_fa_meas_measure():
+    def _fa_meas(ref_sig, sys_sig, sys_sig_add):
+        return fa_meas(ref_sig, sys_sig, sys_sig_add)
+
+    def _snapshots(ref_sig, sys_sig, sys_sig_add):
+        return fa_signal_snapshots(ref_sig, sys_sig)
+
+    _fa_meas.incremental = fa_meas_by_count
+    _fa_meas.snapshots = _snapshots
+    return _fa_meas
+
+
+def build_fa_meas_v2_measure():
+    def _fa_meas(ref_sig, sys_sig, sys_sig_add):
+        return fa_meas_v2(ref_sig, sys_sig, sys_sig_add)
+
+    def _snapshots(ref_sig, sys_sig, sys_sig_add):
+        return fa_signal_snapshots(ref_sig, sys_sig_add)
+
+    _fa_meas.incremental = fa_meas_v2_by_count
+    _fa_meas.snapshots = _snapshots
+    return _fa_meas
+
+
 def build_n_mide_metric(file_frame_dur_lookup, ns_collar_size,
                         cost_fn_miss=lambda x: 1 * x,
                         cost_fn_fa=lambda x: 1 * x):
+    collar_cache = {}
+
     def _n_mide(pairs):
         return n_mide(pairs, file_frame_dur_lookup, ns_collar_size,
-                      cost_fn_miss, cost_fn_fa)
+                      cost_fn_miss, cost_fn_fa, collar_cache)
+    return _n_mide
+
+
+# n_mide as a DET sweep measure over the correct detection alignment
+# records
+def build_alignment_n_mide_measure(file_frame_dur_lookup, ns_collar_size,
+                                   cost_fn_miss=lambda x: 1 * x,
+                                   cost_fn_fa=lambda x: 1 * x):
+    # Reference no-score collars are shared across thresholds
+    collar_cache = {}
+
+    def _n_mide(c, m, f):
+        return n_mide([(ar.ref, ar.sys) for ar in c], file_frame_dur_lookup,
+                      ns_collar_size, cost_fn_miss, cost_fn_fa, collar_cache)
+
+    def _n_mide_incremental(sweep):
+        return n_mide_by_count([(ar.ref, ar.sys) for ar in sweep.c],
+                               sweep.num_c.tolist(), file_frame_dur_lookup,
+                               ns_collar_size, cost_fn_miss, cost_fn_fa,
+                               collar_cache)
+
+    _n_mide.incremental = _n_mide_incremental
     return _n_mide
 
 
@@ -471,15 +992,37 @@ def p_miss(num_c, num_m, num_f):
         return float(num_m) / denom
 
 
+# Divides numerator by denominator elementwise, returning a list with
+# None wherever the (count based) mask is False
+def _masked_ratios(numerator, denominator, mask):
+    ratios = np.divide(numerator, denominator,
+                       out=np.zeros(len(mask), dtype=float), where=mask)
+    return [r if ok else None for r, ok in zip(ratios.tolist(), mask)]
+
+
 def build_pmiss_metric():
     def _p_miss(c, m, f):
         return {"p_miss": p_miss(len(c), len(m), len(f))}
+
+    def _p_miss_incremental(sweep):
+        return {"p_miss": _masked_ratios(sweep.num_m * 1.0,
+                                         sweep.num_m + sweep.num_c,
+                                         sweep.num_m + sweep.num_c != 0)}
+
+    _p_miss.incremental = _p_miss_incremental
     return _p_miss
 
 
 def build_wpmiss_metric(denom, numer):
     def _w_p_miss(c, m, f):
         return {"w_p_miss": w_p_miss(len(c), len(m), len(f), denom, numer)}
+
+    def _w_p_miss_incremental(sweep):
+        return {"w_p_miss": _masked_ratios((sweep.num_m + numer) * 1.0,
+                                           sweep.num_m + sweep.num_c + denom,
+                                           sweep.num_m + sweep.num_c != 0)}
+
+    _w_p_miss.incremental = _w_p_miss_incremental
     return _w_p_miss
 
 
@@ -490,6 +1033,11 @@ def r_fa(num_c, num_m, num_f, denominator):
 def build_rfa_metric(denom):
     def _r_fa(c, m, f):
         return {"rfa": r_fa(len(c), len(m), len(f), denom)}
+
+    def _r_fa_incremental(sweep):
+        return {"rfa": (sweep.num_f * 1.0 / denom).tolist()}
+
+    _r_fa.incremental = _r_fa_incremental
     return _r_fa
 
 
@@ -578,6 +1126,15 @@ def build_mode_metric(cost_fn_m=lambda x: 1 * x, cost_fn_f=lambda x: 1 * x):
         value = mode(num_c, num_m, num_f, cost_fn_m, cost_fn_f) if \
             num_m + num_c > 0 else None
         return {"mode": value}
+
+    def _mode_incremental(sweep):
+        return {"mode": [mode(num_c, num_m, num_f, cost_fn_m, cost_fn_f) if
+                         num_m + num_c > 0 else None for
+                         num_c, num_m, num_f in
+                         zip(sweep.num_c.tolist(), sweep.num_m.tolist(),
+                             sweep.num_f.tolist())]}
+
+    _mode.incremental = _mode_incremental
     return _mode
 
 
@@ -616,6 +1173,54 @@ def build_mote_metric(frame_correct_align, conf_func,
     return _mote
 
 
+# Reference side values precomputed by the reference compile command,
+# used in place of computing them again for the same reference
+# instances.  Workers forked after they are set inherit them
+_precomputed_engine = None
+_precomputed_durations = {}
+_precomputed_ref_sigs = {}
+
+
+def set_reference_precomputed(engine, durations, ref_sigs):
+    global _precomputed_engine, _precomputed_durations, _precomputed_ref_sigs
+    _precomputed_engine = engine
+    _precomputed_durations = durations
+    _precomputed_ref_sigs = ref_sigs
+
+
+# Number of selected (scored) frames of each file of the file index
+def selected_frame_durations(file_index):
+    return {k: _precomputed_durations[k] if k in _precomputed_durations
+            else S({int(_k): _v for _k, _v in v["selected"].items()}).area()
+            for k, v in file_index.items()}
+
+
+# Identifies the reference instances of a file the signals of
+# build_ref_sig are built from
+def reference_signal_key(key, refs):
+    return (key, tuple(sorted((r.activity, str(r.activityID))
+                              for r in refs)))
+
+
+# The build_ref_sig signals of each file for the reference instances
+# of each activity, keyed by reference_signal_key
+def build_reference_signals(reference_activities, file_framedur_lookup):
+    by_activity = group_by_func(lambda a: a.activity, reference_activities)
+    ref_sigs = {}
+    for activity, instances in by_activity.items():
+        by_file = group_by_func(lambda a: list(a.localization)[0], instances)
+        for key in file_framedur_lookup:
+            refs = by_file.get(key, [])
+            sig_key = reference_signal_key(key, refs)
+            if sig_key not in ref_sigs:
+                ref_temp_add, not_ref, nr_area = build_ref_sig(
+                    {key: refs}, file_framedur_lookup)
+                ref_sigs[sig_key] = (ref_temp_add[key], not_ref[key],
+                                     nr_area[key])
+
+    return ref_sigs
+
+
 def build_ref_sig(ref, file_framedur_lookup):
     # Need to modify join, find ways to keep from doing full join each time.
     # reference stays the same, calculated once. system, just need to include
@@ -625,9 +1230,16 @@ def build_ref_sig(ref, file_framedur_lookup):
     nr_area = {}
     if ref == {}:
         return [{}, {}, {}]
+    use_precomputed = _precomputed_engine == _signal_engine
     for key, value in ref.items():
+        if use_precomputed:
+            precomputed = _precomputed_ref_sigs.get(
+                reference_signal_key(key, value))
+            if precomputed is not None:
+                ref_temp_add[key], not_ref[key], nr_area[key] = precomputed
+                continue
         ref_temp = [temporal_single_signal(b) for b in value]
-        ref_temp_add[key] = reduce(add, [r[0] for r in ref_temp], S())
+        ref_temp_add[key] = sum_signals([r[0] for r in ref_temp])
         not_ref[key] = ref_temp_add[key].not_sig(file_framedur_lookup[key])
         nr_area[key] = not_ref[key].area()
 
@@ -649,24 +1261,75 @@ def add_sys_sig(init, newsig):
     return sys_temp_ret
 
 
+# State of a DET sweep, shared by all incremental measures.  c and f
+# are the correct detection and false alarm records in the order they
+# are admitted (by descending confidence); num_c, num_m and num_f
+# hold the number of CD, MD and FA records at each of the confs
+# thresholds, so the records admitted at threshold i are c[:num_c[i]]
+# and f[:num_f[i]]
+DETSweep = namedtuple("DETSweep", ["confs", "c", "m", "f",
+                                   "num_c", "num_m", "num_f"])
+
+
+# A point of a DET curve: the confidence threshold and the measures
+# computed at that threshold
+DETPoint = namedtuple("DETPoint", ["conf", "measures"])
+
+# Per file signal maps reported by the TFA measures, only kept in
+# det points when requested from build_sweeper
+SIGNAL_SNAPSHOT_KEYS = ("System_Sig", "Ref_Sig", "NR_Ref_Sig")
+
+
+def build_det_sweep(c, m, f, conf_key_func, confs):
+    # Records with equal confidence are admitted in reverse of their
+    # original order, matching the pop order of build_sweeper
+    sorted_c = sorted(c, key=conf_key_func)
+    sorted_f = sorted(f, key=conf_key_func)
+    thresholds = np.array(confs, dtype=float)
+
+    def _num_admitted(sorted_recs):
+        rec_confs = np.array([conf_key_func(r) for r in sorted_recs],
+                             dtype=float)
+        return len(sorted_recs) - np.searchsorted(rec_confs, thresholds,
+                                                  side="left")
+
+    num_c = _num_admitted(sorted_c)
+    num_f = _num_admitted(sorted_f)
+    return DETSweep(list(confs), sorted_c[::-1], list(m), sorted_f[::-1],
+                    num_c, len(m) + len(c) - num_c, num_f)
+
+
+# Returns DETPoint records of the scalar measures at each threshold.
+# Measure functions are called with the current (c, m, f) lists at
+# each threshold, unless they provide an 'incremental' attribute; a
+# function taking a DETSweep and returning a dict of measure name to
+# a list of values, one per threshold.  The per file signal maps of
+# the TFA measure are only added with signal_snapshots=True, so an
+# incremental TFA measure only has the running system signals
+# maintained in that case
 def build_sweeper(conf_key_func, measure_funcs, uniq_conf_limit=0,
-                  file_framedur_lookup=0):
+                  file_framedur_lookup=0, signal_snapshots=False):
     def _sweep(alignment_records):
         c, m, f = partition_alignment(alignment_records)
         sys_sig = {}
         sys_sig_add = {}
         ref_all = {}
+        track_signals = False
+        funcs = measure_funcs
         if file_framedur_lookup != 0:
             for key in file_framedur_lookup:
                 sys_sig[key] = []
-                sys_sig_add[key] = S()
+                sys_sig_add[key] = build_signal()
                 ref_all[key] = []
             for ar in c:
                 ref_all[ar.video_file].append(ar.ref)
             for ar in m:
                 ref_all[ar.video_file].append((ar.ref))
             ref_sigs = build_ref_sig(ref_all, file_framedur_lookup)
-            fa_func = measure_funcs.pop()
+            fa_func = funcs[-1]
+            funcs = funcs[:-1]
+            track_signals = signal_snapshots or \
+                not hasattr(fa_func, "incremental")
 
         out_points = []
         current_c, current_f = [], []
@@ -688,42 +1351,67 @@ def build_sweeper(conf_key_func, measure_funcs, uniq_conf_limit=0,
                       """""".format(
                         le, len(uniq_confs), uniq_confs[0], uniq_confs[-1]))
 
-        for conf in uniq_confs:
+        incremental_values = {}
+        fa_values = None
+        if any(hasattr(mf, "incremental") for mf in funcs) or \
+                (file_framedur_lookup != 0 and
+                 hasattr(fa_func, "incremental")):
+            sweep = build_det_sweep(c, m, f, conf_key_func, uniq_confs)
+            incremental_values = {i: mf.incremental(sweep) for
+                                  i, mf in enumerate(funcs) if
+                                  hasattr(mf, "incremental")}
+            if file_framedur_lookup != 0 and hasattr(fa_func, "incremental"):
+                fa_values = fa_func.incremental(ref_sigs, sweep)
+
+        def _fa_measures(i):
+            if fa_values is None:
+                values = fa_func(ref_sigs, sys_sig, sys_sig_add)
+                if signal_snapshots:
+                    return values
+                return {k: v for k, v in values.items() if
+                        k not in SIGNAL_SNAPSHOT_KEYS}
+            values = {k: v[i] for k, v in fa_values.items()}
+            if signal_snapshots:
+                return merge_dicts(values, fa_func.snapshots(
+                    ref_sigs, sys_sig, sys_sig_add))
+            return values
+
+        def _measures(i):
+            return [{k: v[i] for k, v in incremental_values[j].items()} if
+                    j in incremental_values else
+                    mf(current_c, current_m, current_f) for
+                    j, mf in enumerate(funcs)]
+
+        for i, conf in enumerate(uniq_confs):
             newsig = {}
             newsig_tem = {}
             while len(current_m) > 0 and current_m[-1].alignment != "MD" and \
                     conf_key_func(current_m[-1]) >= conf:
-                if file_framedur_lookup != 0:
+                if track_signals:
                     if not current_m[-1].video_file in newsig:
                         newsig[current_m[-1].video_file] = []
                     newsig[current_m[-1].video_file].append(current_m[-1])
                 current_c.append(current_m.pop())
             while len(remaining_f) > 0 and \
                     conf_key_func(remaining_f[-1]) >= conf:
-                if file_framedur_lookup != 0:
+                if track_signals:
                     if not remaining_f[-1].video_file in newsig:
                         newsig[remaining_f[-1].video_file] = []
                     newsig[remaining_f[-1].video_file].append(remaining_f[-1])
                 current_f.append(remaining_f.pop())
+            for key, value in newsig.items():
+                newsig_tem[key] = add_sys_sig(
+                    sys_sig[key], [(ar.sys) for ar in newsig[key]])
+                sys_sig[key] = sys_sig[key] + newsig_tem[key]
+                sys_sig_add[key] = sys_sig_add[key] + sum_signals(
+                    [s[0] for s in newsig_tem[key]])
             if file_framedur_lookup != 0:
-                if newsig != {}:
-                    for key, value in newsig.items():
-                        newsig_tem[key] = add_sys_sig(
-                            sys_sig[key], [(ar.sys) for ar in newsig[key]])
-                        sys_sig[key] = sys_sig[key] + newsig_tem[key]
-                        sys_sig_add[key] = reduce(
-                            add, [s[0] for s in newsig_tem[key]],
-                            sys_sig_add[key])
-                out_points.append((
-                    conf, reduce(merge_dicts, [
-                        m(current_c, current_m, current_f) for
-                        m in measure_funcs], fa_func(
-                            ref_sigs, sys_sig, sys_sig_add))))
+                out_points.append(DETPoint(
+                    conf, reduce(merge_dicts, _measures(i),
+                                 _fa_measures(i))))
             else:
-                out_points.append((
-                    conf, reduce(merge_dicts, [
-                        m(current_c, current_m, current_f) for
-                        m in measure_funcs], {})))
+                out_points.append(DETPoint(
+                    conf, reduce(merge_dicts, _measures(i), {})))
         return out_points
     return _sweep
 
@@ -742,8 +1430,24 @@ def compute_ap(precision, recall):
     return ap
 
 
+MAP_THRESHOLDS = [x/100 for x in range(5, 100, 5)]
+
+
 def compute_map(system_activities, reference_activities, activity_index,
-                file_index, thresholds=[x/100 for x in range(5, 100, 5)]):
+                file_index, thresholds=MAP_THRESHOLDS):
+    ap, precision, recall = compute_ap_by_activity(
+        system_activities, reference_activities, activity_index, file_index,
+        thresholds)
+    return summarize_ap(ap, precision, recall, thresholds)
+
+
+# The AP of each activity only depends on its own instances, so the
+# activities can be split among several runs and the per activity
+# results put back together (in activity index order) before
+# summarize_ap
+def compute_ap_by_activity(system_activities, reference_activities,
+                           activity_index, file_index,
+                           thresholds=MAP_THRESHOLDS):
     # Largely inspired from ActivityNet code
     # http://activity-net.org/challenges/2021/tasks/anet_localization.html
 
@@ -813,6 +1517,10 @@ def compute_map(system_activities, reference_activities, activity_index,
             ap[activity][tidx] = compute_ap(
                 precision_cumsum[tidx, :], recall_cumsum[tidx, :])
 
+    return ap, precision, recall
+
+
+def summarize_ap(ap, precision, recall, thresholds=MAP_THRESHOLDS):
     ap_len = len(ap)
     ap_metrics = {'AP': [], 'mAP': [], 'pr': (precision, recall)}
     mAP = {}
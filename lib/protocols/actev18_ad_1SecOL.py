@@ -32,7 +32,6 @@
 
 import sys
 import os
-import subprocess
 from functools import reduce
 lib_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../")
 sys.path.append(lib_path)
@@ -65,13 +64,13 @@ class ActEV18_AD_1SecOL(Default):
                                        "wpmiss.denominator": 10,
                                        "scoring_protocol": "actev18_ad_1SecOL",
                                        "command": str(command),
-                                       "git.commit": subprocess.check_output(["git", "--git-dir="+ os.path.join(lib_path, "../")+".git", "show", "--oneline", "-s", "--no-abbrev-commit","--pretty=format:%H--%aI"]).strip()}
+                                       "git.commit": git_commit()}
 
         scoring_parameters = merge_dicts(default_scoring_parameters, scoring_parameters)
 
         super(ActEV18_AD_1SecOL, self).__init__(scoring_parameters, file_index, activity_index, command)
 
-        self.file_framedur_lookup = { k: S({ int(_k): _v for _k, _v in v["selected"].items() }).area() for k, v in file_index.items() }
+        self.file_framedur_lookup = selected_frame_durations(file_index)
         self.total_file_duration_minutes = sum([ float(frames) / file_index[k]["framerate"] for k, frames in self.file_framedur_lookup.items()]) / float(60)
         self.file_framerate = [file_index[k]["framerate"] for k, v in file_index.items()][0]
         
@@ -109,14 +108,10 @@ class ActEV18_AD_1SecOL(Default):
         return _nmide
 
     def build_nmide_measure(self):
-        def _nmide(c, m, f):
-            return n_mide([ (ar.ref, ar.sys) for ar in c ],
-                          self.file_framedur_lookup,
-                          self.scoring_parameters["nmide.ns_collar_size"],
-                          lambda x: self.scoring_parameters["nmide.cost_miss"] * x,
-                          lambda x: self.scoring_parameters["nmide.cost_miss"] * x)
-
-        return _nmide
+        return build_alignment_n_mide_measure(self.file_framedur_lookup,
+                                              self.scoring_parameters["nmide.ns_collar_size"],
+                                              lambda x: self.scoring_parameters["nmide.cost_miss"] * x,
+                                              lambda x: self.scoring_parameters["nmide.cost_miss"] * x)
 
     def compute_det_points_and_measures(self, alignment, rfa_denom, uniq_conf, rfa_targets, nmide_targets, wpmiss_denom, wpmiss_numer):
         sweeper = build_sweeper(lambda ar: ar.sys_presence_conf, [ build_rfa_metric(rfa_denom),
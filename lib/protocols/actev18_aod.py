@@ -32,7 +32,6 @@
 
 import sys
 import os
-import subprocess
 from functools import reduce
 lib_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../")
 sys.path.append(lib_path)
@@ -76,7 +75,7 @@ class ActEV18_AOD(ActEV18_AD):
                                        "mode.cost_miss": 1,
                                        "mode.cost_fa": 1,
                                        "command": str(command),
-                                       "git.commit": subprocess.check_output(["git", "--git-dir="+ os.path.join(lib_path, "../")+".git", "show", "--oneline", "-s", "--no-abbrev-commit","--pretty=format:%H--%aI"]).strip()}
+                                       "git.commit": git_commit()}
 
         scoring_parameters = merge_dicts(default_scoring_parameters, scoring_parameters)
 
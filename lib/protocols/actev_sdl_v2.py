@@ -32,9 +32,6 @@
 
 import sys
 import os
-import subprocess
-import dill
-from concurrent.futures import ProcessPoolExecutor
 
 lib_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../")
 sys.path.append(lib_path)
@@ -68,13 +65,13 @@ class ActEV_SDL_V2(Default):
                                        "fa.ns_collar_size": 0,
                                        "scoring_protocol": "actev_sdl_v2",
                                        "command": str(command),
-                                       "git.commit": subprocess.check_output(["git", "--git-dir="+ os.path.join(lib_path, "../")+".git", "show", "--oneline", "-s", "--no-abbrev-commit","--pretty=format:%H--%aI"]).strip()} #.split(" ")[0]} #git show --oneline -s --no-abbrev-commit --pretty=format:%H--%aI
+                                       "git.commit": git_commit()} #.split(" ")[0]} #git show --oneline -s --no-abbrev-commit --pretty=format:%H--%aI
 
         scoring_parameters = merge_dicts(default_scoring_parameters, scoring_parameters)
         super(ActEV_SDL_V2, self).__init__(scoring_parameters, file_index, activity_index, command)
         print("=Wrong Init")
 
-        self.file_framedur_lookup = { k: S({ int(_k): _v for _k, _v in v["selected"].items() }).area() for k, v in file_index.items() }
+        self.file_framedur_lookup = selected_frame_durations(file_index)
         self.total_file_duration_minutes = sum([ float(frames) / file_index[k]["framerate"] for k, frames in self.file_framedur_lookup.items()]) / float(60)
         self.file_framerate = [file_index[k]["framerate"] for k, v in file_index.items()][0]
 
@@ -112,24 +109,18 @@ class ActEV_SDL_V2(Default):
         return _nmide
 
     def build_nmide_measure(self):
-        def _nmide(c, m, f):
-            return n_mide([ (ar.ref, ar.sys) for ar in c ],
-                          self.file_framedur_lookup,
-                          self.scoring_parameters["nmide.ns_collar_size"],
-                          lambda x: self.scoring_parameters["nmide.cost_miss"] * x,
-                          lambda x: self.scoring_parameters["nmide.cost_miss"] * x)
-
-        return _nmide
+        return build_alignment_n_mide_measure(self.file_framedur_lookup,
+                                              self.scoring_parameters["nmide.ns_collar_size"],
+                                              lambda x: self.scoring_parameters["nmide.cost_miss"] * x,
+                                              lambda x: self.scoring_parameters["nmide.cost_miss"] * x)
     
     def build_fa_measure(self):
-        def _fa_meas(ref_sig, sys_sig, sys_sig_add):
-            return fa_meas_v2(ref_sig, sys_sig, sys_sig_add)
         #[ (ar.ref, ar.sys) for ar in c ],
         #                  [(ar.ref) for ar in m],
         #                  [(ar.sys) for ar in f],
         #                  self.file_framedur_lookup,
         #                  self.scoring_parameters["fa.ns_collar_size"])
-        return _fa_meas
+        return build_fa_meas_v2_measure()
         
     def compute_det_points_and_measures(self, alignment, rfa_denom, uniq_conf, rfa_targets, nmide_targets, fa_targets, wpmiss_denom, wpmiss_numer):
         sweeper = build_sweeper(lambda ar: ar.sys_presence_conf, [ build_rfa_metric(rfa_denom),
@@ -205,13 +196,11 @@ class ActEV_SDL_V2(Default):
             return (p, t, fa, m)
 
         grouped = merge_dicts({ k: [] for k in default_factorizations }, group_by_func(factorization_func, records))
-        _r_srlz = dill.dumps(_r)
-        args = []
-        for key in grouped:
-            args.append((_r_srlz, (key, grouped[key]), ({}, {}, [], [])))
-
-        with ProcessPoolExecutor(self.pn) as pool:
-            res = pool.map(unserialize_fct_res, args)
+        items = list(grouped.items())
+        res = self.map_shared(lambda item: _r(({}, {}, [], []), item),
+                              [ (item,) for item in items ],
+                              [ len(recs) + 1 for _, recs in items ],
+                              "aggregate measures")
 
         p, t, fa, m = {}, {}, [], []
         for entry in res:
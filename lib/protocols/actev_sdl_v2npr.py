@@ -32,9 +32,6 @@
 
 import sys
 import os
-import subprocess
-import dill
-from concurrent.futures import ProcessPoolExecutor
 
 lib_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../")
 sys.path.append(lib_path)
@@ -69,11 +66,11 @@ class ActEV_SDL_V2NPR(ActEV_SDL_V2):
                                        "fa.ns_collar_size": 0,
                                        "scoring_protocol": "actev_sdl_v2npr",
                                        "command": str(command),
-                                       "git.commit": subprocess.check_output(["git", "--git-dir="+ os.path.join(lib_path, "../")+".git", "show", "--oneline", "-s", "--no-abbrev-commit","--pretty=format:%H--%aI"]).strip()} #.split(" ")[0]} #git show --oneline -s --no-abbrev-commit --pretty=format:%H--%aI
+                                       "git.commit": git_commit()} #.split(" ")[0]} #git show --oneline -s --no-abbrev-commit --pretty=format:%H--%aI
 
         scoring_parameters = merge_dicts(default_scoring_parameters, scoring_parameters)
         super(ActEV_SDL_V2, self).__init__(scoring_parameters, file_index, activity_index, command)
 
-        self.file_framedur_lookup = { k: S({ int(_k): _v for _k, _v in v["selected"].items() }).area() for k, v in file_index.items() }
+        self.file_framedur_lookup = selected_frame_durations(file_index)
         self.total_file_duration_minutes = sum([ float(frames) / file_index[k]["framerate"] for k, frames in self.file_framedur_lookup.items()]) / float(60)
         self.file_framerate = [file_index[k]["framerate"] for k, v in file_index.items()][0]
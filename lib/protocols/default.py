@@ -32,9 +32,10 @@
 
 import sys
 import os
+import time
 from functools import reduce
-import dill
-from concurrent.futures import ProcessPoolExecutor
+import itertools
+import multiprocessing
 lib_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../")
 sys.path.append(lib_path)
 
@@ -44,7 +45,22 @@ from alignment import *
 from helpers import *
 from datacontainer import DataContainer
 
+# Cohorts with fewer (ref, sys) pairs are never split across workers
+INTRA_COHORT_MIN_PAIRS = 1 << 16
+
+# Below this many records, pair measures without a batched form are
+# computed in process rather than dispatched to the worker pool
+ATOMIC_MEASURES_MIN_POOL_RECORDS = 256
+
 class Default(object):
+    # Worker pool shared by every scoring phase of a run, see get_pool
+    _pool = None
+    _shared_keys = itertools.count()
+    # Whether compute_alignment splits cohorts at temporal gaps
+    split_cohorts = False
+    # (index, count) to only align the activities of one shard
+    shard = None
+
     @classmethod
     def get_schema_fn(cls):
         raise NotImplementedError
@@ -58,6 +74,94 @@ class Default(object):
         self.file_index = file_index
         self.activity_index = activity_index
         self.default_activity_groups = [ (k,) for k in self.activity_index.keys() ]
+        # (phase, tasks, batches, wall seconds, busy seconds, efficiency)
+        # for every map_shared call
+        self.parallel_stats = []
+
+    # Returns the pool of self.pn worker processes, created on first
+    # use and then reused by every phase until close_pool is called
+    def get_pool(self):
+        if self._pool is None:
+            from concurrent.futures import ProcessPoolExecutor
+            self._pool = ProcessPoolExecutor(self.pn)
+
+        return self._pool
+
+    # Makes the protocol use pool, e.g. one from start_worker_pool, as
+    # its worker pool
+    def set_pool(self, pool):
+        self.close_pool()
+        self._pool = pool
+
+    def close_pool(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    # Applies func to each tuple of args_list in the worker pool.  When
+    # the pool has not been started yet, the workers inherit the
+    # function and arguments by fork, and each task only carries the
+    # indices of its batch.  Otherwise the function is handed to them
+    # once, through a payload file, and each task carries the
+    # arguments of its batch only.  Batches are formed and dispatched
+    # largest first from the relative costs, if given
+    def map_shared(self, func, args_list, costs = None, phase = None):
+        if costs is None:
+            costs = [ 1 ] * len(args_list)
+
+        workers = self.pn or os.cpu_count() or 1
+        batches = schedule_batches(costs, workers)
+
+        key = "{}-{}".format(os.getpid(), next(Default._shared_keys))
+        if self._pool is None and multiprocessing.get_start_method() == "fork":
+            path = publish_shared(key, (func, args_list), inherited = True)
+            tasks = [ (key, path, b, None) for b in batches ]
+        else:
+            path = publish_shared(key, (func, None))
+            tasks = [ (key, path, b, pack_batch(args_list, b)) for b in batches ]
+        try:
+            start = time.perf_counter()
+            pool = self.get_pool()
+            batch_results = list(pool.map(call_shared, tasks))
+            wall = time.perf_counter() - start
+        finally:
+            release_shared(key, path)
+
+        results = [ None ] * len(args_list)
+        busy = 0.0
+        for b, (res, elapsed) in zip(batches, batch_results):
+            busy += elapsed
+            for i, r in zip(b, res):
+                results[i] = r
+
+        efficiency = busy / (wall * workers) if wall > 0 else 1.0
+        self.parallel_stats.append((phase or func.__name__, len(args_list), len(batches), wall, busy, efficiency))
+
+        return results
+
+    # Measure closures capturing the protocol are shipped to the
+    # workers, which must not receive the pool itself
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop("_pool", None)
+        return state
+
+    # Returns the activities of the activity index to align, in index
+    # order.  If a shard is set, every shard computes the same
+    # partition of the activities, balanced on their number of (ref,
+    # sys) pairs, and only its own part is returned
+    def shard_activities(self, reference_activities, system_activities):
+        activities = list(self.activity_index.keys())
+        if self.shard is None:
+            return activities
+
+        activity_getter = lambda x: x.activity
+        ref_counts = { a: len(v) for a, v in group_by_func(activity_getter, reference_activities).items() }
+        sys_counts = { a: len(v) for a, v in group_by_func(activity_getter, system_activities).items() }
+        costs = [ ref_counts.get(a, 0) * sys_counts.get(a, 0) + ref_counts.get(a, 0) + sys_counts.get(a, 0) for a in activities ]
+
+        index, count = self.shard
+        return [ a for a, part in zip(activities, partition_by_cost(costs, count)) if part == index ]
 
     # assumes syss, and refs are simple lists of activities
     def default_cohort_gen(self, refs, syss):
@@ -84,21 +188,70 @@ class Default(object):
         ref_by_act = group_by_func(activity_getter, reference_activities)
         sys_by_act = group_by_func(activity_getter, system_activities)
         
-        def gen_args(activity, properties):
+        # Yields the arguments of perform_alignment for each cohort,
+        # along with the whole cohort it is a part of, if any
+        def gen_cohorts(activity, properties):
             refs = ref_by_act.get(activity, [])
             syss = sys_by_act.get(activity, [])
             kernel = kernel_builder(activity, properties, refs, syss)
             for rs, ss in cohort_gen(refs, syss):
-                yield (dill.dumps(perform_alignment), dill.dumps(rs), dill.dumps(ss), dill.dumps(kernel))
+                # Instances can only align with temporally intersecting
+                # ones under a kernel narrowing its candidate pairs, so
+                # the cohort falls apart at gaps no instance spans
+                windows = temporal_windows(rs, ss) if self.split_cohorts and hasattr(kernel, "candidates") else []
+                if len(windows) > 1:
+                    whole = (rs, ss, kernel)
+                    for wrs, wss in windows:
+                        yield ((wrs, wss, kernel, True, None, True), whole)
+                else:
+                    yield ((rs, ss, kernel, True, None, False), None)
+
+        cohorts, wholes = [], []
+        for activity in self.shard_activities(reference_activities, system_activities):
+            for cohort, whole in gen_cohorts(activity, self.activity_index[activity]):
+                cohorts.append(cohort)
+                wholes.append(whole)
+
+        # Kernel evaluation dominates, so cohorts are costed by their
+        # number of (ref, sys) pairs
+        costs = [ len(rs) * len(ss) + len(rs) + len(ss) + 1 for rs, ss, *_ in cohorts ]
+
+        # A cohort above a worker's fair share would leave the other
+        # workers idle, so its kernel is first evaluated in blocks of
+        # rows across all of them, and only the assignment is left
+        # for the alignment phase
+        workers = self.pn or os.cpu_count() or 1
+        blocks, block_cohorts = [], []
+        for i, (rs, ss, kernel, *_) in enumerate(cohorts):
+            if costs[i] >= INTRA_COHORT_MIN_PAIRS and costs[i] * workers > sum(costs):
+                for pairs in row_blocks(alignment_pairs(rs, ss, kernel), workers * 4):
+                    blocks.append((rs, ss, kernel, pairs))
+                    block_cohorts.append(i)
 
-        args = []
-        for activity, props in self.activity_index.items():
-            args.extend([a for a in gen_args(activity, props)])
+        if len(blocks) > 0:
+            evaluations = self.map_shared(evaluate_alignment_kernel, blocks, [ len(b[3]) + 1 for b in blocks ], "alignment kernel blocks")
+            for i, cohort_evaluations in group_by_func(lambda x: x[0], zip(block_cohorts, evaluations), lambda x: x[1]).items():
+                cohorts[i] = cohorts[i][:4] + (merge_kernel_evaluations(cohort_evaluations),) + cohorts[i][5:]
+
+        alignment_recs = self.map_shared(perform_alignment, cohorts, costs, "alignment")
+
+        # A window with several optimal assignments might not align
+        # as within its cohort, in which case the whole cohort is
+        # aligned at once instead
+        realign = { id(whole): whole for whole, recs in zip(wholes, alignment_recs) if recs is None }
+        realigned = {}
+        if len(realign) > 0:
+            realigned_recs = self.map_shared(perform_alignment, list(realign.values()), [ len(rs) * len(ss) + len(rs) + len(ss) + 1 for rs, ss, _ in realign.values() ], "alignment")
+            realigned = dict(zip(realign.keys(), realigned_recs))
 
-        with ProcessPoolExecutor(self.pn) as pool:
-            alignment_recs = pool.map(unserialize_fct_alg, args)
         alignment = []
-        for c,m,f in alignment_recs:
+        for whole, recs in zip(wholes, alignment_recs):
+            # The alignment of a realigned cohort goes with its first
+            # window
+            if whole is not None and id(whole) in realign:
+                recs = realigned.pop(id(whole), ([], [], []))
+
+            c,m,f = recs
             alignment.extend(c)
             alignment.extend(m)
             alignment.extend(f)
@@ -143,22 +296,35 @@ class Default(object):
         if measures is None:
             measures = self.default_pair_measures()
 
-        def _r(init, rec):
-            for mv in self.compute_measures(rec, measures).items():
-                init.append(rec_map_func(rec) + mv)
-            return init
+        records = list(records)
+        values = [ {} for _ in records ]
 
-        _r_srlz = dill.dumps(_r)
-        args = []
-        for item in records:
-            args.append((_r_srlz, item, []))
+        # Batched measures are computed in process over all records,
+        # sharing a cache for this call, the others record by record,
+        # in the worker pool unless there are too few records to pay
+        # for dispatching them
+        cache = {}
+        for m in [ m for m in measures if hasattr(m, "batch") ]:
+            for v, mv in zip(values, m.batch(records, cache)):
+                v.update(mv)
 
-        with ProcessPoolExecutor(self.pn) as pool:
-            res = pool.map(unserialize_fct_atomic, args)
+        other_measures = [ m for m in measures if not hasattr(m, "batch") ]
+        if len(other_measures) > 0:
+            def _measures(rec):
+                return self.compute_measures(rec, other_measures)
+
+            if len(records) < ATOMIC_MEASURES_MIN_POOL_RECORDS:
+                res = [ _measures(rec) for rec in records ]
+            else:
+                res = self.map_shared(_measures, [ (rec,) for rec in records ], phase = "pair measures")
+
+            for v, mv in zip(values, res):
+                v.update(mv)
 
         m = []
-        for entry in res:
-            m.extend(entry)
+        for rec, v in zip(records, values):
+            for mv in v.items():
+                m.append(rec_map_func(rec) + mv)
         return m
 
 
@@ -182,4 +348,10 @@ class Default(object):
         def _m(*rec):
             return { name: measure_func(*arg_func(*rec)) }
 
+        # Measure functions with a batched form can be computed over
+        # a whole list of records at once; those given the same
+        # arguments share a cache
+        if hasattr(measure_func, "batch"):
+            _m.batch = lambda recs, cache: [ { name: v } for v in measure_func.batch([ arg_func(rec) for rec in recs ], cache.setdefault(arg_func, {})) ]
+
         return _m
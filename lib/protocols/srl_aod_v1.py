@@ -32,10 +32,7 @@
 
 import sys
 import os
-import subprocess
 from functools import reduce
-import dill
-from concurrent.futures import ProcessPoolExecutor
 lib_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../")
 sys.path.append(lib_path)
 
@@ -81,7 +78,7 @@ class SRL_AOD_V1(SRL_AD_V1):
                                        "wpmiss.denominator": 10,
                                        "scoring_protocol": "srl_aod_v1",
                                        "command": str(command),
-                                       "git.commit": subprocess.check_output(["git", "--git-dir="+ os.path.join(lib_path, "../")+".git", "show", "--oneline", "-s", "--no-abbrev-commit","--pretty=format:%H--%aI"]).strip()}
+                                       "git.commit": git_commit()}
         scoring_parameters = merge_dicts(default_scoring_parameters, scoring_parameters)
         super(SRL_AOD_V1, self).__init__(scoring_parameters, file_index, activity_index, command)
 
@@ -376,13 +373,11 @@ class SRL_AOD_V1(SRL_AD_V1):
             return (p, m)
 
         grouped = merge_dicts({ k: [] for k in default_factorizations }, group_by_func(factorization_func, records))
-        _r_srlz = dill.dumps(_r)
-        args = []
-        for key in grouped:
-            args.append((_r_srlz, (key, grouped[key]), ({}, [])))
-
-        with ProcessPoolExecutor(self.pn) as pool:
-            res = pool.map(unserialize_fct_res, args)
+        items = list(grouped.items())
+        res = self.map_shared(lambda item: _r(({}, []), item),
+                              [ (item,) for item in items ],
+                              [ len(recs) + 1 for _, recs in items ],
+                              "aggregate measures")
 
         p, m = {}, []
         for entry in res:
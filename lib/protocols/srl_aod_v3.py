@@ -32,10 +32,7 @@
 
 import sys
 import os
-import subprocess
 from functools import reduce
-import dill
-from concurrent.futures import ProcessPoolExecutor
 lib_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../")
 sys.path.append(lib_path)
 
@@ -81,6 +78,6 @@ class SRL_AOD_V3(SRL_AOD_V1):
                                        "wpmiss.denominator": 10,
                                        "scoring_protocol": "srl_aod_v2",
                                        "command": str(command),
-                                       "git.commit": subprocess.check_output(["git", "--git-dir="+ os.path.join(lib_path, "../")+".git", "show", "--oneline", "-s", "--no-abbrev-commit","--pretty=format:%H--%aI"]).strip()}
+                                       "git.commit": git_commit()}
         scoring_parameters = merge_dicts(default_scoring_parameters, scoring_parameters)
         super(SRL_AOD_V1, self).__init__(scoring_parameters, file_index, activity_index, command)
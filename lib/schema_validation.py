@@ -0,0 +1,196 @@
+# schema_validation.py
+
+# This software was developed by employees of the National Institute of
+# Standards and Technology (NIST), an agency of the Federal
+# Government. Pursuant to title 17 United States Code Section 105, works
+# of NIST employees are not subject to copyright protection in the
+# United States and are considered to be in the public
+# domain. Permission to freely use, copy, modify, and distribute this
+# software and its documentation without fee is hereby granted, provided
+# that this notice and disclaimer of warranty appears in all copies.
+
+# THE SOFTWARE IS PROVIDED 'AS IS' WITHOUT ANY WARRANTY OF ANY KIND,
+# EITHER EXPRESSED, IMPLIED, OR STATUTORY, INCLUDING, BUT NOT LIMITED
+# TO, ANY WARRANTY THAT THE SOFTWARE WILL CONFORM TO SPECIFICATIONS, ANY
+# IMPLIED WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+# PURPOSE, AND FREEDOM FROM INFRINGEMENT, AND ANY WARRANTY THAT THE
+# DOCUMENTATION WILL CONFORM TO THE SOFTWARE, OR ANY WARRANTY THAT THE
+# SOFTWARE WILL BE ERROR FREE. IN NO EVENT SHALL NIST BE LIABLE FOR ANY
+# DAMAGES, INCLUDING, BUT NOT LIMITED TO, DIRECT, INDIRECT, SPECIAL OR
+# CONSEQUENTIAL DAMAGES, ARISING OUT OF, RESULTING FROM, OR IN ANY WAY
+# CONNECTED WITH THIS SOFTWARE, WHETHER OR NOT BASED UPON WARRANTY,
+# CONTRACT, TORT, OR OTHERWISE, WHETHER OR NOT INJURY WAS SUSTAINED BY
+# PERSONS OR PROPERTY OR OTHERWISE, AND WHETHER OR NOT LOSS WAS
+# SUSTAINED FROM, OR AROSE OUT OF THE RESULTS OF, OR USE OF, THE
+# SOFTWARE OR SERVICES PROVIDED HEREUNDER.
+
+# Distributions of NIST software should also include copyright and
+# licensing statements of any third-party software that are legally
+# bundled with the code in compliance with the conditions of those
+# licenses.
+
+import re
+from collections import namedtuple
+
+# A system output schema along with its validators, compiled once.
+# The document validator checks everything but the activity instances,
+# which are checked one at a time by the item validator.  precheck is
+# None for schemas build_precheck doesn't know
+CompiledSchema = namedtuple("CompiledSchema", ["schema", "document", "item", "precheck"])
+
+# Replaces references to the schema's definitions by the definitions
+# themselves, sparing the validator from resolving them for every
+# instance.  Recursive references are left as they are
+def _inline_definitions(node, definitions, expanding=()):
+    if isinstance(node, list):
+        return [ _inline_definitions(n, definitions, expanding) for n in node ]
+    if not isinstance(node, dict):
+        return node
+
+    ref = node.get("$ref")
+    if len(node) == 1 and isinstance(ref, str) and ref.startswith("#/definitions/"):
+        name = ref[len("#/definitions/"):]
+        if name in definitions and name not in expanding:
+            return _inline_definitions(definitions[name], definitions, expanding + (name,))
+        return node
+
+    return { k: _inline_definitions(v, definitions, expanding) for k, v in node.items() }
+
+# The item schema of the "activities" array, along with the definitions
+# it refers to
+def activity_item_schema(schema):
+    definitions = schema.get("definitions", {})
+    item_schema = dict(_inline_definitions(schema["properties"]["activities"]["items"], definitions))
+    item_schema["definitions"] = definitions
+    if "$schema" in schema:
+        item_schema["$schema"] = schema["$schema"]
+
+    return item_schema
+
+def compile_schema(schema):
+    import jsonschema
+
+    cls = jsonschema.validators.validator_for(schema)
+    cls.check_schema(schema)
+
+    document_schema = dict(schema)
+    document_schema["properties"] = dict(schema["properties"], activities={ "type": "array" })
+    return CompiledSchema(schema, cls(document_schema), cls(activity_item_schema(schema)), build_precheck(schema))
+
+# Returns a message for the error jsonschema.validate would raise for
+# instance, or None if it is valid.  The message leaves out the schema,
+# which can be large once its definitions are inlined
+def validation_error(validator, instance):
+    from jsonschema.exceptions import best_match
+
+    error = best_match(validator.iter_errors(instance))
+    return None if error is None else "{} at {}".format(error.message, error.json_path)
+
+# Validates the activity instances activities[start:stop], returning
+# the index and error message of the first invalid one, if any.  If
+# given, precheck (see build_precheck) is run on the instances first,
+# and only those before the first it rejects are then fully validated
+def validate_activity_range(validator, activities, start, stop, precheck = None):
+    if precheck is not None:
+        for i in range(start, stop):
+            error = precheck(activities[i])
+            if error is not None:
+                return validate_activity_range(validator, activities, start, i) or (i, error)
+
+    for i in range(start, stop):
+        error = validation_error(validator, activities[i])
+        if error is not None:
+            return (i, error)
+
+    return None
+
+# As validate_activity_range, on the chunk of activity instances
+# starting at index start, so that a worker process need only be sent
+# the chunk
+def validate_activity_chunk(validator, precheck, start, activities):
+    failure = validate_activity_range(validator, activities, 0, len(activities), precheck)
+    return None if failure is None else (start + failure[0], failure[1])
+
+def _is_number(v):
+    return isinstance(v, (int, float)) and not isinstance(v, bool)
+
+# Only rejects values no JSON schema draft accepts for the type, so
+# that the checks below never disagree with full validation
+_type_checks = { "string": lambda v: isinstance(v, str),
+                 "integer": _is_number,
+                 "number": _is_number,
+                 "boolean": lambda v: isinstance(v, bool),
+                 "object": lambda v: isinstance(v, dict),
+                 "array": lambda v: isinstance(v, list),
+                 "null": lambda v: v is None }
+
+# The patterns property names of an object schema must match, or None
+# if other names are allowed
+def _property_patterns(object_schema):
+    if object_schema.get("additionalProperties", True) is not False or "properties" in object_schema:
+        return None
+
+    return [ re.compile(p) for p in object_schema.get("patternProperties", {}) ]
+
+# Builds a fast structural check of the activity instances of the
+# ActEV system output schemas, rejecting the usual malformations
+# (missing members, members of the wrong type, badly formed temporal
+# localizations) without going through full schema validation.  The
+# check takes an activity instance and returns an error message or
+# None; instances it passes still need to be fully validated.  Returns
+# None if the schema doesn't describe ActEV activity instances
+def build_precheck(schema):
+    definitions = schema.get("definitions", {})
+    instance_schema = definitions.get("activity_instance")
+    localization_schema = definitions.get("temporal_localization")
+    if instance_schema is None or localization_schema is None or \
+       schema["properties"]["activities"].get("items") != { "$ref": "#/definitions/activity_instance" }:
+        return None
+
+    required = instance_schema.get("required", [])
+    member_types = []
+    for name, prop in instance_schema.get("properties", {}).items():
+        if prop.get("type") in _type_checks:
+            member_types.append((name, prop["type"], _type_checks[prop["type"]]))
+    # The localization of each file is assumed to be described the
+    # same way whatever its name, as in every ActEV schema
+    file_patterns = _property_patterns(localization_schema)
+    frames_schema = next(iter(localization_schema.get("patternProperties", {}).values()), {})
+    frame_patterns = _property_patterns(frames_schema)
+    value_schema = next(iter(frames_schema.get("patternProperties", {}).values()), {})
+    min_files = localization_schema.get("minProperties", 0)
+    max_files = localization_schema.get("maxProperties", float("inf"))
+    min_frames = frames_schema.get("minProperties", 0)
+    numeric_values = value_schema.get("type") in ("integer", "number")
+    min_value = value_schema.get("minimum", -float("inf"))
+    max_value = value_schema.get("maximum", float("inf"))
+
+    def _precheck(inst):
+        if not isinstance(inst, dict):
+            return "{!r} is not of type 'object'".format(inst)
+        for name in required:
+            if name not in inst:
+                return "'{}' is a required property".format(name)
+        for name, type_name, check in member_types:
+            if name in inst and not check(inst[name]):
+                return "'{}' value {!r} is not of type '{}'".format(name, inst[name], type_name)
+
+        if "localization" not in inst:
+            return None
+        localization = inst["localization"]
+        if not isinstance(localization, dict) or not min_files <= len(localization) <= max_files:
+            return "'localization' must be an object of {} to {} files".format(min_files, max_files)
+        for fn, frames in localization.items():
+            if file_patterns is not None and not any(p.search(fn) for p in file_patterns):
+                return "'localization' file name {!r} is not valid".format(fn)
+            if not isinstance(frames, dict) or len(frames) < min_frames:
+                return "'localization' of file {!r} must be an object of at least {} frames".format(fn, min_frames)
+            for frame, value in frames.items():
+                if frame_patterns is not None and not any(p.search(frame) for p in frame_patterns):
+                    return "'localization' frame {!r} of file {!r} is not valid".format(frame, fn)
+                if numeric_values and (not _is_number(value) or not min_value <= value <= max_value):
+                    return "'localization' value {!r} of frame {} of file {!r} is not valid".format(value, frame, fn)
+
+        return None
+
+    return _precheck
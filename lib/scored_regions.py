@@ -0,0 +1,132 @@
+# scored_regions.py
+
+# This software was developed by employees of the National Institute of
+# Standards and Technology (NIST), an agency of the Federal
+# Government. Pursuant to title 17 United States Code Section 105, works
+# of NIST employees are not subject to copyright protection in the
+# United States and are considered to be in the public
+# domain. Permission to freely use, copy, modify, and distribute this
+# software and its documentation without fee is hereby granted, provided
+# that this notice and disclaimer of warranty appears in all copies.
+
+# THE SOFTWARE IS PROVIDED 'AS IS' WITHOUT ANY WARRANTY OF ANY KIND,
+# EITHER EXPRESSED, IMPLIED, OR STATUTORY, INCLUDING, BUT NOT LIMITED
+# TO, ANY WARRANTY THAT THE SOFTWARE WILL CONFORM TO SPECIFICATIONS, ANY
+# IMPLIED WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+# PURPOSE, AND FREEDOM FROM INFRINGEMENT, AND ANY WARRANTY THAT THE
+# DOCUMENTATION WILL CONFORM TO THE SOFTWARE, OR ANY WARRANTY THAT THE
+# SOFTWARE WILL BE ERROR FREE. IN NO EVENT SHALL NIST BE LIABLE FOR ANY
+# DAMAGES, INCLUDING, BUT NOT LIMITED TO, DIRECT, INDIRECT, SPECIAL OR
+# CONSEQUENTIAL DAMAGES, ARISING OUT OF, RESULTING FROM, OR IN ANY WAY
+# CONNECTED WITH THIS SOFTWARE, WHETHER OR NOT BASED UPON WARRANTY,
+# CONTRACT, TORT, OR OTHERWISE, WHETHER OR NOT INJURY WAS SUSTAINED BY
+# PERSONS OR PROPERTY OR OTHERWISE, AND WHETHER OR NOT LOSS WAS
+# SUSTAINED FROM, OR AROSE OUT OF THE RESULTS OF, OR USE OF, THE
+# SOFTWARE OR SERVICES PROVIDED HEREUNDER.
+
+# Distributions of NIST software should also include copyright and
+# licensing statements of any third-party software that are legally
+# bundled with the code in compliance with the conditions of those
+# licenses.
+
+import numpy as np
+
+from sparse_signal import SparseSignal
+
+# Whether a JSON frame number is written the way SparseSignal joins
+# write it back, i.e. as str(int(k))
+def _canonical_frame(k):
+    if k.startswith("-"):
+        k = k[1:]
+        return len(k) > 0 and k.isdigit() and k[0] != "0"
+    return k.isdigit() and (k[0] != "0" or len(k) == 1)
+
+# The frames an instance localization is on in, as sorted half-open
+# [start, end) intervals; an instance still on after its last frame
+# is on until infinity.  Returns None for localizations which can't be
+# checked against sorted region arrays (values other than 0 and 1, or
+# frame numbers not in canonical form), these are checked by joining
+# signals instead
+def _on_intervals(frames):
+    points = []
+    for k, v in frames.items():
+        if type(k) is not str or type(v) is bool or (v != 0 and v != 1) or not _canonical_frame(k):
+            return None
+        points.append((int(k), v))
+    points.sort()
+
+    intervals, start = [], None
+    for t, v in points:
+        if v == 1 and start is None:
+            start = t
+        elif v == 0 and start is not None:
+            intervals.append((start, t))
+            start = None
+    if start is not None:
+        intervals.append((start, float("inf")))
+    return intervals
+
+# Selected (scored) frames of one file of the file index.  An instance
+# lies in them when joining its localization into the selected frames
+# signal leaves that signal unchanged.  When the selected frames are
+# given in canonical form with 0/1 values, as they always are in
+# practice, they are also kept as sorted arrays of the starts and ends
+# of their disjoint regions, and the check amounts to finding, by
+# binary search, the region each instance interval starts in
+class ScoredRegions(object):
+    def __init__(self, selected):
+        self.signal = SparseSignal(selected)
+        self.starts, self.ends = None, None
+        bounds = _on_intervals(self.signal)
+        if bounds is not None and (self.signal | SparseSignal()) == self.signal:
+            self.starts = np.array([ s for s, e in bounds ], dtype = np.float64)
+            self.ends = np.array([ e for s, e in bounds ], dtype = np.float64)
+
+    def _contains_by_join(self, frames):
+        return (self.signal | SparseSignal(frames)) == self.signal
+
+    # Whether each of the given instance localization frames lies in
+    # the selected frames; the regions of all regular localizations
+    # are searched for at once
+    def contains_all(self, frames_list):
+        out = [ None ] * len(frames_list)
+        owners, starts, ends = [], [], []
+        for i, frames in enumerate(frames_list):
+            intervals = None if self.starts is None else _on_intervals(frames)
+            if intervals is None:
+                out[i] = self._contains_by_join(frames)
+                continue
+            out[i] = True
+            for s, e in intervals:
+                owners.append(i)
+                starts.append(s)
+                ends.append(e)
+
+        if len(owners) > 0:
+            starts, ends = np.array(starts, dtype = np.float64), np.array(ends, dtype = np.float64)
+            if len(self.starts) == 0:
+                inside = np.zeros(len(owners), dtype = bool)
+            else:
+                region = np.searchsorted(self.starts, starts, side = "right") - 1
+                inside = (region >= 0) & (ends <= self.ends[np.maximum(region, 0)])
+            for i in np.array(owners)[~inside]:
+                out[i] = False
+
+        return out
+
+    def contains(self, frames):
+        return self.contains_all([ frames ])[0]
+
+# ScoredRegions of the files of a file index, built on first use.
+# Held by the caller for as long as it checks instances against the
+# same file index.  Raises KeyError for files missing from the file
+# index
+class ScoredRegionIndex(object):
+    def __init__(self, file_index):
+        self.file_index = file_index
+        self.regions = {}
+
+    def __getitem__(self, fn):
+        if fn not in self.regions:
+            self.regions[fn] = ScoredRegions(self.file_index[fn]['selected'])
+        return self.regions[fn]
@@ -30,6 +30,8 @@
 # bundled with the code in compliance with the conditions of those
 # licenses.
 
+import numpy as np
+
 def build_sed_presenceconf_congruence(sys_instances, minmax=None):
     sys_instances_list = list(sys_instances)
     if len(sys_instances_list) == 1:
@@ -55,4 +57,10 @@ def build_sed_presenceconf_congruence(sys_instances, minmax=None):
         def _congruence(r, s, cache):
             return { "presenceconf_congruence": None }
 
+    # Only depends on the system instance, so the cohort matrix is a
+    # single column broadcast across the reference instances
+    def _congruence_matrix(refs, syss, cache):
+        return { "presenceconf_congruence": np.array([ _congruence(None, s, cache)["presenceconf_congruence"] for s in syss ], dtype = float).reshape(len(syss), 1) }
+
+    _congruence.matrix = _congruence_matrix
     return _congruence
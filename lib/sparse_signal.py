@@ -142,10 +142,28 @@ class SparseSignal(dict):
         return SparseSignal(new_s)
             
             
+    # Union of the [key - size, key + size) windows around each
+    # breakpoint, merged in a single pass over the sorted breakpoints
     def generate_collar(self, size):
-        return reduce(lambda init, key: init | SparseSignal({key - size: 1, key + size: 0}),
-                      self.normalize().keys(),
-                      SparseSignal()).normalize()
+        out_signal = SparseSignal()
+        if size <= 0:
+            return out_signal
+
+        start, end = None, None
+        for key in _sorted(self.normalize().keys()):
+            if end is not None and key - size <= end:
+                end = key + size
+            else:
+                if end is not None:
+                    out_signal[start] = 1
+                    out_signal[end] = 0
+                start, end = key - size, key + size
+
+        if end is not None:
+            out_signal[start] = 1
+            out_signal[end] = 0
+
+        return out_signal
 
     def iterate_by_frame(self, start, stop, default = 0):
         if start > stop:
@@ -0,0 +1,53 @@
+#!/usr/bin/env bash
+
+# Scores a system output in COUNT shards, each run as a local process,
+# then merges them into OUTPUT_DIR as a single run would.  The scoring
+# arguments are those of ActEV_Scorer.py, without -o
+#
+# Usage: ./run_sharded.sh COUNT OUTPUT_DIR PROTOCOL [scoring arguments]
+
+if [ $# -lt 3 ] ; then
+    echo "Usage: $0 COUNT OUTPUT_DIR PROTOCOL [scoring arguments]"
+    exit 1
+fi
+
+count=$1
+output_dir=$2
+shift 2
+
+scorer="$(dirname "$0")/ActEV_Scorer.py"
+shard_dir="$output_dir/shards"
+
+pids=""
+for ((i = 0; i < count; i++)) ; do
+    python3 "$scorer" "$@" --shard "$i/$count" -o "$shard_dir" &
+    pids="$pids $!"
+done
+
+status=0
+for pid in $pids ; do
+    wait $pid || status=1
+done
+
+if [ $status -ne 0 ] ; then
+    echo "[Error] At least one shard failed.  Aborting!"
+    exit 1
+fi
+
+# Output related options are passed on to the merge
+args=("$@")
+merge_args=()
+for ((j = 0; j < ${#args[@]}; j++)) ; do
+    case "${args[j]}" in
+        -d|--disable-plotting|-v|--verbose)
+            merge_args+=("${args[j]}") ;;
+        -n|--processes-number|-c|--plotting-parameters-file|--signal-engine)
+            merge_args+=("${args[j]}" "${args[j + 1]}") ;;
+    esac
+done
+
+for ((i = 0; i < count; i++)) ; do
+    merge_args+=("$shard_dir/shard_${i}_of_${count}.dill")
+done
+
+python3 "$scorer" merge -o "$output_dir" "${merge_args[@]}"
@@ -968,3 +968,215 @@ test_24_0() {
     -f "data/test_4-0_file-index.json" \
     -o "$1" -v --transformations single_bbox_per_frame
 }
+
+# ActEV19_AD on the inputs of test_9_0, scored in 3 shards with
+# run_sharded.sh then merged.  The merged scores and DET curves must
+# be byte for byte those of the same command run unsharded
+test_25_0() {
+    args=("ActEV19_AD" \
+    -s "data/test_9-0_fake-sysout.json" \
+    -r "data/test_9-0.json" \
+    -a "data/test_9-0_activity-index.json" \
+    -f "data/test_9-0_file-index.json" \
+    -F \
+    -v)
+    ../run_sharded.sh 3 "$1" "${args[@]}" || return 1
+    ../ActEV_Scorer.py "${args[@]}" -o "$1/unsharded" > /dev/null || return 1
+
+    status=0
+    for f in scores_by_activity.csv scores_aggregated.csv scores_by_activity_and_threshold.csv alignment.csv pair_metrics.csv dm/RFA_Closing.dm dm/TFA_Closing.dm dm/RFA_mean_byfa.dm dm/TFA_mean_byfa.dm ; do
+        cmp "$1/unsharded/$f" "$1/$f" || status=1
+    done
+    rm -rf "$1/shards" "$1/unsharded"
+    return $status
+}
+
+# ActEV18_AD integration test 1, with the reference and file index
+# compiled into a bundle first.  The scores must match the checkfiles
+# of test_1_0
+test_26_0() {
+    ../ActEV_Scorer.py \
+    "compile-reference" \
+    -r "data/VIRAT_S_000000.json" \
+    -f "data/VIRAT_S_000000_file-index.json" \
+    -o "$1/reference.bundle" \
+    -v || return 1
+    ../ActEV_Scorer.py \
+    "ActEV18_AD" \
+    -s "data/VIRAT_S_000000_fake-sysout.json" \
+    -b "$1/reference.bundle" \
+    -a "data/VIRAT_S_000000_activity-index.json" \
+    -o "$1" \
+    -d \
+    -v || return 1
+    rm "$1/reference.bundle"
+    python3 diff.py "$checkfiles_dir/test_1_0" "$1"
+}
+
+# A bundle compiled with -i can't be used by a run without it
+test_26_1() {
+    ../ActEV_Scorer.py \
+    "compile-reference" \
+    -r "data/VIRAT_S_000000.json" \
+    -f "data/VIRAT_S_000000_file-index.json" \
+    -o "$1/reference.bundle" \
+    -i || return 1
+    output=$(../ActEV_Scorer.py \
+    "ActEV18_AD" \
+    -s "data/VIRAT_S_000000_fake-sysout.json" \
+    -b "$1/reference.bundle" \
+    -a "data/VIRAT_S_000000_activity-index.json" \
+    -o "$1" \
+    -d)
+    status=$?
+    rm "$1/reference.bundle"
+    echo "$output"
+    [ $status -ne 0 ] && echo "$output" | grep -q "Reference bundle was compiled with ignore_no_score_regions set to 'True', not 'False'"
+}
+
+# ActEV_SDL_V2 integration test 20_0 run cold then warm against the
+# same --cache-dir.  The warm run loads both inputs from the cache and
+# must score as the cold one.  An ActEV19_AD run, whose schema differs,
+# then still finds the reference there but revalidates the system
+# output, and must score as it does without the cache
+test_27_0() {
+    rm -rf "$1/cache"
+    args=(-s "data/test_20-0_fake-sysout.json" \
+    -r "data/test_11-4.json" \
+    -a "data/test_9-0_activity-index.json" \
+    -f "data/test_11-0_file-index.json" \
+    --cache-dir "$1/cache" \
+    -d -v)
+    ../ActEV_Scorer.py "ActEV_SDL_V2" "${args[@]}" -o "$1" -e || return 1
+    ../ActEV_Scorer.py "ActEV_SDL_V2" "${args[@]}" -o "$1/warm" -e > "$1/warm.log" || return 1
+    ../ActEV_Scorer.py "ActEV19_AD" "${args[@]}" -o "$1/other" > "$1/other.log" || return 1
+    ../ActEV_Scorer.py "ActEV19_AD" "${args[@]:0:8}" -d -o "$1/uncached" > /dev/null || return 1
+
+    status=0
+    grep -q "Loaded 3 reference activities from cache" "$1/warm.log" || status=1
+    grep -q "Loaded 4 system activities from cache" "$1/warm.log" || status=1
+    grep -q "Loaded 3 reference activities from cache" "$1/other.log" || status=1
+    grep -q "system activities from cache" "$1/other.log" && status=1
+    grep -q "Validating system output against JSON schema" "$1/other.log" || status=1
+    for f in scores_by_activity.csv scores_aggregated.csv scores_by_activity_and_threshold.csv alignment.csv pair_metrics.csv ; do
+        cmp "$1/$f" "$1/warm/$f" || status=1
+        cmp "$1/uncached/$f" "$1/other/$f" || status=1
+    done
+    rm -rf "$1/cache" "$1/warm" "$1/other" "$1/uncached" "$1/warm.log" "$1/other.log"
+    return $status
+}
+
+# A system output cached by an ActEV19_AD run lacks the
+# processingReport ActEV_SDL_V2 requires; the cache can't stand in
+# for validation against the other schema, which fails
+test_27_1() {
+    rm -rf "$1/cache"
+    args=(-s "data/VIRAT_S_000000_fake-sysout.json" \
+    -r "data/VIRAT_S_000000.json" \
+    -a "data/VIRAT_S_000000_activity-index.json" \
+    -f "data/VIRAT_S_000000_file-index.json" \
+    --cache-dir "$1/cache" \
+    -o "$1/scores" \
+    -d)
+    ../ActEV_Scorer.py "ActEV19_AD" "${args[@]}" > /dev/null || return 1
+    output=$(../ActEV_Scorer.py "ActEV_SDL_V2" "${args[@]}")
+    status=$?
+    rm -rf "$1/cache" "$1/scores"
+    echo "$output"
+    [ $status -ne 0 ] && echo "$output" | grep -q "'processingReport' is a required property"
+}
+
+# ActEV18_AD integration test 1, streaming the system output.  The
+# alignment and scores must match the checkfiles of test_1_0
+test_28_0() {
+    ../ActEV_Scorer.py \
+    "ActEV18_AD" \
+    -s "data/VIRAT_S_000000_fake-sysout.json" \
+    -r "data/VIRAT_S_000000.json" \
+    -a "data/VIRAT_S_000000_activity-index.json" \
+    -f "data/VIRAT_S_000000_file-index.json" \
+    -o "$1" \
+    -d \
+    -v \
+    --stream-system-output || return 1
+    python3 diff.py "$checkfiles_dir/test_1_0" "$1"
+}
+
+# A streamed system output whose 8th activity instance is invalid
+# fails validation on that instance, as it does when not streamed
+test_28_1() {
+    python3 -c "import json, sys; s = json.load(open(sys.argv[1])); s['activities'][7]['presenceConf'] = '0.5'; json.dump(s, open(sys.argv[2], 'w'))" \
+    "data/VIRAT_S_000000_fake-sysout.json" "$1/invalid-sysout.json" || return 1
+    status=0
+    for stream in "--stream-system-output" "" ; do
+        output=$(../ActEV_Scorer.py \
+        "ActEV18_AD" \
+        -s "$1/invalid-sysout.json" \
+        -r "data/VIRAT_S_000000.json" \
+        -a "data/VIRAT_S_000000_activity-index.json" \
+        -f "data/VIRAT_S_000000_file-index.json" \
+        -o "$1/scores" \
+        -d $stream) && status=1
+        echo "$output"
+        echo "$output" | grep -q "failed on activity instance 7\. Aborting!" || status=1
+    done
+    rm -rf "$1/invalid-sysout.json" "$1/scores"
+    return $status
+}
+
+# --stream-system-output can't be combined with -P or --transformations
+test_28_2() {
+    status=0
+    for option in "-P 0.5" "--transformations single_bbox" ; do
+        output=$(../ActEV_Scorer.py \
+        "ActEV18_AD" \
+        -s "data/VIRAT_S_000000_fake-sysout.json" \
+        -r "data/VIRAT_S_000000.json" \
+        -a "data/VIRAT_S_000000_activity-index.json" \
+        -f "data/VIRAT_S_000000_file-index.json" \
+        -o "$1/scores" \
+        -d \
+        --stream-system-output $option) && status=1
+        echo "$output"
+        echo "$output" | grep -q "can't be combined with -P, --transformations or --rewrite" || status=1
+    done
+    rm -rf "$1/scores"
+    return $status
+}
+
+# A missing reference, loaded in a loader thread, fails the run with
+# its error
+test_29_0() {
+    output=$(../ActEV_Scorer.py \
+    "ActEV18_AD" \
+    -s "data/VIRAT_S_000000_fake-sysout.json" \
+    -r "data/missing.json" \
+    -a "data/VIRAT_S_000000_activity-index.json" \
+    -f "data/VIRAT_S_000000_file-index.json" \
+    -o "$1/scores" \
+    -d 2>&1)
+    status=$?
+    echo "$output"
+    [ $status -ne 0 ] && echo "$output" | grep -q "^\[Error\] \[Errno 2\] No such file or directory: 'data/missing.json'. Aborting!$" && ! echo "$output" | grep -q "Traceback"
+}
+
+# A malformed reference likewise fails the run, with a system output
+# large enough (over VALIDATION_MIN_POOL_BYTES) to be validated in the
+# worker pool forked before the loader threads start
+test_29_1() {
+    python3 -c "import json, sys; s = json.load(open(sys.argv[1])); s['activities'] = s['activities'] * 40; json.dump(s, open(sys.argv[2], 'w'))" \
+    "data/VIRAT_S_000000_fake-sysout.json" "$1/large-sysout.json" || return 1
+    echo '{ "filesProcessed": [ "VIRAT_S_000000.mp4" ], "activities": [' > "$1/malformed.json"
+    output=$(../ActEV_Scorer.py \
+    "ActEV18_AD" \
+    -s "$1/large-sysout.json" \
+    -r "$1/malformed.json" \
+    -a "data/VIRAT_S_000000_activity-index.json" \
+    -f "data/VIRAT_S_000000_file-index.json" \
+    -o "$1/scores" \
+    -d 2>&1)
+    status=$?
+    rm -rf "$1/large-sysout.json" "$1/malformed.json" "$1/scores"
+    echo "$output" | sed -e "s:$1/::"
+    [ $status -ne 0 ] && echo "$output" | grep -q "^\[Error\] Invalid JSON in '$1/malformed.json': .*\. Aborting!$" && ! echo "$output" | grep -q "Traceback"
+}
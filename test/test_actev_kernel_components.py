@@ -155,6 +155,40 @@ class TestSpatialOverlapFilter(TestActEVKernelComponents):
         self.assert_filter(self.spatial_overlap_filter_2(self.s_a2, self.s_a4), (False, { "spatial_intersection-over-union": float(25) / (275 + 200) }))
         self.assert_filter(self.spatial_overlap_filter_2(self.s_a3, self.s_a4), (False, { "spatial_intersection-over-union": float(0) / (250 + 200) }))
 
+class TestSimpleSpatialOverlapFilter(TestActEVKernelComponents):
+    def setUp(self):
+        super(TestSimpleSpatialOverlapFilter, self).setUp()
+
+        self.olf_1 = ObjectLocalizationFrame({ "x": 10, "y": 10, "w": 5, "h": 10 }, None, "person", 1)
+        self.olf_2 = ObjectLocalizationFrame({ "x": 10, "y": 15, "w": 25, "h": 10 }, None, "person", 2)
+        self.olf_3 = ObjectLocalizationFrame({ "x": 30, "y": 15, "w": 10, "h": 20 }, None, "person", 3)
+
+        self.simple_spatial_overlap_filter = build_simple_spatial_overlap_filter(0.05)
+
+    def test_filter(self):
+        self.assert_filter(self.simple_spatial_overlap_filter(self.olf_1, self.olf_1), (True, { "spatial_intersection-over-union": 1.0 }))
+        self.assert_filter(self.simple_spatial_overlap_filter(self.olf_1, self.olf_2), (True, { "spatial_intersection-over-union": float(25) / 275 }))
+        self.assert_filter(self.simple_spatial_overlap_filter(self.olf_2, self.olf_1), (True, { "spatial_intersection-over-union": float(25) / 275 }))
+        self.assert_filter(self.simple_spatial_overlap_filter(self.olf_1, self.olf_3), (False, { "spatial_intersection-over-union": 0.0 }))
+
+    def test_signal_fallback(self):
+        self.assertEqual(self.simple_spatial_overlap_filter(self.olf_1, self.olf_2),
+                         self.simple_spatial_overlap_filter(OLF(self.olf_1.spatial_signal), OLF(self.olf_2.spatial_signal)))
+
+    def test_matrix(self):
+        refs = [ self.olf_1, self.olf_2 ]
+        syss = [ self.olf_1, self.olf_2, self.olf_3 ]
+        cache = {}
+
+        ok = self.simple_spatial_overlap_filter.matrix(refs, syss, cache)
+        siou = simple_spatial_intersection_over_union_component.matrix(refs, syss, cache)["spatial_intersection-over-union"]
+
+        for s_i, s in enumerate(syss):
+            for r_i, r in enumerate(refs):
+                exp_ok, exp_d = self.simple_spatial_overlap_filter(r, s)
+                self.assertEqual(ok[s_i, r_i], exp_ok)
+                self.assertEqual(siou[s_i, r_i], exp_d["spatial_intersection-over-union"])
+
 class TestObjectTypeFilter(TestActEVKernelComponents):
     def test_filter(self):
         self.assertEqual(object_type_match_filter(self.o_1, self.o_1), (True, {}))
@@ -9,6 +9,9 @@ sys.path.append(lib_path)
 from munkres import Munkres, DISALLOWED
 
 import unittest
+from unittest import mock
+import itertools
+import numpy as np
 from alignment import *
 
 class TestAlignment(unittest.TestCase):
@@ -181,6 +184,203 @@ class TestPerformAlignment(TestAlignment):
 
         self.assertAlignment(perform_alignment(self.ref_instances_empty, self.sys_instances_1, self.kernel_multi), (self.corr_d, [], self.fa_d))
 
+    def test_matrix_kernel(self):
+        def _filter_1(r_i, s_i):
+            return (r_i != 3, {})
+
+        def _comp_1_func(r_i, s_i, cache):
+            return { "multi": r_i * s_i }
+
+        _filter_1.matrix = lambda refs, syss, cache: np.array(refs)[None, :] != 3
+        _comp_1_func.matrix = lambda refs, syss, cache: { "multi": np.outer(syss, refs) }
+
+        kernel = build_linear_combination_kernel([_filter_1], [_comp_1_func], { "multi": 1 })
+        self.assertTrue(hasattr(kernel, "matrix"))
+        self.assertFalse(hasattr(self.kernel_multi, "matrix"))
+
+        with mock.patch("alignment.MATRIX_KERNEL_MIN_PAIRS", 0):
+            self.assertAlignment(perform_alignment(self.ref_instances_1, self.sys_instances_1, kernel), (self.corr_1, self.miss_1, self.fa_1))
+            self.assertAlignment(perform_alignment(self.ref_instances_1, self.sys_instances_empty, kernel), (self.corr_d, self.miss_d, []))
+
+    def test_candidate_kernel(self):
+        evaluated = []
+        def _filter_1(r_i, s_i):
+            evaluated.append((r_i, s_i))
+            return (r_i != 3, {})
+
+        def _comp_1_func(r_i, s_i, cache):
+            return { "multi": r_i * s_i }
+
+        _filter_1.candidates = lambda refs, syss: { (s, r) for s in range(len(syss)) for r in range(len(refs)) if refs[r] != 3 }
+
+        kernel = build_linear_combination_kernel([_filter_1], [_comp_1_func], { "multi": 1 })
+        self.assertTrue(hasattr(kernel, "candidates"))
+
+        self.assertAlignment(perform_alignment(self.ref_instances_1, self.sys_instances_1, kernel), (self.corr_1, self.miss_1, self.fa_1))
+        self.assertNotIn(3, [ r_i for r_i, s_i in evaluated ])
+
+    def test_assignment_backends(self):
+        self.assertCountEqual(ASSIGNMENT_BACKENDS.keys(), [ "munkres", "scipy" ])
+        self.assertRaises(ValueError, set_assignment_backend, "none")
+
+        with mock.patch("alignment._assignment_backend", "scipy"):
+            self.test_alignment()
+            self.test_alignment_empty()
+            self.test_munkres_unsolvable()
+
+    # No row or column has two equal similarities, but (r0, s2), (r1,
+    # s3), (r2, s0) and (r0, s3), (r1, s2), (r2, s0) both total 14
+    def tied_assignment_cohort(self):
+        table = { (0, 0): 5, (1, 0): 2, (2, 0): 6, (0, 2): 4, (1, 2): 5, (0, 3): 3, (1, 3): 4, (2, 3): 1 }
+
+        def _filter(r_i, s_i):
+            return ((r_i, s_i) in table, {})
+
+        def _comp(r_i, s_i, cache):
+            return { "sim": table.get((r_i, s_i), 0) }
+
+        return ([ 0, 1, 2 ], [ 0, 1, 2, 3 ], build_linear_combination_kernel([ _filter ], [ _comp ], { "sim": 1 }, initial_similarity = 0))
+
+    def test_assignment_backend_ties(self):
+        from alignment import _unique_optimum
+
+        # Both backends find an optimal alignment, and the same one
+        # unless several are optimal
+        for refs, syss, kernel in [ self.tied_assignment_cohort() ] + list(self.random_cohorts()) + list(self.random_cohorts(tied = False)):
+            with mock.patch("alignment._assignment_backend", "scipy"):
+                scipy_alignment = perform_alignment(refs, syss, kernel)
+
+            munkres_alignment = perform_alignment(refs, syss, kernel)
+            self.assertAlmostEqual(sum(c.kernel_similarity for c in scipy_alignment[0]), sum(c.kernel_similarity for c in munkres_alignment[0]))
+
+            sims, max_sim, _ = evaluate_alignment_kernel(refs, syss, kernel, alignment_pairs(refs, syss, kernel))
+            if _unique_optimum(sims, { (syss.index(c.sys), refs.index(c.ref)) for c in munkres_alignment[0] }, max_sim):
+                self.assertEqual(self.assigned(scipy_alignment), self.assigned(munkres_alignment))
+
+        # Of (r0, s2), (r1, s3), (r2, s0) and (r0, s3), (r1, s2), (r2,
+        # s0), the first has the smallest (sys, ref) pair, (s2, r0)
+        with mock.patch("alignment._assignment_backend", "scipy"):
+            self.assertEqual(self.assigned(perform_alignment(*self.tied_assignment_cohort()))[0], [ (0, 2), (1, 3), (2, 0) ])
+
+    def test_canonical_optimum(self):
+        from alignment import _canonical_optimum
+
+        # Brute force: of the optimal matchings, the canonical one has
+        # the smallest pair of any difference with another
+        rng = np.random.RandomState(7)
+        for _ in range(200):
+            sims = { (s_i, r_i): int(rng.randint(0, 4)) for s_i in range(4) for r_i in range(3) if rng.rand() < 0.6 }
+            pairs = sorted(sims)
+            matchings = [ set(m) for k in range(4) for m in itertools.combinations(pairs, k)
+                          if len({ s_i for s_i, _ in m }) == k and len({ r_i for _, r_i in m }) == k ]
+            best = max(sum(sims[p] for p in m) for m in matchings)
+            optimal = [ m for m in matchings if sum(sims[p] for p in m) == best ]
+            expected = max(optimal, key = lambda m: [ p in m for p in pairs ])
+
+            for m in optimal:
+                self.assertEqual(_canonical_optimum(sims, m, max([ 0 ] + list(sims.values()))), expected)
+
+    def test_connected_components(self):
+        from alignment import _connected_components
+
+        self.assertEqual(_connected_components(set()), [])
+        self.assertCountEqual(_connected_components({ (0, 1), (2, 1), (2, 3), (1, 0), (4, 4) }),
+                              [ ([ 0, 2 ], [ 1, 3 ]), ([ 1 ], [ 0 ]), ([ 4 ], [ 4 ]) ])
+
+    def test_component_alignment(self):
+        # Each sys instance can only align with the reference of the
+        # same parity; the two components are solved separately
+        def _filter(r_i, s_i):
+            return ((r_i - s_i) % 2 == 0, {})
+
+        def _comp(r_i, s_i, cache):
+            return { "sim": -abs(r_i - s_i) }
+
+        kernel = build_linear_combination_kernel([ _filter ], [ _comp ], { "sim": 1 }, initial_similarity = 10)
+        for enabled in [ False, True ]:
+            with mock.patch("alignment._alignment_components", enabled):
+                corr, miss, fa = perform_alignment([ 1, 2, 3, 4, 9 ], [ 2, 3, 8, 6, 10 ], kernel)
+
+            self.assertCountEqual([ (c.ref, c.sys) for c in corr ], [ (2, 2), (3, 3), (4, 6) ])
+            self.assertCountEqual([ m.ref for m in miss ], [ 1, 9 ])
+            self.assertCountEqual([ f.sys for f in fa ], [ 8, 10 ])
+
+        with mock.patch("alignment._alignment_components", True):
+            self.test_alignment()
+            self.test_alignment_empty()
+            self.test_munkres_unsolvable()
+
+    # With tied, few distinct similarities, most cohorts have several
+    # equally good alignments.  A lower density of allowed pairs gives
+    # more connected components
+    def random_cohorts(self, tied = True, density = 0.3, count = 50):
+        rng = np.random.RandomState(11)
+        for _ in range(count):
+            refs, syss = list(range(12)), list(range(100, 112))
+            table = { (r, s): int(rng.randint(1, 3)) if tied else 1 + rng.rand() for r in refs for s in syss if rng.rand() < density }
+
+            def _filter(r_i, s_i, table = table):
+                return ((r_i, s_i) in table, {})
+
+            def _comp(r_i, s_i, cache, table = table):
+                return { "sim": table.get((r_i, s_i), 0) }
+
+            yield (refs, syss, build_linear_combination_kernel([ _filter ], [ _comp ], { "sim": 1 }))
+
+    def assigned(self, alignment):
+        corr, miss, fa = alignment
+        return (sorted((c.ref, c.sys) for c in corr), sorted(m.ref for m in miss), sorted(f.sys for f in fa))
+
+    def test_component_alignment_ties(self):
+        for refs, syss, kernel in [ self.tied_assignment_cohort() ] + list(self.random_cohorts(density = 0.1)) + list(self.random_cohorts(tied = False, density = 0.1)):
+            with mock.patch("alignment._alignment_components", True):
+                components = perform_alignment(refs, syss, kernel)
+
+            self.assertEqual(self.assigned(components), self.assigned(perform_alignment(refs, syss, kernel)))
+
+            # The scipy backend chooses within a component as within
+            # the whole cohort, without checking for other optima
+            with mock.patch("alignment._assignment_backend", "scipy"), mock.patch("alignment._unique_optimum") as unique:
+                with mock.patch("alignment._alignment_components", True):
+                    components = perform_alignment(refs, syss, kernel)
+
+                self.assertEqual(self.assigned(components), self.assigned(perform_alignment(refs, syss, kernel)))
+                unique.assert_not_called()
+
+    def test_part_alignment_ties(self):
+        # A part of a cohort with several optimal assignments might
+        # align unlike the whole cohort, and is left to it
+        self.assertIsNone(perform_alignment(*self.tied_assignment_cohort(), part = True))
+
+        for refs, syss, kernel in self.random_cohorts(tied = False):
+            self.assertEqual(self.assigned(perform_alignment(refs, syss, kernel, part = True)), self.assigned(perform_alignment(refs, syss, kernel)))
+
+        # The scipy backend chooses within a part as within the whole
+        # cohort, so a part is never left to it
+        with mock.patch("alignment._assignment_backend", "scipy"):
+            for refs, syss, kernel in [ self.tied_assignment_cohort() ] + list(self.random_cohorts()):
+                self.assertEqual(self.assigned(perform_alignment(refs, syss, kernel, part = True)), self.assigned(perform_alignment(refs, syss, kernel)))
+
+    def test_block_evaluation(self):
+        def _filter(r_i, s_i):
+            return ((r_i - s_i) % 2 == 0, {})
+
+        def _comp(r_i, s_i, cache):
+            return { "sim": -abs(r_i - s_i) }
+
+        kernel = build_linear_combination_kernel([ _filter ], [ _comp ], { "sim": 1 }, initial_similarity = 10)
+        refs, syss = [ 1, 2, 3, 4, 9 ], [ 2, 3, 8, 6, 10, 3 ]
+
+        pairs = alignment_pairs(refs, syss, kernel)
+        blocks = row_blocks(pairs, 4)
+        self.assertEqual([ p for b in blocks for p in b ], pairs)
+        for a, b in zip(blocks, blocks[1:]):
+            self.assertLess(a[-1][0], b[0][0])
+
+        evaluation = merge_kernel_evaluations([ evaluate_alignment_kernel(refs, syss, kernel, b) for b in blocks ])
+        self.assertAlignment(perform_alignment(refs, syss, kernel, evaluation = evaluation),
+                             perform_alignment(refs, syss, kernel))
+
     def test_munkres_unsolvable(self):
         # If using DISALLOWED alone, the "munkres" library can't solve
         # a matrix with possible assignments less than max(M, N).  The
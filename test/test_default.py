@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+
+test_path = os.path.dirname(os.path.abspath(__file__))
+lib_path = os.path.join(test_path, "../lib")
+sys.path.append(lib_path)
+sys.path.append(os.path.join(lib_path, "protocols"))
+
+import json
+import unittest
+from activity_instance import ActivityInstance
+from actev_sdl_v1 import ActEV_SDL_V1
+from actev19_ad_v2 import ActEV19_AD_V2
+
+def load_data(fn):
+    with open(os.path.join(test_path, "data", fn), "r") as f:
+        return json.load(f)
+
+class TestComputeAlignment(unittest.TestCase):
+    def alignment(self, protocol, system_activities, reference_activities):
+        try:
+            alignment = protocol.compute_alignment(system_activities, reference_activities)
+        finally:
+            protocol.close_pool()
+
+        def _id(inst):
+            return None if inst is None else inst.activityID
+
+        return sorted((r.alignment, _id(r.ref), _id(r.sys)) for r in alignment)
+
+    def protocol(self, protocol_class = ActEV_SDL_V1):
+        protocol = protocol_class({}, load_data("test_12-0_file-index.json"), load_data("test_9-0_activity-index.json"), "")
+        protocol.pn = 2
+        protocol.minmax = None
+        return protocol
+
+    def test_split_cohorts(self):
+        # The cohorts of test_12_0 (ActEV_SDL_V1) and test_12_1
+        # (ActEV19_AD_V2) have several equally good alignments, which
+        # splitting them mustn't choose between differently
+        syss = [ ActivityInstance(a) for a in load_data("test_12-0_fake-sysout.json")["activities"] ]
+        refs = [ ActivityInstance(a) for a in load_data("test_12-0.json")["activities"] ]
+        for protocol_class in [ ActEV_SDL_V1, ActEV19_AD_V2 ]:
+            protocol = self.protocol(protocol_class)
+
+            expected = self.alignment(protocol, syss, refs)
+            protocol.split_cohorts = True
+            self.assertEqual(self.alignment(protocol, syss, refs), expected)
+
+    def test_split_cohorts_ties(self):
+        def _instance(activity_id, start, end, presence_conf = None):
+            activity = { "activity": "Closing", "activityID": activity_id, "localization": { "VIRAT_S_000000.mp4": { str(start): 1, str(end): 0 } } }
+            if presence_conf is not None:
+                activity.update(presenceConf = presence_conf, alertFrame = start)
+            return ActivityInstance(activity)
+
+        # Both references have two equally good candidates, and their
+        # windows meet at frame 200.  Aligned on its own, the first
+        # window would pick the other of its candidates
+        refs = [ _instance(1, 100, 200), _instance(2, 200, 300) ]
+        syss = [ _instance(1, 200, 300, 0.5), _instance(2, 100, 200, 0.5), _instance(3, 200, 300, 0.5), _instance(4, 100, 200, 0.5) ]
+        protocol = self.protocol()
+        expected = self.alignment(protocol, syss, refs)
+        protocol.split_cohorts = True
+        self.assertEqual(self.alignment(protocol, syss, refs), expected)
+
+if __name__ == '__main__':
+    unittest.main()
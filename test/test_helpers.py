@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+
+lib_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../lib")
+sys.path.append(lib_path)
+
+import shutil
+import tempfile
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+import helpers
+from helpers import *
+
+class TestSharedDispatch(unittest.TestCase):
+    def setUp(self):
+        offset = 10
+        self.payload = (lambda a, b: a * b + offset, [ (1, 2), (3, 4), (5, 6) ])
+
+    def test_inherited(self):
+        path = publish_shared("test-inherited", self.payload, inherited=True)
+        self.assertIsNone(path)
+        try:
+            results, elapsed = call_shared(("test-inherited", path, [ 2, 0, 1 ], None))
+            self.assertEqual(results, [ 40, 12, 22 ])
+            self.assertTrue(elapsed >= 0)
+        finally:
+            release_shared("test-inherited", path)
+
+        self.assertRaises(KeyError, get_shared, "test-inherited")
+
+    def test_payload_file(self):
+        func, args_list = self.payload
+        path = publish_shared("test-file", (func, None))
+        self.assertTrue(os.path.exists(path))
+        try:
+            # Simulates a worker that was started before publishing;
+            # tasks carry the arguments of their batch
+            helpers._shared_payloads.clear()
+            self.assertEqual(call_shared(("test-file", path, [ 2, 0 ], pack_batch(args_list, [ 2, 0 ])))[0], [ 40, 12 ])
+
+            with ProcessPoolExecutor(2) as pool:
+                tasks = [ ("test-file", path, [ i ], pack_batch(args_list, [ i ])) for i in range(3) ]
+                self.assertEqual([ r for r, _ in pool.map(call_shared, tasks) ], [ [ 12 ], [ 22 ], [ 40 ] ])
+        finally:
+            release_shared("test-file", path)
+
+        self.assertFalse(os.path.exists(path))
+
+class TestScheduleBatches(unittest.TestCase):
+    def test_largest_first(self):
+        self.assertEqual(schedule_batches([ 1, 50, 3, 20 ], 4, 1), [ [ 1 ], [ 3 ], [ 2, 0 ] ])
+
+    def test_small_tasks_packed(self):
+        batches = schedule_batches([ 1 ] * 100, 5)
+        self.assertEqual(len(batches), 20)
+        self.assertEqual(sorted(i for b in batches for i in b), list(range(100)))
+
+    def test_skewed(self):
+        costs = [ 1000 ] + [ 1 ] * 40
+        batches = schedule_batches(costs, 4)
+        self.assertEqual(batches[0], [ 0 ])
+        self.assertEqual(len(batches), 2)
+
+    def test_empty(self):
+        self.assertEqual(schedule_batches([], 4), [])
+
+class TestPartitionByCost(unittest.TestCase):
+    def test_partition_by_cost(self):
+        self.assertEqual(partition_by_cost([ 5, 1, 8, 3, 3 ], 2), [ 1, 1, 0, 1, 0 ])
+        self.assertEqual(partition_by_cost([ 5, 1, 8 ], 5), [ 1, 2, 0 ])
+        self.assertEqual(partition_by_cost([], 3), [])
+
+    def test_balanced(self):
+        costs = [ 1 ] * 12
+        parts = partition_by_cost(costs, 4)
+        self.assertEqual(sorted(parts.count(p) for p in range(4)), [ 3, 3, 3, 3 ])
+
+class TestGitCommit(unittest.TestCase):
+    def setUp(self):
+        self.git_dir, self.provenance_file = helpers.GIT_DIR, helpers.PROVENANCE_FILE
+        self.tmp_dir = tempfile.mkdtemp()
+        helpers.PROVENANCE_FILE = os.path.join(self.tmp_dir, "provenance.txt")
+        with open(helpers.PROVENANCE_FILE, "w") as f:
+            f.write("0123abcd--2020-01-01T00:00:00-05:00\n")
+        helpers._git_commit = None
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+        helpers.GIT_DIR, helpers.PROVENANCE_FILE = self.git_dir, self.provenance_file
+        helpers._git_commit = None
+
+    def test_git(self):
+        # Preferred to the provenance file
+        if not os.path.isdir(helpers.GIT_DIR):
+            self.skipTest("not run from the git repository")
+        self.assertRegex(git_commit(), rb"^[0-9a-f]{40}--")
+
+    def test_provenance_file(self):
+        helpers.GIT_DIR = os.path.join(self.tmp_dir, ".git")
+        self.assertEqual(git_commit(), b"0123abcd--2020-01-01T00:00:00-05:00")
+
+        # Looked up once per process
+        open(helpers.PROVENANCE_FILE, "w").close()
+        self.assertEqual(git_commit(), b"0123abcd--2020-01-01T00:00:00-05:00")
+
+    def test_unknown(self):
+        helpers.GIT_DIR = os.path.join(self.tmp_dir, ".git")
+        os.remove(helpers.PROVENANCE_FILE)
+        self.assertEqual(git_commit(), b"unknown")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+
+lib_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../lib")
+sys.path.append(lib_path)
+
+import shutil
+import tempfile
+import unittest
+from input_cache import *
+from activity_instance import ActivityInstance
+
+class TestInputCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_content_hash(self):
+        a, b = os.path.join(self.cache_dir, "a.json"), os.path.join(self.cache_dir, "b.json")
+        for path, content in [ (a, '{"activities": []}'), (b, '{"activities": [ ]}') ]:
+            with open(path, 'w') as f:
+                f.write(content)
+
+        self.assertEqual(file_content_hash(a), file_content_hash(a, chunk_size=3))
+        self.assertNotEqual(file_content_hash(a), file_content_hash(b))
+
+    def test_key(self):
+        self.assertEqual(cache_key("system", "abc", True, None), cache_key("system", "abc", True, None))
+        self.assertNotEqual(cache_key("system", "abc", True, None), cache_key("system", "abc", False, None))
+        self.assertNotEqual(cache_key("system", "abc", True, None), cache_key("reference", "abc", True, None))
+
+    def test_store_load(self):
+        key = cache_key("reference", "abc")
+        self.assertIsNone(load_cached(self.cache_dir, key))
+
+        instances = [ ActivityInstance({ "activity": "walk", "activityID": 1, "localization": { "a.mp4": { "10": 1, "20": 0 } } }) ]
+        store_cached(self.cache_dir, key, instances)
+        loaded = load_cached(self.cache_dir, key)
+        self.assertEqual([ (a.activity, a.activityID, a.localization) for a in loaded ], [ ("walk", 1, { "a.mp4": { 10: 1, 20: 0 } }) ])
+        self.assertEqual(os.listdir(self.cache_dir), [ os.path.basename(cache_path(self.cache_dir, key)) ])
+
+    def test_corrupt_entry(self):
+        key = cache_key("reference", "abc")
+        with open(cache_path(self.cache_dir, key), 'wb') as f:
+            f.write(b"\x80\x04truncated")
+
+        self.assertIsNone(load_cached(self.cache_dir, key))
+
+if __name__ == '__main__':
+    unittest.main()
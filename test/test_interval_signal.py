@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import random
+from functools import reduce
+
+lib_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../lib")
+sys.path.append(lib_path)
+
+import unittest
+from operator import add
+from sparse_signal import SparseSignal as S
+from interval_signal import IntervalSignal as I
+
+class TestIntervalSignal(unittest.TestCase):
+    def setUp(self):
+        super(TestIntervalSignal, self).setUp()
+
+        self.se = I()
+        self.s1 = I({30: 1, 60: 0})
+        self.s2 = I({0: 1, 10: 0})
+        self.s3 = I({30: 1, 40: 0})
+        self.s5 = I({0: 1, 30: 0})
+        self.s6 = I({60: 1, 100: 0})
+        self.s7 = I({0: 1, 100: 0})
+
+        self.sb1 = I({0: 1, 30: 2, 60: 1, 100: 0})
+        self.sb3 = I({30: 1, 60: 2, 100: 1, 130: 0})
+
+        self.si1 = I({45: 1, 100: 0})
+
+        self.sn1 = I({0: 1, 10: 1, 20: 0})
+
+        self.sc1 = I({5: 1, 10: 0})
+        self.sc3 = I({0: 1, 10: 0})
+
+    def testSignalEquivalence(self):
+        self.assertEqual(self.se, self.se)
+        self.assertEqual(self.s1, I({30: 1, 60: 0}))
+        self.assertEqual(self.s1, S({30: 1, 60: 0}))
+        self.assertEqual(I({'30': 1, '60': 0}), self.s1)
+        self.assertEqual(self.sn1, I({0: 1, 20: 0}))
+
+    def testSignalAddition(self):
+        self.assertEqual(self.s1 + self.se, self.s1)
+        self.assertEqual(self.s1 + self.s2, I({0: 1, 10: 0, 30: 1, 60: 0}))
+        self.assertEqual(self.s1 + self.s3, I({30: 2, 40: 1, 60: 0}))
+        self.assertEqual(self.s1 + self.s7, I({0: 1, 30: 2, 60: 1, 100: 0}))
+        self.assertEqual(reduce(add, [self.s1, self.s1, self.s1]), I({30: 3, 60: 0}))
+
+    def testIntersection(self):
+        self.assertEqual(self.s1 & self.se, self.se)
+        self.assertEqual(self.s1 & self.s2, self.se)
+        self.assertEqual(self.s1 & self.s3, self.s3)
+        self.assertEqual(self.s1 & self.sb1, self.s1)
+        self.assertEqual(self.s1 & self.si1, I({45: 1, 60: 0}))
+
+    def testUnion(self):
+        self.assertEqual(self.se | self.se, self.se)
+        self.assertEqual(self.s1 | self.s2, I({0: 1, 10: 0, 30: 1, 60: 0}))
+        self.assertEqual(self.s1 | self.s5 | self.s6, self.s7)
+        self.assertEqual(self.s7 | self.s5, self.s7)
+
+    def testSubtraction(self):
+        self.assertEqual(self.se - self.s1, self.se)
+        self.assertEqual(self.s1 - self.si1, I({30: 1, 45: 0}))
+        self.assertEqual(self.sb1 - self.s1, I({0: 1, 100: 0}))
+        self.assertEqual(self.sb1 - self.sb3, I({0: 1, 60: 0}))
+        self.assertEqual(self.sb3 - self.sb1, I({60: 1, 130: 0}))
+
+    def testArea(self):
+        self.assertEqual(self.se.area(), 0)
+        self.assertEqual(self.s1.area(), 30)
+        self.assertEqual(self.sb1.area(), 130)
+        self.assertEqual(I({10.45: 1, 20: 0}).area(), 9.55)
+
+    def testNotSig(self):
+        self.assertEqual(self.se.not_sig(100), I({0: 1, 100: 0}))
+        self.assertEqual(self.s1.not_sig(100), I({0: 1, 30: 0, 60: 1, 100: 0}))
+        self.assertEqual(self.s7.not_sig(100), self.se)
+        self.assertEqual(self.sb1.not_sig(120), I({100: 1, 120: 0}))
+
+    def testGenerateCollar(self):
+        self.assertEqual(self.sc1.generate_collar(2), I({3: 1, 7: 0, 8: 1, 12: 0}))
+        self.assertEqual(self.sc3.generate_collar(2), I({-2: 1, 2: 0, 8: 1, 12: 0}))
+        self.assertEqual(self.sc1.generate_collar(5), I({0: 1, 15: 0}))
+        self.assertEqual(self.sc1.generate_collar(0), self.se)
+
+    def testFromIntervals(self):
+        self.assertEqual(I.from_intervals([], []), self.se)
+        self.assertEqual(I.from_intervals([30, 0], [60, 10]), self.s1 + self.s2)
+        self.assertEqual(I.from_intervals([0, 10], [10, 20]), I({0: 1, 20: 0}))
+        self.assertEqual(I.from_intervals([0, 30], [100, 60]), self.s7 + self.s1)
+
+    def testToSparseSignal(self):
+        self.assertEqual(self.sb1.to_sparse_signal(), S({0: 1, 30: 2, 60: 1, 100: 0}))
+        self.assertEqual(self.se.to_sparse_signal(), S())
+
+    def testMatchesSparseSignal(self):
+        rng = random.Random(0)
+
+        def _random_signal():
+            signal = S()
+            points = sorted(rng.sample(range(0, 100), 2 * rng.randint(0, 4)))
+            for start, end in zip(points[::2], points[1::2]):
+                signal[start] = rng.choice([1, 2])
+                signal[end] = 0
+            return signal
+
+        for _ in range(200):
+            a, b = _random_signal(), _random_signal()
+            ia, ib = I(a), I(b)
+            for op in (add, lambda x, y: x & y, lambda x, y: x | y, lambda x, y: x - y):
+                self.assertEqual(op(ia, ib), I(op(a, b)))
+                self.assertEqual(op(ia, ib).area(), op(a, b).area())
+            self.assertEqual(ia.generate_collar(3), I(a.generate_collar(3)))
+            self.assertEqual(ia.not_sig(120).area(), a.not_sig(120).area())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+
+lib_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../lib")
+sys.path.append(lib_path)
+
+import io
+import json
+import unittest
+from json_stream import iter_json_array
+
+class TestIterJsonArray(unittest.TestCase):
+    def setUp(self):
+        self.doc = { "filesProcessed": [ "a.mp4", "b.mp4" ],
+                     "activities": [ { "activity": "walk", "presenceConf": 0.25, "localization": { "a.mp4": { "10": 1, "20": 0 } } },
+                                     { "activity": "run", "presenceConf": 12345678901.5e-3, "localization": {} },
+                                     [ 1, -2, "x,]}" ], None, True ],
+                     "processingReport": { "fileStatuses": { "a.mp4": { "status": "success" } } } }
+
+    def stream(self, text, chunk_size):
+        header = {}
+        items = list(iter_json_array(io.StringIO(text), "activities", header, chunk_size))
+        return items, header
+
+    def test_chunk_sizes(self):
+        for indent in [ None, 2 ]:
+            text = json.dumps(self.doc, indent=indent)
+            for chunk_size in [ 1, 3, 16, 1 << 20 ]:
+                items, header = self.stream(text, chunk_size)
+                self.assertEqual(items, self.doc["activities"])
+                self.assertEqual(header, dict(self.doc, activities=[]))
+
+    def test_missing_or_empty(self):
+        self.assertEqual(self.stream('{ "activities": [ ] }', 4), ([], { "activities": [] }))
+        self.assertEqual(self.stream('{"filesProcessed": []}', 4), ([], { "filesProcessed": [] }))
+        self.assertEqual(self.stream(' { } ', 4), ([], {}))
+
+    def test_malformed(self):
+        for text in [ '[ 1, 2 ]', '{ "activities": [ 1, 2', '{ "activities": [ 1 2 ] }', '{ "filesProcessed": }' ]:
+            self.assertRaises(ValueError, self.stream, text, 4)
+
+if __name__ == '__main__':
+    unittest.main()
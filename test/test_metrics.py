@@ -7,6 +7,7 @@ lib_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../lib")
 sys.path.append(lib_path)
 
 import unittest
+from unittest import mock
 from metrics import *
 from sparse_signal import SparseSignal as S
 
@@ -230,6 +231,26 @@ class TestNMIDE(TestMetrics):
 
         assertNMIDE(n_mide(self.c3, self.filedur_1, 10, self.cost_fn, self.cost_fn), { "n-mide": None, "n-mide_num_rejected": 2 })
 
+    def testNMIDE_collar_cache(self):
+        collar_cache = {}
+        for pairs in [ self.c1, self.cd, self.c3, self.c4, self.c1 ]:
+            self.assertEqual(n_mide(pairs, self.filedur_1, 2, self.cost_fn, self.cost_fn, collar_cache),
+                             n_mide(pairs, self.filedur_1, 2, self.cost_fn, self.cost_fn))
+
+        # One entry per reference instance and localization key
+        self.assertEqual(len(collar_cache), 12)
+
+    def testNMIDE_by_count(self):
+        pairs = self.c1 + self.c3 + self.c4 + self.cd
+        num_aligned = [ 0, 1, 3, 5, 8 ]
+
+        for collar_size in [ 0, 2, 10 ]:
+            observed = n_mide_by_count(pairs, num_aligned, self.filedur_1, collar_size, self.cost_fn, self.cost_fn)
+            for i, n in enumerate(num_aligned):
+                expected = n_mide(pairs[:n], self.filedur_1, collar_size, self.cost_fn, self.cost_fn)
+                self.assertEqual(observed["n-mide"][i], expected["n-mide"])
+                self.assertEqual(observed["n-mide_num_rejected"][i], expected["n-mide_num_rejected"])
+
     def testNMIDE_count_rejected(self):
         self.assertEqual(build_n_mide_metric(self.filedur_1, 2)(self.c3)["n-mide_num_rejected"], 0)
         self.assertEqual(build_n_mide_metric(self.filedur_1, 2)(self.cd)["n-mide_num_rejected"], 0)
@@ -336,6 +357,71 @@ class TestTemporalFA(TestSignalMetrics):
 
         self.assertEqual(temporal_fa(self.a3, self.a4), 10)
 
+class TestTemporalOverlapMatrices(TestSignalMetrics):
+    def test_matches_pairwise(self):
+        refs = [ self.ae, self.a1, self.a4, self.a5 ]
+        syss = [ self.a2, self.a3, self.a6, self.a7, self.ae ]
+
+        intersection, union, iou = temporal_overlap_matrices(refs, syss)
+        self.assertEqual(intersection.shape, (len(syss), len(refs)))
+
+        for s_i, s in enumerate(syss):
+            for r_i, r in enumerate(refs):
+                self.assertEqual(intersection[s_i, r_i], temporal_intersection(r, s))
+                self.assertEqual(union[s_i, r_i], temporal_union(r, s))
+                self.assertEqual(iou[s_i, r_i], temporal_intersection_over_union(r, s))
+
+    def test_blocked(self):
+        refs = [ self.a1, self.a2, self.a5, self.a6 ]
+        syss = [ self.a3, self.a5, self.a7 ]
+
+        for expected, observed in zip(temporal_overlap_matrices(refs, syss),
+                                      temporal_overlap_matrices(refs, syss, block_size = 1)):
+            self.assertEqual(expected.tolist(), observed.tolist())
+
+    def test_empty(self):
+        intersection, union, iou = temporal_overlap_matrices([], [ self.a1 ])
+        self.assertEqual(intersection.shape, (1, 0))
+        self.assertEqual(iou.shape, (1, 0))
+
+class TestReferenceSignals(TestMetrics):
+    def setUp(self):
+        self.refs = []
+        for i, (activity, loc) in enumerate([ ("a", {"f1": { 10: 1, 20: 0 }}),
+                                              ("a", {"f1": { 15: 1, 30: 0 }}),
+                                              ("a", {"f2": { 5: 1, 8: 0 }}),
+                                              ("b", {"f1": { 40: 1, 50: 0 }}) ]):
+            r = A(loc, activity)
+            r.activityID = i
+            self.refs.append(r)
+        self.durations = selected_frame_durations({ "f1": { "selected": { "0": 1, "100": 0 } },
+                                                    "f2": { "selected": { "0": 1, "50": 0 } } })
+
+    def tearDown(self):
+        set_reference_precomputed(None, {}, {})
+
+    def test_durations(self):
+        self.assertEqual(self.durations, { "f1": 100, "f2": 50 })
+
+    def test_matches_build_ref_sig(self):
+        ref_sigs = build_reference_signals(self.refs, self.durations)
+        ref = { "f1": self.refs[0:2], "f2": [] }
+        ref_add, not_ref, nr_area = build_ref_sig(ref, self.durations)
+        for key, value in ref.items():
+            self.assertEqual(ref_sigs[reference_signal_key(key, value)],
+                             (ref_add[key], not_ref[key], nr_area[key]))
+
+    def test_precomputed(self):
+        ref = { "f1": self.refs[3:] }
+        key = reference_signal_key("f1", ref["f1"])
+        set_reference_precomputed(get_signal_engine(), {}, { key: ("ref", "not_ref", 7) })
+        self.assertEqual(build_ref_sig(ref, self.durations), [ { "f1": "ref" }, { "f1": "not_ref" }, { "f1": 7 } ])
+
+        # Precomputed signals are only used with the engine they were
+        # built with
+        set_reference_precomputed("other", {}, { key: ("ref", "not_ref", 7) })
+        self.assertEqual(build_ref_sig(ref, self.durations)[2], { "f1": 90 })
+
 class TestMAP(TestMetrics):
     def setUp(self):
         self.activity = "activity"
@@ -448,6 +534,88 @@ class TestSpatialIntersectionOverUnion(TestSpatialSignalMetrics):
         self.assertEqual(spatial_intersection_over_union(self.a2, self.a4), float(25) / (275 + 200))
         self.assertEqual(spatial_intersection_over_union(self.a3, self.a4), float(0) / (250 + 200))
 
+class TestTemporalCandidatePairs(TestMetrics):
+    def test_temporal_candidate_pairs(self):
+        refs = [ A({ "f1": S({ 0: 1, 10: 0 }) }),
+                 A({ "f1": S({ 20: 1, 30: 0, 40: 1, 50: 0 }) }),
+                 A({ "f2": S({ 0: 1, 100: 0 }) }) ]
+        syss = [ A({ "f1": S({ 10: 1, 20: 0 }) }),
+                 A({ "f1": S({ 5: 1, 25: 0 }), "f2": S({ 50: 1, 60: 0 }) }),
+                 A({ "f1": S({ 32: 1, 38: 0 }) }),
+                 A({ "f3": S({ 0: 1, 100: 0 }) }) ]
+
+        self.assertEqual(temporal_candidate_pairs(refs, syss), { (1, 0), (1, 1), (1, 2), (2, 1) })
+        self.assertEqual(temporal_candidate_pairs(refs, []), set())
+
+        # Every pair with some temporal intersection is a candidate
+        intersection, _, _ = temporal_overlap_matrices(refs, syss)
+        for s_i, r_i in zip(*intersection.nonzero()):
+            self.assertIn((s_i, r_i), temporal_candidate_pairs(refs, syss))
+
+class TestTemporalWindows(TestMetrics):
+    def test_temporal_windows(self):
+        refs = [ A({ "f1": S({ 0: 1, 10: 0 }) }),
+                 A({ "f1": S({ 20: 1, 30: 0, 40: 1, 50: 0 }) }),
+                 A({ "f2": S({ 0: 1, 100: 0 }) }),
+                 A({ "f1": S() }) ]
+        syss = [ A({ "f1": S({ 10: 1, 20: 0 }) }),
+                 A({ "f1": S({ 32: 1, 38: 0 }) }),
+                 A({ "f1": S({ 45: 1, 60: 0 }), "f2": S({ 50: 1, 60: 0 }) }),
+                 A({ "f3": S({ 0: 1, 100: 0 }) }) ]
+
+        windows = temporal_windows(refs, syss)
+        self.assertEqual(windows, [ ([ refs[0] ], []),
+                                    ([ refs[1], refs[2] ], [ syss[1], syss[2] ]),
+                                    ([], [ syss[0] ]),
+                                    ([], [ syss[3] ]),
+                                    ([ refs[3] ], []) ])
+
+        # Every temporally intersecting pair falls in the same window
+        window_of = { id(inst): w for w, (rs, ss) in enumerate(windows) for inst in rs + ss }
+        for s_i, r_i in temporal_candidate_pairs(refs, syss):
+            self.assertEqual(window_of[id(syss[s_i])], window_of[id(refs[r_i])])
+
+        self.assertEqual(temporal_windows([], []), [])
+
+class TestTemporalPairOverlaps(TestMetrics):
+    def test_batch_measures(self):
+        refs = [ A({ "f1": S({ 0: 1, 10: 0 }) }),
+                 A({ "f1": S({ 20: 1, 30: 0, 40: 2, 50: 0 }), "f2": S({ 0: 1, 5: 0 }) }),
+                 A({ "f2": S({ 0: 1, 100: 0 }) }) ]
+        syss = [ A({ "f1": S({ 5: 1, 25: 0 }), "f2": S({ 50: 1, 60: 0 }) }),
+                 A({ "f1": S({ 32: 1, 38: 0, 45: 1, 60: 0 }) }),
+                 A({ "f3": S({ 0: 1, 100: 0 }) }),
+                 A({ "f1": S() }) ]
+        pairs = [ (r, s) for r in refs for s in syss ] + [ (refs[0], syss[0]) ]
+
+        for measure in [ temporal_intersection, temporal_union, temporal_fa, temporal_miss ]:
+            self.assertEqual(measure.batch(pairs), [ measure(r, s) for r, s in pairs ])
+            self.assertEqual(measure.batch([]), [])
+
+        # Measures sharing a cache only compute the overlaps once
+        cache = {}
+        with mock.patch("metrics.temporal_pair_overlaps", wraps=temporal_pair_overlaps) as overlaps:
+            for measure in [ temporal_intersection, temporal_union, temporal_fa, temporal_miss ]:
+                self.assertEqual(measure.batch(pairs, cache), [ measure(r, s) for r, s in pairs ])
+        self.assertEqual(overlaps.call_count, 1)
+
+class TestBoundingBoxIntersectionOverUnion(unittest.TestCase):
+    def test_matches_spatial_signal(self):
+        boxes = [ (10, 10, 5, 10), (10, 15, 25, 10), (30, 15, 10, 20), (0, 0, 100, 100), None ]
+
+        def _signal(b):
+            return S() if b is None else S({ b[0]: S({ b[1]: 1, b[1] + b[3]: 0 }), b[0] + b[2]: S() })
+
+        iou = bounding_box_intersection_over_union_matrix(boxes[:3], boxes)
+        self.assertEqual(iou.shape, (len(boxes), 3))
+
+        for s_i, s in enumerate(boxes):
+            for r_i, r in enumerate(boxes):
+                expected = simple_spatial_intersection_over_union(_signal(r), _signal(s))
+                self.assertEqual(bounding_box_intersection_over_union(r, s), expected)
+                if r_i < 3:
+                    self.assertEqual(iou[s_i, r_i], expected)
+
 class TestMODE(TestMetrics):
     def setUp(self):
         super(TestMODE, self).setUp()
@@ -537,5 +705,86 @@ class TestSweeper(TestMetrics):
                                                       (0.8, { "p_miss": float(3) / 4, "rfa": float(1) / 10 }),
                                                       (1.0, { "p_miss": float(4) / 4, "rfa": float(1) / 10 }) ])
 
+    def test_build_sweeper_incremental(self):
+        sweeper = build_sweeper(self.conf_lkup, [ build_pmiss_metric(), build_rfa_metric(10) ], 0)
+
+        self.assertCountEqual(sweeper(self.recs_1), [ (0.5, { "p_miss": float(2) / 4, "rfa": float(2) / 10 }),
+                                                      (0.7, { "p_miss": float(2) / 4, "rfa": float(1) / 10 }),
+                                                      (0.8, { "p_miss": float(3) / 4, "rfa": float(1) / 10 }),
+                                                      (1.0, { "p_miss": float(4) / 4, "rfa": float(1) / 10 }) ])
+
+        # Incremental and per-threshold measures can be mixed
+        sweeper = build_sweeper(self.conf_lkup, [ build_pmiss_metric(), self.build_rfa(10) ], 0)
+        self.assertEqual(sweeper(self.recs_1)[0], (1.0, { "p_miss": float(4) / 4, "rfa": float(1) / 10 }))
+
+    def test_build_det_sweep(self):
+        c, m, f = partition_alignment(self.recs_1)
+        sweep = build_det_sweep(c, m, f, self.conf_lkup, [ 1.0, 0.8, 0.7, 0.5 ])
+
+        self.assertEqual([ r.sys_presence_conf for r in sweep.c ], [ 0.8, 0.7 ])
+        self.assertEqual([ r.sys_presence_conf for r in sweep.f ], [ 1.0, 0.5 ])
+        self.assertEqual(sweep.num_c.tolist(), [ 0, 1, 2, 2 ])
+        self.assertEqual(sweep.num_m.tolist(), [ 4, 3, 2, 2 ])
+        self.assertEqual(sweep.num_f.tolist(), [ 1, 1, 1, 2 ])
+
+    def test_build_sweeper_incremental_tfa(self):
+        class FAR(AR):
+            def __init__(self, conf, alignment, ref, sys):
+                super(FAR, self).__init__(conf, alignment)
+                self.video_file = "f1"
+                self.ref = None if ref is None else A({ "f1": S(ref) })
+                self.sys = None if sys is None else A({ "f1": S(sys) })
+
+        recs = [ FAR(0.9, "FA", None, { 20: 1, 30: 0 }),
+                 FAR(0.8, "CD", { 0: 1, 10: 0 }, { 5: 1, 25: 0 }),
+                 FAR(None, "MD", { 40: 1, 50: 0 }, None),
+                 FAR(0.5, "FA", None, { 2: 1, 8: 0 }) ]
+
+        def _plain(fa_func):
+            return lambda ref_sig, sys_sig, sys_sig_add: fa_func(ref_sig, sys_sig, sys_sig_add)
+
+        for new, old in [ (build_fa_meas_measure, fa_meas), (build_fa_meas_v2_measure, fa_meas_v2) ]:
+            observed = build_sweeper(self.conf_lkup, [ new() ], 0, { "f1": 100 }, signal_snapshots = True)(recs)
+            expected = build_sweeper(self.conf_lkup, [ _plain(old) ], 0, { "f1": 100 }, signal_snapshots = True)(recs)
+
+            self.assertEqual([ (c, d["tfa"], d["tfa_numer"], d["tfa_denom"]) for c, d in observed ],
+                             [ (c, d["tfa"], d["tfa_numer"], d["tfa_denom"]) for c, d in expected ])
+            self.assertEqual([ d["System_Sig"] for c, d in observed ],
+                             [ d["System_Sig"] for c, d in expected ])
+
+            # Signal snapshots are only kept on request
+            for fa_func in [ new(), _plain(old) ]:
+                for point in build_sweeper(self.conf_lkup, [ fa_func ], 0, { "f1": 100 })(recs):
+                    self.assertIsInstance(point, DETPoint)
+                    self.assertEqual(set(point.measures), { "tfa", "tfa_denom", "tfa_numer" })
+
+        # Only fa_meas_v2 counts system coverage in excess of the reference
+        self.assertEqual([ d["tfa_numer"] for c, d in build_sweeper(self.conf_lkup, [ build_fa_meas_measure() ], 0, { "f1": 100 })(recs) ], [ 10, 25, 25 ])
+        self.assertEqual([ d["tfa_numer"] for c, d in build_sweeper(self.conf_lkup, [ build_fa_meas_v2_measure() ], 0, { "f1": 100 })(recs) ], [ 10, 25, 28 ])
+
+    def test_build_sweeper_incremental_tfa_files(self):
+        class FAR(AR):
+            def __init__(self, conf, alignment, ref, sys, video_file):
+                super(FAR, self).__init__(conf, alignment)
+                self.video_file = video_file
+                self.ref = None if ref is None else A({ video_file: S(ref) })
+                self.sys = None if sys is None else A({ video_file: S(sys) })
+
+        # Instances of several files admitted in interleaved order
+        recs = [ FAR(0.9, "FA", None, { 20: 1, 30: 0 }, "f1"),
+                 FAR(0.85, "FA", None, { 0: 1, 12: 0 }, "f2"),
+                 FAR(0.8, "CD", { 0: 1, 10: 0 }, { 5: 1, 25: 0 }, "f1"),
+                 FAR(0.7, "CD", { 10: 1, 40: 0 }, { 8: 1, 45: 0 }, "f2"),
+                 FAR(None, "MD", { 40: 1, 50: 0 }, None, "f1"),
+                 FAR(0.6, "FA", None, { 30: 1, 60: 0 }, "f3"),
+                 FAR(0.5, "FA", None, { 2: 1, 8: 0 }, "f1"),
+                 FAR(0.4, "FA", None, { 35: 1, 50: 0 }, "f2") ]
+        durations = { "f1": 100, "f2": 80, "f3": 70 }
+
+        observed = build_sweeper(self.conf_lkup, [ build_fa_meas_v2_measure() ], 0, durations)(recs)
+        expected = build_sweeper(self.conf_lkup, [ lambda ref_sig, sys_sig, sys_sig_add: fa_meas_v2(ref_sig, sys_sig, sys_sig_add) ], 0, durations)(recs)
+        self.assertEqual([ (p.conf, p.measures["tfa_numer"], p.measures["tfa"]) for p in observed ],
+                         [ (p.conf, p.measures["tfa_numer"], p.measures["tfa"]) for p in expected ])
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+
+lib_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../lib")
+sys.path.append(lib_path)
+protocols_path = os.path.join(lib_path, "protocols")
+sys.path.append(protocols_path)
+sys.path.append(os.path.join(lib_path, ".."))
+
+import io
+import json
+import unittest
+from unittest import mock
+from contextlib import redirect_stdout
+from schema_validation import *
+
+def load_schema(fn):
+    with open(os.path.join(protocols_path, fn), "r") as f:
+        return compile_schema(json.load(f))
+
+class TestSchemaValidation(unittest.TestCase):
+    def setUp(self):
+        self.schemas = [ load_schema(fn) for fn in [ "actev18_ad_schema.json", "actev18_aod_schema.json", "actev_sdl_v2_schema.json", "srl_aod_v1.json" ] ]
+        self.valid = { "activity": "Closing", "activityID": 1, "presenceConf": 0.5, "objects": [],
+                       "localization": { "VIRAT_S_000000.mp4": { "10": 1, "20": 0 } } }
+        self.invalid = [ [ 1 ],
+                         { k: v for k, v in self.valid.items() if k != "activityID" },
+                         dict(self.valid, activity = 1),
+                         dict(self.valid, presenceConf = "0.5"),
+                         dict(self.valid, activityID = True),
+                         dict(self.valid, localization = None),
+                         dict(self.valid, localization = {}),
+                         dict(self.valid, localization = { "a.mp4": { "10": 1, "20": 0 }, "b.mp4": { "10": 1, "20": 0 } }),
+                         dict(self.valid, localization = { "a b.mp4": { "10": 1, "20": 0 } }),
+                         dict(self.valid, localization = { "a.mp4": { "10": 1 } }),
+                         dict(self.valid, localization = { "a.mp4": { "x": 1, "20": 0 } }),
+                         dict(self.valid, localization = { "a.mp4": { "10": 2, "20": 0 } }),
+                         dict(self.valid, localization = { "a.mp4": { "10": "1", "20": 0 } }) ]
+
+    def test_precheck_rejects(self):
+        for schema in self.schemas:
+            self.assertIsNone(schema.precheck(self.valid))
+            for inst in self.invalid:
+                self.assertIsNotNone(schema.precheck(inst), inst)
+                self.assertIsNotNone(validation_error(schema.item, inst), inst)
+
+    def test_precheck_agrees(self):
+        # Whatever full validation accepts passes the pre-check
+        data_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+        for fn in sorted(os.listdir(data_path)):
+            if not fn.endswith("sysout.json"):
+                continue
+            with open(os.path.join(data_path, fn), "r") as f:
+                activities = json.load(f).get("activities", [])
+            for schema in self.schemas:
+                for inst in activities:
+                    if validation_error(schema.item, inst) is None:
+                        self.assertIsNone(schema.precheck(inst), (fn, inst))
+
+    def test_negative_frames(self):
+        sdl, ad = self.schemas[2], self.schemas[0]
+        inst = dict(self.valid, localization = { "a.mp4": { "-10": 1, "20": 0 } })
+        self.assertIsNone(sdl.precheck(inst))
+        self.assertIsNotNone(ad.precheck(inst))
+
+    def test_document(self):
+        schema = self.schemas[0]
+        self.assertIsNone(validation_error(schema.document, { "filesProcessed": [], "activities": [ 1 ] }))
+        self.assertIsNotNone(validation_error(schema.document, { "filesProcessed": [ 1 ], "activities": [] }))
+        self.assertIsNotNone(validation_error(schema.document, { "filesProcessed": [], "activities": {} }))
+
+    def test_activity_range(self):
+        schema = self.schemas[0]
+        activities = [ self.valid, self.valid, self.invalid[1], self.valid, self.invalid[2] ]
+        self.assertIsNone(validate_activity_range(schema.item, activities, 0, 2))
+        self.assertEqual(validate_activity_range(schema.item, activities, 1, 5)[0], 2)
+        self.assertEqual(validate_activity_range(schema.item, activities, 3, 5)[0], 4)
+
+    def test_activity_range_precheck(self):
+        # A non-integral activityID passes the pre-check, but not full
+        # validation, and is reported before any later instance the
+        # pre-check rejects
+        schema = self.schemas[0]
+        activities = [ self.valid, dict(self.valid, activityID = 1.5), self.valid, self.invalid[1] ]
+        self.assertIsNone(schema.precheck(activities[1]))
+        self.assertEqual(validate_activity_range(schema.item, activities, 0, 4, schema.precheck)[0], 1)
+        self.assertEqual(validate_activity_range(schema.item, activities, 2, 4, schema.precheck), (3, schema.precheck(activities[3])))
+        self.assertIsNone(validate_activity_range(schema.item, activities, 2, 3, schema.precheck))
+
+    def test_unknown_schema(self):
+        self.assertIsNone(build_precheck({ "properties": { "activities": { "type": "array" } } }))
+
+class TestValidateInput(unittest.TestCase):
+    def setUp(self):
+        self.schema = load_schema("actev18_ad_schema.json")
+        self.valid = { "activity": "Closing", "activityID": 1, "presenceConf": 0.5,
+                       "localization": { "VIRAT_S_000000.mp4": { "10": 1, "20": 0 } } }
+
+    def validate(self, activities, protocol = None):
+        import ActEV_Scorer
+
+        out = io.StringIO()
+        with mock.patch("ActEV_Scorer.VALIDATION_CHUNK_SIZE", 8), redirect_stdout(out):
+            try:
+                ActEV_Scorer.validate_input(lambda *args: None, { "filesProcessed": [], "activities": activities }, self.schema, protocol)
+            except SystemExit as e:
+                return (e.code, out.getvalue())
+
+        return (0, out.getvalue())
+
+    def protocol(self):
+        from actev18_ad import ActEV18_AD
+        from helpers import start_worker_pool
+
+        protocol = ActEV18_AD({}, {}, {}, "")
+        protocol.pn = 2
+        # As score_basic does for large system outputs, whose pool is
+        # forked before the activities are loaded
+        protocol.set_pool(start_worker_pool(2))
+        return protocol
+
+    def test_pooled_chunks(self):
+        # Invalid instances in the 2nd and 4th of 5 chunks, which the
+        # pool validates concurrently; the first one is reported
+        activities = [ self.valid ] * 40
+        activities[27], activities[13] = dict(self.valid, activity = 1), dict(self.valid, presenceConf = "0.5")
+
+        protocol = self.protocol()
+        status, out = self.validate(activities, protocol)
+        self.assertEqual([ stats[:2] for stats in protocol.parallel_stats ], [ ("validation", 5) ])
+        self.assertNotEqual(status, 0)
+        self.assertIn("failed on activity instance 13.", out)
+        self.assertEqual((status, out), self.validate(activities))
+
+        self.assertEqual(self.validate([ self.valid ] * 40, self.protocol()), (0, ""))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+
+lib_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../lib")
+sys.path.append(lib_path)
+
+import random
+import unittest
+from scored_regions import *
+from sparse_signal import SparseSignal as S
+
+def contains_by_join(selected, frames):
+    return (S(selected) | S(frames)) == S(selected)
+
+class TestScoredRegions(unittest.TestCase):
+    def setUp(self):
+        self.selected = { "10": 1, "100": 0, "200": 1, "300": 0, "400": 1 }
+        self.frames = [ { "10": 1, "100": 0 },
+                        { "20": 1, "50": 0 },
+                        { "5": 1, "50": 0 },
+                        { "50": 1, "250": 0 },
+                        { "100": 1, "200": 0 },
+                        { "250": 1, "300": 0 },
+                        { "290": 1, "301": 0 },
+                        { "500": 1, "100000": 0 },
+                        { "500": 1 },
+                        { "20": 1, "30": 0, "250": 1, "260": 0 },
+                        { "20": 1, "30": 0, "150": 1, "160": 0 },
+                        { "50": 0, "20": 1 },
+                        { "20": 0, "30": 0 },
+                        { "20": 2, "30": 0 },
+                        { "020": 1, "30": 0 },
+                        { "-5": 1, "30": 0 } ]
+
+    def test_matches_join(self):
+        for selected in [ self.selected,
+                          { "0": 1, "1000": 0 },
+                          { "10": 1, "100": 0, "150": 0 },
+                          { "10": 1, "50": 1, "100": 0 },
+                          { "10": 2, "100": 0 },
+                          { "10": 1, "100": 0, "100000": 1, "100001": 0 },
+                          {} ]:
+            regions = ScoredRegions(selected)
+            expected = [ contains_by_join(selected, f) for f in self.frames ]
+            self.assertEqual(regions.contains_all(self.frames), expected, selected)
+            self.assertEqual([ regions.contains(f) for f in self.frames ], expected)
+
+    def test_random(self):
+        rng = random.Random(0)
+        for _ in range(200):
+            bounds = sorted(rng.sample(range(0, 500), 2 * rng.randint(0, 4) + rng.randint(0, 1)))
+            selected = { str(b): 1 - i % 2 for i, b in enumerate(bounds) }
+            frames_list = []
+            for _ in range(20):
+                s = rng.randint(0, 490)
+                frames_list.append({ str(s): 1, str(s + rng.randint(1, 60)): 0 })
+            self.assertEqual(ScoredRegions(selected).contains_all(frames_list),
+                             [ contains_by_join(selected, f) for f in frames_list ])
+
+    def test_index(self):
+        file_index = { "a.mp4": { "selected": self.selected } }
+        index = ScoredRegionIndex(file_index)
+        self.assertEqual(index.regions, {})
+        self.assertIs(index["a.mp4"], index["a.mp4"])
+        self.assertRaises(KeyError, lambda: index["b.mp4"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -131,6 +131,12 @@ class TestSparseSignal(unittest.TestCase):
         # Output signal should be normalized
         self.assertEqual(self.sc1.generate_collar(5), S({0: 1, 15: 0}))
 
+        # Touching and overlapping collars are merged
+        self.assertEqual(S({0: 1, 4: 0, 10: 1, 11: 0}).generate_collar(2), S({-2: 1, 6: 0, 8: 1, 13: 0}))
+
+        self.assertEqual(self.sc1.generate_collar(0), S())
+        self.assertEqual(self.se.generate_collar(2), S())
+
     def test2D(self):
         self.assertEqual(self.s2d_1.area(), 250)
         self.assertEqual(self.s2d_2.area(), 250)
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+
+import subprocess
+import unittest
+
+test_path = os.path.dirname(os.path.abspath(__file__))
+scorer_path = os.path.join(test_path, "../ActEV_Scorer.py")
+
+# Modules only needed to plot or edit activities, which validation
+# only runs must not import
+HEAVY_MODULES = [ "matplotlib", "scipy.stats", "pandas" ]
+
+# Modules only imported once needed, which importing the scorer must
+# not import
+LAZY_MODULES = [ "matplotlib", "scipy", "jsonschema" ]
+
+# Budget of validation only runs for importing modules, as a share of
+# the time importing HEAVY_MODULES alone takes on the same machine;
+# measured at about 0.15
+IMPORT_TIME_BUDGET = 0.5
+
+# Lines of -X importtime are "import time: self | cumulative | name",
+# with the name indented by its nesting depth.  Returns the names of
+# the imported modules and the total time, in microseconds, of the
+# top level imports
+def parse_import_times(stderr):
+    names, total_us = [], 0
+    for line in stderr.splitlines():
+        if line.startswith("import time:") and not line.endswith("imported package"):
+            _, cumulative, name = line.split("|")
+            if cumulative.strip().isdigit():
+                names.append(name.strip())
+                if not name.startswith("  "):
+                    total_us += int(cumulative)
+
+    return (names, total_us)
+
+def import_times(args):
+    out = subprocess.run([ sys.executable, "-X", "importtime" ] + args, stdout = subprocess.DEVNULL, stderr = subprocess.PIPE, universal_newlines = True, check = True)
+    return parse_import_times(out.stderr)
+
+class TestStartup(unittest.TestCase):
+    def test_scorer_imports(self):
+        # In a fresh interpreter, as the test runner may have imported
+        # any of them
+        code = "import sys; sys.path.insert(0, {!r}); import ActEV_Scorer; print(' '.join(sys.modules))".format(os.path.dirname(scorer_path))
+        out = subprocess.run([ sys.executable, "-c", code ], stdout = subprocess.PIPE, universal_newlines = True, check = True)
+
+        modules = out.stdout.split()
+        for module in LAZY_MODULES:
+            self.assertNotIn(module, modules)
+
+    def test_validation_only_imports(self):
+        names, total_us = import_times([ scorer_path, "ActEV18_AD",
+                                         "-s", os.path.join(test_path, "data/VIRAT_S_000000_fake-sysout.json"),
+                                         "-a", os.path.join(test_path, "data/VIRAT_S_000000_activity-index.json"),
+                                         "-f", os.path.join(test_path, "data/VIRAT_S_000000_file-index.json"),
+                                         "-V" ])
+
+        for module in HEAVY_MODULES:
+            self.assertFalse(module in names, "{} is imported".format(module))
+
+        _, heavy_us = import_times([ "-c", "import " + ", ".join(HEAVY_MODULES) ])
+        self.assertLess(total_us, IMPORT_TIME_BUDGET * heavy_us)
+
+if __name__ == '__main__':
+    unittest.main()